@@ -8,6 +8,8 @@ class TaxiApp {
         this.currentOrder = null;
         this.user = null;
         this.orders = [];
+        this.eventSource = null;
+        this.realtimeQuery = '';
         this.init();
     }
 
@@ -251,26 +253,108 @@ class TaxiApp {
     // ================================
 
     startPeriodicUpdates() {
-        // Update every 5 seconds
+        // Location every 5 seconds; order updates are pushed (see connectRealtime)
         setInterval(() => {
             this.updateLocation();
-            this.checkOrderUpdates();
         }, 5000);
+        this.connectRealtime();
     }
 
     updateLocation() {
         if (this.isOnline && navigator.geolocation) {
             navigator.geolocation.getCurrentPosition(position => {
                 const { latitude, longitude } = position.coords;
-                this.user.location = { latitude, longitude };
-                this.saveUser(this.user);
+                this.setLocation(latitude, longitude);
             });
         }
     }
 
-    checkOrderUpdates() {
-        // Simulate checking for new orders
-        // In production, this would be an API call
+    setLocation(latitude, longitude) {
+        if (!this.user) {
+            return;
+        }
+        this.user.location = { latitude, longitude };
+        this.saveUser(this.user);
+        // Moving into another grid cell changes which offers we should hear about
+        if (this.realtimeTopics().join('&') !== this.realtimeQuery) {
+            this.connectRealtime();
+        }
+    }
+
+    // ================================
+    // REAL-TIME UPDATES (SSE)
+    // ================================
+
+    realtimeTopics() {
+        const topics = [];
+        if (this.currentOrder && this.currentOrder.id) {
+            topics.push(`order:${this.currentOrder.id}`);
+        }
+        if (this.isOnline && this.user && this.user.location) {
+            // Same 0.01 degree grid as geo.cell_of, plus the 8 neighbouring cells
+            const cy = Math.floor(this.user.location.latitude / 0.01);
+            const cx = Math.floor(this.user.location.longitude / 0.01);
+            for (let y = cy - 1; y <= cy + 1; y++) {
+                for (let x = cx - 1; x <= cx + 1; x++) {
+                    topics.push(`cell:${y}:${x}`);
+                }
+            }
+        }
+        return topics;
+    }
+
+    connectRealtime() {
+        const baseUrl = window.TAXI_REALTIME_URL || localStorage.getItem('realtimeUrl');
+        const topics = this.realtimeTopics();
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        this.realtimeQuery = topics.join('&');
+        if (!baseUrl || !window.EventSource || topics.length === 0) {
+            return;
+        }
+
+        const query = topics.map(topic => 'topic=' + encodeURIComponent(topic)).join('&');
+        // EventSource reconnects by itself, e.g. after being dropped as a slow consumer
+        this.eventSource = new EventSource(`${baseUrl.replace(/\/$/, '')}/events?${query}`);
+        this.eventSource.addEventListener('order_status', event => {
+            this.checkOrderUpdates(JSON.parse(event.data));
+        });
+        this.eventSource.addEventListener('driver_position', event => {
+            document.dispatchEvent(new CustomEvent('taxi:driver-position', { detail: JSON.parse(event.data) }));
+        });
+        this.eventSource.addEventListener('order_offer', event => {
+            document.dispatchEvent(new CustomEvent('taxi:order-offer', { detail: JSON.parse(event.data) }));
+        });
+        this.eventSource.addEventListener('order_offer_closed', event => {
+            document.dispatchEvent(new CustomEvent('taxi:order-offer-closed', { detail: JSON.parse(event.data) }));
+        });
+    }
+
+    setCurrentOrder(order) {
+        this.currentOrder = order;
+        this.connectRealtime();
+    }
+
+    setOnline(status) {
+        this.isOnline = status;
+        // Online drivers hear about offers around them; offline ones only about their order
+        this.connectRealtime();
+    }
+
+    checkOrderUpdates(update) {
+        if (!update || !this.currentOrder || update.order_id !== this.currentOrder.id) {
+            return;
+        }
+        // Versions only grow; ignore anything older than what we already have
+        if (this.currentOrder.version && update.version && update.version <= this.currentOrder.version) {
+            return;
+        }
+        this.currentOrder.status = update.status;
+        this.currentOrder.version = update.version;
+        this.currentOrder.driverId = update.driver_id;
+        document.dispatchEvent(new CustomEvent('taxi:order-status', { detail: update }));
     }
 
     // ================================
@@ -0,0 +1,286 @@
+# =====================================================
+# 🧭 BATCH DRIVER-TO-ORDER ASSIGNMENT
+# Matches all pending orders against all free drivers at once
+# =====================================================
+
+import logging
+import math
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from geo import KM_PER_DEG_LAT, haversine_matrix, haversine_pairs
+
+logger = logging.getLogger(__name__)
+
+class Assignment(NamedTuple):
+    order_id: str
+    driver_id: str
+    distance_km: float
+    eta_min: float
+
+# =====================================================
+# 🧮 SOLVERS
+# =====================================================
+
+def hungarian_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact min-cost assignment (Hungarian method, shortest augmenting paths)
+
+    Returns (rows, cols) like scipy's linear_sum_assignment; every row of
+    the smaller side is matched. The inner loop over columns is vectorized,
+    so the cost is O(n) numpy passes of length m per augmented row.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    # Column 0 is a virtual start column; p[j] is the 1-based row matched to column j
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free[1:], minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+def optimal_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Hungarian assignment via scipy when available, the numpy version otherwise"""
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        return hungarian_assignment(cost)
+    return linear_sum_assignment(cost)
+
+# =====================================================
+# 🚦 ASSIGNMENT ENGINE
+# =====================================================
+
+class AssignmentEngine:
+    """Vectorized batch matcher between orders and drivers
+
+    Small batches (orders x drivers <= dense_limit) are solved exactly on
+    the full haversine cost matrix. Larger batches keep only the
+    `candidates` nearest drivers per order, computed block-wise on a local
+    flat projection, and match them greedily by true pickup distance;
+    orders whose candidates were all taken get another round against the
+    drivers that are still free.
+    """
+
+    def __init__(self, max_pickup_km: float = 5.0, average_speed_kmh: float = 25.0,
+                 road_factor: float = 1.3, candidates: int = 16,
+                 dense_limit: int = 1_000_000, block_size: int = 512, max_rounds: int = 3):
+        self.max_pickup_km = max_pickup_km
+        self.average_speed_kmh = average_speed_kmh
+        self.road_factor = road_factor
+        self.candidates = candidates
+        self.dense_limit = dense_limit
+        self.block_size = block_size
+        self.max_rounds = max_rounds
+
+    @classmethod
+    def from_config(cls, **overrides) -> "AssignmentEngine":
+        """Engine using the dispatching settings from Config"""
+        from taxi import Config
+        settings = {
+            "max_pickup_km": Config.AUTO_ASSIGN_RADIUS_KM,
+            "average_speed_kmh": Config.AVERAGE_SPEED_KMH,
+            "road_factor": Config.ROAD_FACTOR,
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def eta_minutes(self, distance_km):
+        """Pickup ETA for straight-line distances"""
+        return distance_km * self.road_factor / self.average_speed_kmh * 60.0
+
+    def match(self, order_lat, order_lng, driver_lat, driver_lng) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Match by index; returns (order_idx, driver_idx, distance_km) arrays"""
+        order_lat = np.asarray(order_lat, dtype=np.float64)
+        order_lng = np.asarray(order_lng, dtype=np.float64)
+        driver_lat = np.asarray(driver_lat, dtype=np.float64)
+        driver_lng = np.asarray(driver_lng, dtype=np.float64)
+        n, m = order_lat.size, driver_lat.size
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0))
+        if n == 0 or m == 0:
+            return empty
+
+        if n * m <= self.dense_limit:
+            return self._match_dense(order_lat, order_lng, driver_lat, driver_lng)
+        return self._match_greedy(order_lat, order_lng, driver_lat, driver_lng)
+
+    def assign(self, orders: Sequence[Tuple[str, float, float]],
+               drivers: Sequence[Tuple[str, float, float]]) -> List[Assignment]:
+        """Match (order_id, lat, lng) rows against (driver_id, lat, lng) rows"""
+        if not orders or not drivers:
+            return []
+        o = np.asarray([(row[1], row[2]) for row in orders], dtype=np.float64)
+        d = np.asarray([(row[1], row[2]) for row in drivers], dtype=np.float64)
+        oi, di, dist = self.match(o[:, 0], o[:, 1], d[:, 0], d[:, 1])
+        eta = self.eta_minutes(dist)
+        return [
+            Assignment(orders[i][0], drivers[j][0], float(km), float(minutes))
+            for i, j, km, minutes in zip(oi.tolist(), di.tolist(), dist.tolist(), eta.tolist())
+        ]
+
+    def _match_dense(self, olat, olng, dlat, dlng):
+        dist = haversine_matrix(olat, olng, dlat, dlng)
+        feasible = dist <= self.max_pickup_km
+        # Infeasible pairs get a cost no feasible matching can beat, then are dropped
+        penalty = self.max_pickup_km * (min(dist.shape) + 1) + 1.0
+        rows, cols = optimal_assignment(np.where(feasible, dist, penalty))
+        keep = feasible[rows, cols]
+        return rows[keep], cols[keep], dist[rows[keep], cols[keep]]
+
+    def _match_greedy(self, olat, olng, dlat, dlng):
+        n, m = olat.size, dlat.size
+        order_free = np.ones(n, dtype=bool)
+        driver_free = np.ones(m, dtype=bool)
+        out_o, out_d, out_km = [], [], []
+
+        for _ in range(self.max_rounds):
+            orders_left = np.flatnonzero(order_free)
+            drivers_left = np.flatnonzero(driver_free)
+            if orders_left.size == 0 or drivers_left.size == 0:
+                break
+            cand_o, cand_d = self._candidate_edges(olat[orders_left], olng[orders_left],
+                                                   dlat[drivers_left], dlng[drivers_left])
+            cand_o = orders_left[cand_o]
+            cand_d = drivers_left[cand_d]
+            km = haversine_pairs(olat[cand_o], olng[cand_o], dlat[cand_d], dlng[cand_d])
+            within = km <= self.max_pickup_km
+            cand_o, cand_d, km = cand_o[within], cand_d[within], km[within]
+            if km.size == 0:
+                break
+
+            matched = 0
+            for idx in np.argsort(km, kind="stable").tolist():
+                i = cand_o[idx]
+                j = cand_d[idx]
+                if order_free[i] and driver_free[j]:
+                    order_free[i] = False
+                    driver_free[j] = False
+                    out_o.append(i)
+                    out_d.append(j)
+                    out_km.append(km[idx])
+                    matched += 1
+            if matched == 0:
+                break
+
+        return (np.asarray(out_o, dtype=np.intp), np.asarray(out_d, dtype=np.intp),
+                np.asarray(out_km, dtype=np.float64))
+
+    def _candidate_edges(self, olat, olng, dlat, dlng) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest drivers per order on a flat projection around the batch centre"""
+        ref_lat = float(np.mean(olat))
+        ref_lng = float(np.mean(olng))
+        lng_scale = math.cos(math.radians(ref_lat))
+        # Offsets in km relative to the batch centre keep float32 precise
+        oy = ((olat - ref_lat) * KM_PER_DEG_LAT).astype(np.float32)
+        ox = ((olng - ref_lng) * KM_PER_DEG_LAT * lng_scale).astype(np.float32)
+        dy = ((dlat - ref_lat) * KM_PER_DEG_LAT).astype(np.float32)
+        dx = ((dlng - ref_lng) * KM_PER_DEG_LAT * lng_scale).astype(np.float32)
+
+        k = min(self.candidates, dlat.size)
+        rows, cols = [], []
+        for start in range(0, olat.size, self.block_size):
+            stop = min(start + self.block_size, olat.size)
+            ddy = oy[start:stop, None] - dy[None, :]
+            ddx = ox[start:stop, None] - dx[None, :]
+            d2 = ddy * ddy
+            d2 += ddx * ddx
+            if k < dlat.size:
+                nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.tile(np.arange(k), (stop - start, 1))
+            rows.append(np.repeat(np.arange(start, stop), k))
+            cols.append(nearest.reshape(-1))
+        return np.concatenate(rows), np.concatenate(cols)
+
+# =====================================================
+# 💾 DATABASE INTEGRATION
+# =====================================================
+
+def assign_pending_orders(db=None, engine: Optional[AssignmentEngine] = None) -> List[Assignment]:
+    """Match every PENDING order with pickup coordinates to a free driver in one transaction"""
+    from sqlalchemy import and_, exists
+    from order_lifecycle import assign_many, publish_transition
+    from taxi import DriverPosition, Order, OrderStatus, SessionLocal
+
+    engine = engine or AssignmentEngine.from_config()
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        orders = (
+            db.query(Order.id, Order.pickup_lat, Order.pickup_lng)
+            .filter(Order.status == OrderStatus.PENDING,
+                    Order.pickup_lat.isnot(None), Order.pickup_lng.isnot(None))
+            .all()
+        )
+        if not orders:
+            return []
+
+        busy = exists().where(and_(
+            Order.driver_id == DriverPosition.driver_id,
+            Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.ACCEPTED, OrderStatus.STARTED]),
+        ))
+        drivers = (
+            db.query(DriverPosition.driver_id, DriverPosition.latitude, DriverPosition.longitude)
+            .filter(DriverPosition.is_available.is_(True), ~busy)
+            .all()
+        )
+        assignments = engine.assign(orders, drivers)
+        if not assignments:
+            return []
+
+        # Exactly the drivers whose order update landed become unavailable
+        results = assign_many(db, [(a.order_id, a.driver_id) for a in assignments])
+        landed = [result for result in results if result.applied]
+        db.commit()
+        for result in landed:
+            publish_transition(result)
+        if len(landed) < len(assignments):
+            logger.info(f"🧭 {len(assignments) - len(landed)} orders were no longer PENDING and stay unassigned")
+        assignments = [a for a, result in zip(assignments, results) if result.applied]
+        logger.info(f"🧭 Assigned {len(assignments)}/{len(orders)} pending orders")
+        return assignments
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
@@ -0,0 +1,58 @@
+# =====================================================
+# 🧭 BENCHMARK: BATCH ORDER ASSIGNMENT
+# Run: python -m benchmarks.bench_assignment
+# =====================================================
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from assignment import AssignmentEngine
+from benchmarks.common import CITY_LAT, CITY_LNG
+
+def main():
+    parser = argparse.ArgumentParser(description="Rush-hour batch assignment against a time budget")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--drivers", type=int, default=20000)
+    parser.add_argument("--budget", type=float, default=5.0, help="seconds allowed for one batch")
+    parser.add_argument("--spread", type=float, default=0.2, help="city half-width in degrees")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    olat = CITY_LAT + rng.uniform(-args.spread, args.spread, args.orders)
+    olng = CITY_LNG + rng.uniform(-args.spread, args.spread, args.orders)
+    dlat = CITY_LAT + rng.uniform(-args.spread, args.spread, args.drivers)
+    dlng = CITY_LNG + rng.uniform(-args.spread, args.spread, args.drivers)
+
+    engine = AssignmentEngine()
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        oi, di, km = engine.match(olat, olng, dlat, dlng)
+        timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    print(f"orders={args.orders} drivers={args.drivers} matched={len(oi)} "
+          f"mean_pickup={km.mean() if len(km) else 0:.2f}km mean_eta={engine.eta_minutes(km).mean() if len(km) else 0:.1f}min")
+    print(f"batch time: best {best:.3f}s  worst {max(timings):.3f}s  budget {args.budget:.1f}s")
+
+    # Quality check against the exact solver on a slice small enough for it
+    sub_o, sub_d = min(args.orders, 300), min(args.drivers, 600)
+    exact = AssignmentEngine()
+    greedy = AssignmentEngine(dense_limit=0)
+    _, _, km_exact = exact.match(olat[:sub_o], olng[:sub_o], dlat[:sub_d], dlng[:sub_d])
+    _, _, km_greedy = greedy.match(olat[:sub_o], olng[:sub_o], dlat[:sub_d], dlng[:sub_d])
+    print(f"quality on {sub_o}x{sub_d}: exact matched={len(km_exact)} total={km_exact.sum():.1f}km, "
+          f"greedy matched={len(km_greedy)} total={km_greedy.sum():.1f}km")
+
+    if max(timings) > args.budget:
+        print("❌ over budget")
+        sys.exit(1)
+    print("✅ within budget")
+
+if __name__ == "__main__":
+    main()
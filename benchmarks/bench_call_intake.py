@@ -0,0 +1,172 @@
+# =====================================================
+# 📞 BENCHMARK: DISPATCHER CALL INTAKE UNDER BURSTS
+# Simulated call bursts (repeat callers, vip / corporate customers)
+# turned into orders one transaction per call in arrival order vs the
+# CallIntake priority queue writing batches
+# Run: python -m benchmarks.bench_call_intake [--bursts 3 --burst-calls 1000]
+# =====================================================
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import summarize
+
+CLASSES = ("standard", "corporate", "vip")
+
+def _schedule(args, dispatchers: list) -> list:
+    """(offset seconds, call kwargs) of every call, bursts of burst_calls spread over burst_seconds"""
+    rng = random.Random(args.seed)
+    calls, callers = [], []
+    for burst in range(args.bursts):
+        start = burst * (args.burst_seconds + args.gap_seconds)
+        for _ in range(args.burst_calls):
+            if callers and rng.random() < args.repeat_rate:
+                phone, klass = rng.choice(callers[-200:])
+            else:
+                phone = f"+99891{rng.randrange(10**7):07d}"
+                klass = rng.choices(CLASSES, weights=(1 - args.vip - args.corporate, args.corporate, args.vip))[0]
+                callers.append((phone, klass))
+            calls.append((start + rng.uniform(0, args.burst_seconds), dict(
+                customer_phone=phone, dispatcher_id=rng.choice(dispatchers),
+                customer_location=f"Street {rng.randrange(500)}", destination=f"Street {rng.randrange(500)}",
+                customer_class=klass, passenger_count=rng.randint(1, 4))))
+    return sorted(calls, key=lambda c: c[0])
+
+def _write_one(call) -> float:
+    """Baseline: look up / create the customer, the order and the call row in their own transaction"""
+    from taxi import DispatcherCall, Order, OrderStatus, SessionLocal, User, UserRole
+
+    db = SessionLocal()
+    try:
+        customer = db.query(User).filter(User.phone == call.customer_phone).first()
+        if customer is None:
+            customer = User(phone=call.customer_phone, name=call.customer_phone, role=UserRole.CUSTOMER)
+            db.add(customer)
+            db.flush()
+        order = Order(customer_id=customer.id, dispatcher_id=call.dispatcher_id,
+                      pickup_location=call.customer_location, destination_location=call.destination,
+                      passengers_count=call.passenger_count, status=OrderStatus.PENDING,
+                      customer_phone=call.customer_phone)
+        db.add(order)
+        db.flush()
+        db.add(DispatcherCall(dispatcher_id=call.dispatcher_id, order_id=order.id,
+                              customer_phone=call.customer_phone, customer_location=call.customer_location,
+                              passenger_count=call.passenger_count, call_status="ordered",
+                              received_at=call.received_at, completed_at=datetime.utcnow()))
+        db.commit()
+        return (datetime.utcnow() - call.received_at).total_seconds()
+    finally:
+        db.close()
+
+async def _replay(schedule: list, offer) -> float:
+    """Feed calls at their scheduled offsets; returns the start time"""
+    from call_intake import IncomingCall
+
+    started = time.perf_counter()
+    for offset, kwargs in schedule:
+        delay = offset - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await offer(IncomingCall(**kwargs))
+    return started
+
+async def _run_baseline(schedule: list) -> dict:
+    queue: asyncio.Queue = asyncio.Queue()
+    waits, depth = defaultdict(list), [0]
+
+    async def writer():
+        while True:
+            call = await queue.get()
+            waits[call.customer_class].append(await asyncio.to_thread(_write_one, call))
+            queue.task_done()
+
+    async def offer(call):
+        queue.put_nowait(call)
+        depth[0] = max(depth[0], queue.qsize())
+
+    task = asyncio.create_task(writer())
+    started = await _replay(schedule, offer)
+    await queue.join()
+    task.cancel()
+    return {"wall": time.perf_counter() - started, "waits": waits, "high_water": depth[0],
+            "orders": sum(len(w) for w in waits.values()), "transactions": len(schedule)}
+
+async def _run_intake(schedule: list, args) -> dict:
+    from call_intake import CallIntake
+
+    intake = CallIntake(batch_size=args.batch, linger=args.linger_ms / 1000, record_received=not args.no_record)
+    waits = defaultdict(list)
+    intake.add_listener(lambda results: [waits[r.customer_class].append(r.waited)
+                                         for r in results if not r.duplicate])
+    await intake.start()
+    started = await _replay(schedule, intake.put)
+    # Writes whatever the last burst left queued
+    await intake.stop()
+    stats = intake.stats()
+    return {"wall": time.perf_counter() - started, "waits": waits, "high_water": stats["high_water"],
+            "orders": stats["ordered"], "transactions": stats["batches"],
+            "folded": stats["duplicates"] + stats["linked"]}
+
+def _mode(mode: str, path: str, args, queue) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import taxi
+
+    taxi.init_system()
+    with taxi.get_db() as db:
+        dispatchers = [user.id for user in db.query(taxi.User).filter(taxi.User.role == taxi.UserRole.DISPATCHER)]
+    schedule = _schedule(args, dispatchers)
+    run = _run_baseline(schedule) if mode == "per-call" else _run_intake(schedule, args)
+    result = asyncio.run(run)
+    result["waits"] = dict(result["waits"])
+    queue.put((result, len(schedule)))
+
+def _report(label: str, result: dict, calls: int) -> None:
+    print(f"\n{label}: {calls:,} calls -> {result['orders']:,} orders in {result['transactions']:,} "
+          f"transactions, done {result['wall']:.2f}s after the first call, queue high water "
+          f"{result['high_water']:,}" + (f", repeat calls folded {result['folded']:,}" if "folded" in result else ""))
+    for klass in CLASSES:
+        s = summarize(result["waits"].get(klass, []))
+        print(f"  time to order {klass:<10} n={s['count']:>6,}  p50 {s['p50_us'] / 1e6:7.3f}s  "
+              f"p95 {s['p95_us'] / 1e6:7.3f}s  max {s['max_us'] / 1e6:7.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatcher call bursts: per-call transactions vs CallIntake")
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--burst-calls", type=int, default=1000)
+    parser.add_argument("--burst-seconds", type=float, default=1.0, help="seconds one burst is spread over")
+    parser.add_argument("--gap-seconds", type=float, default=2.0, help="quiet time between bursts")
+    parser.add_argument("--repeat-rate", type=float, default=0.15, help="share of calls from a recent caller")
+    parser.add_argument("--vip", type=float, default=0.05)
+    parser.add_argument("--corporate", type=float, default=0.10)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--linger-ms", type=float, default=50.0)
+    parser.add_argument("--no-record", action="store_true",
+                        help="skip the \"received\" rows put() stores (calls are then lost on a crash)")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taxi-calls-")
+    # One process per mode, each with its own database
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for mode in ("per-call", "intake"):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_mode, args=(mode, os.path.join(workdir, mode + ".db"), args, queue))
+        proc.start()
+        results[mode], calls = queue.get()
+        proc.join()
+        _report(mode, results[mode], calls)
+
+    base, intake = results["per-call"], results["intake"]
+    print(f"\nintake vs per-call: {base['transactions'] / max(intake['transactions'], 1):.0f}x fewer "
+          f"transactions, finished {base['wall'] / intake['wall']:.1f}x sooner")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# =====================================================
+# 🏁 BENCHMARK SUITE: END-TO-END BOT PATHS
+# The real handlers against the local Bot API stand-in, on SQLite and
+# PostgreSQL: onboarding (/start -> role -> create_or_update_user ->
+# show_role_menu), /profile, menu button storms and mixed journeys.
+# Results are written as JSON and checked against a baseline run.
+# Run: python -m benchmarks.bench_e2e [--backends sqlite,postgres --baseline e2e_baseline.json]
+# =====================================================
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic_updates import menu_taps, onboarding, profile_views, user_journeys
+
+# Run in this order: onboarding registers the users the later scenarios act as
+SCENARIOS = ("onboarding", "profile", "callbacks", "journeys")
+
+def _payloads(scenario: str, args) -> list:
+    if scenario == "onboarding":
+        return onboarding(args.users, args.seed)
+    if scenario == "profile":
+        return profile_views(args.users, args.updates, args.seed)
+    if scenario == "callbacks":
+        return menu_taps(args.users, args.updates, args.seed)
+    return user_journeys(args.users, args.updates, args.seed)
+
+async def _scenarios(args) -> dict:
+    from benchmarks import loadtest_bot
+
+    loadtest_args = argparse.Namespace(
+        users=args.users, updates=args.updates, seed=args.seed, workers=args.workers, queue=args.queue,
+        api_latency=args.api_latency, limits=False, mode="queue", rate=args.rate, connections=0,
+    )
+    results = {}
+    for scenario in args.scenarios:
+        report = await loadtest_bot.run(loadtest_args, _payloads(scenario, args))
+        results[scenario] = {
+            "updates": report["updates"],
+            "elapsed_s": report["elapsed_s"],
+            "updates_per_s": report["updates_per_s"],
+            "shed": report["processor"]["shed"],
+            "rejected": report["processor"]["rejected"],
+            "api_calls": report["api_calls"],
+            "latency": report["latency"],
+        }
+    return results
+
+def _backend(url: str, fresh: bool, args, queue) -> None:
+    """One backend in its own process: taxi reads DATABASE_URL on import"""
+    os.environ["DATABASE_URL"] = url
+    import logging
+    logging.disable(logging.INFO)
+    try:
+        import taxi
+        if fresh:
+            taxi.init_engines()
+            taxi.Base.metadata.drop_all(taxi.engine)
+        queue.put(asyncio.run(_scenarios(args)))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_backend(name: str, args) -> dict:
+    if name == "sqlite":
+        url, fresh = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='taxi-e2e-'), 'e2e.db')}", False
+    elif name == "postgres":
+        url, fresh = args.postgres_url, True
+    else:
+        raise ValueError(f"unknown backend {name!r} (sqlite, postgres)")
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_backend, args=(url, fresh, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+# =====================================================
+# 📊 BASELINE COMPARISON
+# =====================================================
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """(backend, scenario, metric, baseline, current, regressed) for every figure the baseline has
+
+    Throughput regresses when it drops by more than `tolerance`; a latency
+    percentile when it grows by more than `tolerance` and by at least
+    min_delta_ms (sub-millisecond jitter is not a regression). A backend
+    or scenario the baseline has results for but this run errored on or
+    lacks is a regression too (row with metric "error" / "missing" and
+    no figures), so a crashed run cannot pass.
+    """
+    rows = []
+    for backend, old_scenarios in baseline.get("results", {}).items():
+        if "error" in old_scenarios:
+            continue
+        scenarios = current["results"].get(backend)
+        if scenarios is None:
+            rows.append((backend, "*", "missing", None, None, True))
+            continue
+        if "error" in scenarios:
+            rows.append((backend, "*", f"error: {scenarios['error']}", None, None, True))
+            continue
+        for scenario, old in old_scenarios.items():
+            result = scenarios.get(scenario)
+            if result is None:
+                rows.append((backend, scenario, "missing", None, None, True))
+                continue
+            was, now = old["updates_per_s"], result["updates_per_s"]
+            rows.append((backend, scenario, "updates/s", was, now, now < was * (1 - tolerance)))
+            for kind, stats in result["latency"].items():
+                old_stats = old["latency"].get(kind)
+                if old_stats is None:
+                    continue
+                for pct in ("p50", "p95", "p99"):
+                    was, now = old_stats[f"{pct}_us"] / 1000, stats[f"{pct}_us"] / 1000
+                    regressed = now > was * (1 + tolerance) and now - was >= min_delta_ms
+                    rows.append((backend, scenario, f"{kind} {pct} ms", was, now, regressed))
+    return rows
+
+def _print_results(report: dict) -> None:
+    for backend, scenarios in report["results"].items():
+        if "error" in scenarios:
+            print(f"\n⚠️ {backend}: skipped ({scenarios['error']})")
+            continue
+        print(f"\n{backend}")
+        for scenario, result in scenarios.items():
+            print(f"  {scenario:<11} {result['updates']:>6} updates  {result['updates_per_s']:>8.1f} updates/s")
+            for kind, stats in sorted(result["latency"].items()):
+                print(f"    {kind:<16} n={stats['count']:<6} p50={stats['p50_us'] / 1000:7.2f}ms "
+                      f"p95={stats['p95_us'] / 1000:7.2f}ms p99={stats['p99_us'] / 1000:7.2f}ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end bot benchmarks with JSON results and baseline checks")
+    parser.add_argument("--backends", default="sqlite", help="comma-separated: sqlite, postgres")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_POSTGRES_URL",
+                                                            "postgresql://postgres@127.0.0.1:5432/taxi_bench"),
+                        help="a throwaway database: its tables are dropped before the run")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of "
+                        + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5000, help="updates per scenario (onboarding: 2 per user)")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--queue", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="updates/sec to offer (0 = all at once: latency then includes queueing)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="e2e_results.json", help="where to write this run's JSON")
+    parser.add_argument("--baseline", help="earlier --output to compare against; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="latency growth always tolerated")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # Keep the registration pass first whatever order was asked for
+    args.scenarios = [s for s in SCENARIOS if s in args.scenarios]
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "postgres_url")},
+        },
+        "results": {},
+    }
+    started = time.perf_counter()
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        report["results"][backend] = run_backend(backend, args)
+    report["meta"]["elapsed_s"] = round(time.perf_counter() - started, 1)
+
+    _print_results(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(report, baseline, args.tolerance, args.min_delta_ms)
+    regressions = [row for row in rows if row[5]]
+    print(f"\nagainst {args.baseline} (commit {baseline.get('meta', {}).get('commit') or '?'}), "
+          f"tolerance {args.tolerance:.0%}:")
+    for backend, scenario, metric, was, now, regressed in rows:
+        if was is None:
+            print(f"  ❌ {backend:<8} {scenario:<11} {metric}")
+        elif regressed or metric == "updates/s":
+            change = (now - was) / was if was else 0.0
+            print(f"  {'❌' if regressed else '✅'} {backend:<8} {scenario:<11} {metric:<28} "
+                  f"{was:>9.2f} -> {now:>9.2f} ({change:+.0%})")
+    if not rows:
+        print("  nothing to compare (the baseline has no results)")
+    print(f"{'❌' if regressions else '✅'} {len(regressions)} regressions in {len(rows)} figures")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
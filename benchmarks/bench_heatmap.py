@@ -0,0 +1,108 @@
+# =====================================================
+# 🔥 BENCHMARK: DEMAND HEATMAP
+# Run: python -m benchmarks.bench_heatmap [--minutes 30]
+# =====================================================
+
+import argparse
+import heapq
+import time
+
+import numpy as np
+
+from benchmarks.common import CITY_LAT, CITY_LNG, summarize
+from heatmap import DemandHeatmap
+from location_ingest import LocationFix
+
+class _Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming demand/supply counters vs rescanning open orders")
+    parser.add_argument("--minutes", type=int, default=30, help="simulated time")
+    parser.add_argument("--orders-per-sec", type=float, default=50.0)
+    parser.add_argument("--mean-wait", type=float, default=60.0, help="mean seconds an order stays PENDING")
+    parser.add_argument("--cancel-rate", type=float, default=0.1, help="share of orders cancelled while waiting")
+    parser.add_argument("--drivers", type=int, default=20000)
+    parser.add_argument("--fix-interval", type=float, default=5.0, help="seconds between a driver's fixes")
+    parser.add_argument("--spread", type=float, default=0.5, help="city half-width in degrees")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    clock = _Clock(1_800_000_000.0)
+    heatmap = DemandHeatmap(clock=clock)
+    drivers = [f"d{i:06d}" for i in range(args.drivers)]
+    dlat = CITY_LAT + rng.normal(0, args.spread / 3, args.drivers)
+    dlng = CITY_LNG + rng.normal(0, args.spread / 3, args.drivers)
+
+    waiting = {}  # order_id -> (lat, lng): what a rescan of PENDING orders reads
+    leaving = []  # (time the order leaves PENDING, order_id, status)
+    created = 0
+    status_samples, fix_samples, snapshot_samples, rescan_samples = [], [], [], []
+    clock_fn = time.perf_counter
+    steps = int(args.minutes * 60)
+    per_step_fixes = int(args.drivers / args.fix_interval)
+    for step in range(steps):
+        clock.now += 1.0
+        for _ in range(rng.poisson(args.orders_per_sec)):
+            # Demand clusters around the centre more tightly than the fleet does
+            lat = CITY_LAT + rng.normal(0, args.spread / 6)
+            lng = CITY_LNG + rng.normal(0, args.spread / 6)
+            order_id = f"o{created:08d}"
+            created += 1
+            t0 = clock_fn()
+            heatmap.track_order(order_id, "PENDING", lat, lng)
+            status_samples.append(clock_fn() - t0)
+            waiting[order_id] = (lat, lng)
+            status = "CANCELLED" if rng.random() < args.cancel_rate else "ASSIGNED"
+            heapq.heappush(leaving, (clock.now + rng.exponential(args.mean_wait), order_id, status))
+        while leaving and leaving[0][0] <= clock.now:
+            _, order_id, status = heapq.heappop(leaving)
+            t0 = clock_fn()
+            heatmap.track_order(order_id, status)
+            status_samples.append(clock_fn() - t0)
+            del waiting[order_id]
+
+        movers = rng.integers(0, args.drivers, per_step_fixes)
+        dlat[movers] += rng.normal(0, 0.001, movers.size)
+        dlng[movers] += rng.normal(0, 0.001, movers.size)
+        fixes = [LocationFix(drivers[i], dlat[i], dlng[i], bool(i % 4)) for i in movers.tolist()]
+        t0 = clock_fn()
+        heatmap.observe_drivers(fixes)
+        fix_samples.append((clock_fn() - t0) / max(1, len(fixes)))
+
+        if step % 10 == 9:
+            t0 = clock_fn()
+            snap = heatmap.snapshot(300)
+            snapshot_samples.append(clock_fn() - t0)
+
+            # The ad-hoc way: rescan every PENDING order
+            t0 = clock_fn()
+            points = np.asarray(list(waiting.values()))
+            cy = np.floor(points[:, 0] / heatmap.cell_size_deg).astype(np.int64)
+            cx = np.floor(points[:, 1] / heatmap.cell_size_deg).astype(np.int64)
+            cells, counts = np.unique(np.stack([cy, cx], axis=1), axis=0, return_counts=True)
+            rescan_samples.append(clock_fn() - t0)
+
+    # The streaming pending counts must agree with the last rescan exactly
+    snap = heatmap.snapshot(300)
+    expected = dict(zip(map(tuple, cells.tolist()), counts.tolist()))
+    got = {cell: int(p) for cell, p in zip(snap.cells, snap.pending) if p}
+
+    print(f"{args.minutes} simulated minutes, {created:,} orders ({len(waiting):,} still pending), "
+          f"{args.drivers:,} drivers, {heatmap.stats()['cells']:,} cells")
+    for label, samples in (("order status", status_samples), ("observe fix", fix_samples),
+                           ("snapshot(300)", snapshot_samples), ("rescan PENDING orders", rescan_samples)):
+        stats = summarize(samples)
+        print(f"  {label:<24} p50 {stats['p50_us']:9.1f}us  p99 {stats['p99_us']:9.1f}us")
+    print(f"  streaming pending counts match the rescan: {got == expected}")
+    print("  hottest cells (5 min):")
+    for row in snap.rows(5):
+        print(f"    {row}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# =====================================================
+# 📋 BENCHMARK: PER-UPDATE MENU RENDERING
+# Legacy per-call keyboard/markdown construction vs MenuRegistry
+# Run: python -m benchmarks.bench_menu_render
+# =====================================================
+
+import argparse
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from menus import MenuRegistry
+
+CONFIG = SimpleNamespace(
+    ADMIN_APP_URL="https://example.com/admin_login.html",
+    CUSTOMER_APP_URL="https://example.com/customer.html",
+    DRIVER_APP_URL="https://example.com/driver_pro.html",
+    DISPATCHER_APP_URL="https://example.com/admin_panel_driver_registration.html",
+)
+ROLES = ["admin", "driver", "dispatcher", "customer"]
+CALLBACKS = ["customer_order", "driver_earnings", "admin_users", "dispatcher_orders",
+             "customer_history", "admin_settings", "no_such_button"]
+
+def legacy_role_menu(role: str, phone: str, created_at: datetime):
+    """The role menu as show_role_menu used to build it on every call"""
+    if role == "admin":
+        keyboard = [
+            [InlineKeyboardButton("📊 Admin Panel", url=CONFIG.ADMIN_APP_URL)],
+            [InlineKeyboardButton("👥 Foydalanuvchilar", callback_data="admin_users")],
+            [InlineKeyboardButton("💰 Moliya", callback_data="admin_money")],
+            [InlineKeyboardButton("⚙️ Sozlamalar", callback_data="admin_settings")],
+        ]
+        title, message = "🔑 Admin Panel", "Admin paneliga xush kelibsiz!"
+    elif role == "driver":
+        keyboard = [
+            [InlineKeyboardButton("🚗 Haydovchi Applikatsiyasi", url=CONFIG.DRIVER_APP_URL)],
+            [InlineKeyboardButton("💰 Daromadim", callback_data="driver_earnings")],
+            [InlineKeyboardButton("⭐ Reyting", callback_data="driver_rating")],
+            [InlineKeyboardButton("🆘 Yordam", callback_data="driver_support")],
+        ]
+        title, message = "🚗 Haydovchi Applikatsiyasi", "Haydovchi applikatsiyasiga xush kelibsiz!"
+    elif role == "dispatcher":
+        keyboard = [
+            [InlineKeyboardButton("📞 Dispatcher Panel", url=CONFIG.DISPATCHER_APP_URL)],
+            [InlineKeyboardButton("📋 Buyurtmalar", callback_data="dispatcher_orders")],
+            [InlineKeyboardButton("👥 Haydovchilar", callback_data="dispatcher_drivers")],
+            [InlineKeyboardButton("🆘 Yordam", callback_data="dispatcher_support")],
+        ]
+        title, message = "📞 Dispatcher Panel", "Dispatcher paneliga xush kelibsiz!"
+    else:
+        keyboard = [
+            [InlineKeyboardButton("👤 Mijoz Applikatsiyasi", url=CONFIG.CUSTOMER_APP_URL)],
+            [InlineKeyboardButton("🚕 Taksi Buyurtma Qilish", callback_data="customer_order")],
+            [InlineKeyboardButton("📋 Tarixim", callback_data="customer_history")],
+            [InlineKeyboardButton("🆘 Yordam", callback_data="customer_support")],
+        ]
+        title, message = "👤 Mijoz Applikatsiyasi", "Mijoz applikatsiyasiga xush kelibsiz!"
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = f"""
+{title}
+
+{message}
+
+*Sizning roli:* {role.upper()}
+*Telefon:* {phone}
+*Yaratilgan:* {created_at.strftime('%Y-%m-%d %H:%M')}
+    """
+    return text, reply_markup
+
+def legacy_screen(data: str):
+    """The static callback screens as button_callback used to build them"""
+    if data == "customer_order":
+        text = "🚕 *Taksi Buyurtma Qilish*\n\nTaksi buyurtmasini qilish uchun mijoz applikatsiyasini oching:"
+        keyboard = [[InlineKeyboardButton("👤 Mijoz Applikatsiyasi", url=CONFIG.CUSTOMER_APP_URL)]]
+    elif data == "driver_earnings":
+        text = "💰 *Mening Daromadim*\n\nSizning daromadingizni ko'rish uchun haydovchi applikatsiyasini oching:"
+        keyboard = [[InlineKeyboardButton("🚗 Haydovchi Applikatsiyasi", url=CONFIG.DRIVER_APP_URL)]]
+    elif data == "admin_users":
+        text = "👥 *Foydalanuvchilar*\n\nFoydalanuvchilarni boshqarish uchun admin panelini oching:"
+        keyboard = [[InlineKeyboardButton("🔑 Admin Panel", url=CONFIG.ADMIN_APP_URL)]]
+    elif data == "dispatcher_orders":
+        text = "📋 *Buyurtmalar*\n\nBuyurtmalarni boshqarish uchun dispatcher panelini oching:"
+        keyboard = [[InlineKeyboardButton("📞 Dispatcher Panel", url=CONFIG.DISPATCHER_APP_URL)]]
+    elif data in ["customer_history", "customer_support", "driver_rating", "driver_support",
+                  "dispatcher_drivers", "dispatcher_support", "admin_money", "admin_settings"]:
+        text = "📱 *Applikatsiyani Oching*\n\nBu funksiyani ishlatish uchun applikatsiyani oching:"
+        keyboard = [[InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_menu")]]
+    else:
+        text = "❌ Noma'lum buyruq"
+        keyboard = [[InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_menu")]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+def per_call_us(fn, args_list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for args in args_list:
+            fn(*args)
+    return (time.perf_counter() - started) / (rounds * len(args_list)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Menu rendering cost per update")
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    registry = MenuRegistry(CONFIG)
+    created = datetime(2025, 11, 28, 12, 30)
+    menu_args = [(role, "+998901234567", created) for role in ROLES]
+
+    def registry_role_menu(role, phone, created_at):
+        menu = registry.role_menu(role)
+        return menu.render(phone, created_at), menu.keyboard
+
+    # Same output either way
+    for args_ in menu_args:
+        assert legacy_role_menu(*args_)[0] == registry_role_menu(*args_)[0]
+        assert legacy_role_menu(*args_)[1] == registry_role_menu(*args_)[1]
+    for data in CALLBACKS:
+        assert legacy_screen(data) == registry.screen(data)
+
+    rows = [
+        ("role menu", per_call_us(legacy_role_menu, menu_args, args.rounds),
+         per_call_us(registry_role_menu, menu_args, args.rounds)),
+        ("callback screen", per_call_us(legacy_screen, [(d,) for d in CALLBACKS], args.rounds),
+         per_call_us(registry.screen, [(d,) for d in CALLBACKS], args.rounds)),
+    ]
+    print(f"{'render':<16} {'before µs':>10} {'after µs':>10} {'speedup':>8}")
+    for name, before, after in rows:
+        print(f"{name:<16} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# =====================================================
+# 🔄 BENCHMARK: CONTENDED ORDER ACCEPTS
+# Run: python -m benchmarks.bench_order_accept
+# =====================================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import summarize
+
+def _seed(orders: int, drivers: int):
+    from taxi import Order, OrderStatus, User, UserRole, engine
+
+    order_ids = [f"o{i:07d}" for i in range(orders)]
+    driver_ids = [f"d{i:05d}" for i in range(drivers)]
+    with engine.begin() as conn:
+        conn.execute(Order.__table__.delete())
+        conn.execute(User.__table__.delete())
+        conn.execute(User.__table__.insert(), [dict(id="c0", phone="c0", name="c0", role=UserRole.CUSTOMER)]
+                     + [dict(id=d, phone=d, name=d, role=UserRole.DRIVER) for d in driver_ids])
+        conn.execute(Order.__table__.insert(), [
+            dict(id=o, customer_id="c0", pickup_location="A", destination_location="B", customer_phone="0",
+                 status=OrderStatus.PENDING)
+            for o in order_ids
+        ])
+    return order_ids, driver_ids
+
+def _cas_accept(db, order_id: str, driver_id: str) -> bool:
+    from order_lifecycle import publish_transition, transition_sync
+    result = transition_sync(db, order_id, "accept", driver_id)
+    db.commit()
+    if result.applied:
+        publish_transition(result)
+    return result.applied
+
+def _naive_accept(db, order_id: str, driver_id: str) -> bool:
+    """Read-then-write without a condition - what the lifecycle replaces"""
+    from taxi import Order, OrderStatus
+    status = db.query(Order.status).filter(Order.id == order_id).scalar()
+    if status is not OrderStatus.PENDING:
+        db.rollback()
+        return False
+    db.query(Order).filter(Order.id == order_id).update(
+        {"status": OrderStatus.ACCEPTED, "driver_id": driver_id}, synchronize_session=False)
+    db.commit()
+    return True
+
+async def _cas_accept_async(order_id: str, driver_id: str) -> bool:
+    from order_lifecycle import accept_order
+    return (await accept_order(order_id, driver_id)).applied
+
+async def _naive_accept_async(order_id: str, driver_id: str) -> bool:
+    from sqlalchemy import select, update
+    from taxi import Order, OrderStatus, db_session, db_write_session
+    async with db_session() as session:
+        status = await session.scalar(select(Order.status).where(Order.id == order_id))
+    if status is not OrderStatus.PENDING:
+        return False
+    async with db_write_session() as session:
+        await session.execute(update(Order.__table__).where(Order.__table__.c.id == order_id)
+                              .values(status=OrderStatus.ACCEPTED, driver_id=driver_id))
+        await session.commit()
+    return True
+
+def _driver(n: int, i: int, workers: int, driver_ids) -> str:
+    return driver_ids[(n + i * workers) % len(driver_ids)]
+
+def _race_threads(accept, order_ids, driver_ids, workers: int):
+    """Every thread walks the same order list, so each order is fought over by all of them"""
+    import taxi
+
+    wins = [[] for _ in range(workers)]
+    samples = [[] for _ in range(workers)]
+    errors = Counter()
+    barrier = threading.Barrier(workers)
+
+    def worker(n: int):
+        clock = time.perf_counter
+        with taxi.SessionLocal() as db:
+            barrier.wait()
+            for i, order_id in enumerate(order_ids):
+                driver_id = _driver(n, i, workers, driver_ids)
+                t0 = clock()
+                try:
+                    if accept(db, order_id, driver_id):
+                        wins[n].append((order_id, driver_id))
+                except Exception as e:
+                    db.rollback()
+                    errors[type(e).__name__] += 1
+                samples[n].append(clock() - t0)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return [w for per_thread in wins for w in per_thread], [s for per_thread in samples for s in per_thread], errors, elapsed
+
+async def _race_async(accept, order_ids, driver_ids, workers: int):
+    """Same race as _race_threads with coroutines on the bot's async sessions"""
+    wins, samples = [], []
+    errors = Counter()
+
+    async def worker(n: int):
+        clock = time.perf_counter
+        for i, order_id in enumerate(order_ids):
+            driver_id = _driver(n, i, workers, driver_ids)
+            t0 = clock()
+            try:
+                if await accept(order_id, driver_id):
+                    wins.append((order_id, driver_id))
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            samples.append(clock() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(workers)))
+    return wins, samples, errors, time.perf_counter() - started
+
+def _check(order_ids, wins):
+    """(orders won more than once, wins not reflected in the stored driver, orders nobody won)"""
+    from taxi import Order, engine
+    from sqlalchemy import select
+
+    claimed = Counter(order_id for order_id, _ in wins)
+    winner = dict(wins)
+    with engine.connect() as conn:
+        stored = dict(conn.execute(select(Order.id, Order.driver_id)).all())
+    double = sum(1 for n in claimed.values() if n > 1)
+    lost = sum(1 for order_id in order_ids if order_id in winner and stored[order_id] != winner[order_id])
+    unclaimed = sum(1 for order_id in order_ids if order_id not in claimed)
+    return double, lost, unclaimed
+
+def main():
+    parser = argparse.ArgumentParser(description="Drivers racing to accept the same orders")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=16, help="concurrent accepting drivers")
+    parser.add_argument("--mode", choices=["async", "threads"], default="async",
+                        help="coroutines on the bot's async sessions, or threads on sync sessions")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--skip-naive", action="store_true", help="do not run the read-then-write baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taxi-accept-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'accept.db')}"
+    os.environ.setdefault("DB_POOL_SIZE", str(args.workers))
+    import taxi
+    taxi.prepare_database()
+
+    if args.mode == "async":
+        race, cas, naive = _race_async, _cas_accept_async, _naive_accept_async
+    else:
+        race, cas, naive = _race_threads, _cas_accept, _naive_accept
+
+    async def run_all() -> bool:
+        failed = False
+        modes = [("compare-and-set", cas)] + ([] if args.skip_naive else [("read-then-write", naive)])
+        for label, accept in modes:
+            order_ids, driver_ids = _seed(args.orders, args.drivers)
+            if args.mode == "async":
+                outcome = await race(accept, order_ids, driver_ids, args.workers)
+            else:
+                outcome = await asyncio.to_thread(race, accept, order_ids, driver_ids, args.workers)
+            wins, samples, errors, elapsed = outcome
+            double, lost, unclaimed = _check(order_ids, wins)
+            stats = summarize(samples)
+            print(f"{label}: {args.workers} workers ({args.mode}) x {args.orders} orders on {taxi.engine.dialect.name}")
+            print(f"  accepts/sec {len(wins) / elapsed:,.0f}  attempts/sec {len(samples) / elapsed:,.0f}  "
+                  f"attempt p50 {stats['p50_us'] / 1000:.2f}ms p99 {stats['p99_us'] / 1000:.2f}ms")
+            print(f"  wins {len(wins)}  double-accepted {double}  lost updates {lost}  unclaimed {unclaimed}  "
+                  f"errors {dict(errors) or 0}")
+            if accept is cas and (double or lost or unclaimed or errors):
+                failed = True
+        # The async engines and the SQLite write lock belong to this event loop
+        await taxi.dispose_engines()
+        return failed
+
+    failed = asyncio.run(run_all())
+    taxi.engine.dispose()
+    if failed:
+        print("❌ compare-and-set accepts were lost or duplicated")
+        sys.exit(1)
+    print("✅ every order accepted exactly once")
+
+if __name__ == "__main__":
+    main()
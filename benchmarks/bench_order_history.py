@@ -0,0 +1,148 @@
+# =====================================================
+# 📜 BENCHMARK: ORDER HISTORY PAGINATION
+# Run: python -m benchmarks.bench_order_history [--rows 10000000]
+# =====================================================
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import summarize
+
+def _load(rows: int, customers: int, drivers: int, seed: int, chunk: int = 50000) -> float:
+    """Insert users and a year of synthetic orders; indexes are built after the load"""
+    from taxi import Order, OrderStatus, User, UserRole, engine
+
+    rng = random.Random(seed)
+    customer_ids = [f"c{i:07d}" for i in range(customers)]
+    driver_ids = [f"d{i:07d}" for i in range(drivers)]
+    with engine.begin() as conn:
+        users = [dict(id=uid, phone=uid, name=uid, role=UserRole.CUSTOMER) for uid in customer_ids]
+        users += [dict(id=uid, phone=uid, name=uid, role=UserRole.DRIVER) for uid in driver_ids]
+        conn.execute(User.__table__.insert(), users)
+
+    indexes = list(Order.__table__.indexes)
+    for index in indexes:
+        index.drop(engine)
+
+    finished = (OrderStatus.COMPLETED,) * 9 + (OrderStatus.CANCELLED,)
+    active = (OrderStatus.PENDING, OrderStatus.ASSIGNED, OrderStatus.ACCEPTED, OrderStatus.STARTED)
+    start = datetime(2025, 1, 1)
+    step = 365 * 86400 / rows
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for first in range(0, rows, chunk):
+            batch = []
+            for i in range(first, min(first + chunk, rows)):
+                # The newest ~2% of orders are still open
+                status = rng.choice(active) if i > rows * 0.98 else rng.choice(finished)
+                batch.append({
+                    "id": "%032x" % rng.getrandbits(128),
+                    "customer_id": rng.choice(customer_ids),
+                    "driver_id": None if status is OrderStatus.PENDING else rng.choice(driver_ids),
+                    "pickup_location": "A", "destination_location": "B", "customer_phone": "0",
+                    "status": status,
+                    "final_price": 15000.0 if status is OrderStatus.COMPLETED else None,
+                    "created_at": start + timedelta(seconds=i * step),
+                })
+            conn.execute(Order.__table__.insert(), batch)
+    load_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for index in indexes:
+        index.create(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    print(f"loaded {rows:,} orders in {load_time:.1f}s ({rows / load_time:,.0f} rows/s), "
+          f"indexes in {time.perf_counter() - started:.1f}s")
+    return load_time
+
+def _time(db, statements) -> dict:
+    samples = []
+    for stmt in statements:
+        t0 = time.perf_counter()
+        db.scalars(stmt).all()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+def _report(label: str, stats: dict) -> None:
+    print(f"  {label:<34} p50 {stats['p50_us'] / 1000:8.2f}ms  p99 {stats['p99_us'] / 1000:8.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyset vs OFFSET history pages on a large orders table")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--customers", type=int, default=200_000)
+    parser.add_argument("--drivers", type=int, default=20_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=20, help="page number for the deep-page comparison")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taxi-history-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'history.db')}"
+    import taxi
+    import order_history as oh
+    taxi.prepare_database()
+    from sqlalchemy import func, select
+    from taxi import Order
+
+    _load(args.rows, args.customers, args.drivers, args.seed)
+    rng = random.Random(args.seed + 1)
+    limit = args.page_size
+    offset = args.depth * limit
+
+    with taxi.SessionLocal() as db:
+        if taxi.IS_SQLITE:
+            for name, stmt in (("customer history", oh.customer_history_query("c0000001", limit)),
+                               ("driver history", oh.driver_history_query("d0000001", limit)),
+                               ("open orders", oh.open_orders_query(limit))):
+                compiled = stmt.compile(taxi.engine, compile_kwargs={"literal_binds": True})
+                plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+                print(f"  plan {name}: {' / '.join(row[-1] for row in plan)}")
+
+        customers = [f"c{rng.randrange(args.customers):07d}" for _ in range(args.samples)]
+        drivers = [f"d{rng.randrange(args.drivers):07d}" for _ in range(args.samples)]
+
+        print(f"first page ({limit} rows):")
+        _report("customer history", _time(db, [oh.customer_history_query(c, limit) for c in customers]))
+        _report("driver history", _time(db, [oh.driver_history_query(d, limit) for d in drivers]))
+        _report("open orders", _time(db, [oh.open_orders_query(limit) for _ in range(args.samples)]))
+
+        # Cursor of the deep page, found once outside the timed loop
+        def deep_cursor(query):
+            rows = db.scalars(query.limit(1).offset(offset - 1)).all()
+            return oh.encode_cursor(rows[0].created_at, rows[0].id) if rows else None
+
+        print(f"page {args.depth} (offset {offset:,}):")
+        cursors = [deep_cursor(oh.driver_history_query(d, limit)) for d in drivers]
+        _report("driver history keyset", _time(db, [oh.driver_history_query(d, limit, c)
+                                                    for d, c in zip(drivers, cursors)]))
+        _report("driver history OFFSET", _time(db, [oh.driver_history_query(d, limit).offset(offset)
+                                                    for d in drivers]))
+
+        open_count = db.scalar(select(func.count()).select_from(Order).where(taxi.ACTIVE_ORDER_FILTER))
+        deep = max(1, min(open_count - limit, open_count // 2))
+        rows = db.scalars(oh.open_orders_query(limit).limit(1).offset(deep - 1)).all()
+        cursor = oh.encode_cursor(rows[0].created_at, rows[0].id)
+        print(f"open orders at offset {deep:,} of {open_count:,}:")
+        _report("open orders keyset", _time(db, [oh.open_orders_query(limit, cursor)] * args.samples))
+        _report("open orders OFFSET", _time(db, [oh.open_orders_query(limit).offset(deep)] * args.samples))
+
+        # What the same first page cost before the history indexes existed
+        index = next(i for i in Order.__table__.indexes if i.name == "ix_orders_customer_created_at_id")
+        db.commit()
+        index.drop(taxi.engine)
+        print("without ix_orders_customer_created_at_id:")
+        _report("customer history", _time(db, [oh.customer_history_query(c, limit) for c in customers[:5]]))
+        db.commit()
+        index.create(taxi.engine)
+
+    taxi.engine.dispose()
+
+if __name__ == "__main__":
+    main()
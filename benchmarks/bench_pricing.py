@@ -0,0 +1,89 @@
+# =====================================================
+# 💰 BENCHMARK: BATCH FARE ESTIMATION
+# Run: python -m benchmarks.bench_pricing [--orders 100000]
+# =====================================================
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import CITY_LAT, CITY_LNG
+from geo import cell_of, haversine_km
+from pricing import DEFAULT_TARIFFS, FareEngine
+
+def _scalar_price(engine: FareEngine, plat, plng, dlat, dlng, order_type) -> float:
+    """One order at a time with the math module - the per-request way"""
+    tariff = engine.tariffs.get(order_type, engine.tariffs[engine.default_type])
+    km = haversine_km(plat, plng, dlat, dlng) * engine.road_factor
+    minutes = km / engine.average_speed_kmh * 60.0
+    surge = engine._surge.get(cell_of(plat, plng, engine.surge_cell_size_deg), 1.0)
+    fare = max(tariff.base_fare + tariff.per_km * km + tariff.per_min * minutes, tariff.minimum_fare) * surge
+    return round(fare / engine.rounding) * engine.rounding
+
+def main():
+    parser = argparse.ArgumentParser(description="Price a dispatcher queue in one call")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--spread", type=float, default=0.2, help="city half-width in degrees")
+    parser.add_argument("--hotspots", type=int, default=60,
+                        help="popular pickup/drop-off spots (airport, stations, malls) for the routed run")
+    parser.add_argument("--route-ms", type=float, default=2.0, help="simulated routing service latency")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.orders
+    plat = CITY_LAT + rng.uniform(-args.spread, args.spread, n)
+    plng = CITY_LNG + rng.uniform(-args.spread, args.spread, n)
+    dlat = CITY_LAT + rng.uniform(-args.spread, args.spread, n)
+    dlng = CITY_LNG + rng.uniform(-args.spread, args.spread, n)
+    types = rng.choice(list(DEFAULT_TARIFFS), n, p=[0.8, 0.15, 0.05]).tolist()
+
+    engine = FareEngine()
+    # Surge on a third of the busy centre cells
+    cy, cx = cell_of(CITY_LAT, CITY_LNG)
+    engine.set_surge({(cy + y, cx + x): 1.0 + rng.uniform(0.2, 1.5)
+                      for y in range(-10, 11) for x in range(-10, 11) if rng.random() < 0.33})
+
+    batch = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        prices = engine.price(plat, plng, dlat, dlng, types)["price"]
+        batch.append(time.perf_counter() - started)
+    sample = min(n, 20000)
+    started = time.perf_counter()
+    scalar = [_scalar_price(engine, plat[i], plng[i], dlat[i], dlng[i], types[i]) for i in range(sample)]
+    per_order = (time.perf_counter() - started) / sample
+    mismatches = int(np.count_nonzero(np.abs(prices[:sample] - np.array(scalar)) > engine.rounding))
+
+    print(f"{n:,} orders, {len(engine._surge)} surge cells")
+    print(f"  vectorized batch   best {min(batch) * 1000:8.2f}ms  ({n / min(batch):,.0f} orders/s)")
+    print(f"  one at a time      est. {per_order * n * 1000:8.2f}ms  ({1 / per_order:,.0f} orders/s, "
+          f"{sample:,} timed)")
+    print(f"  speedup {per_order * n / min(batch):.0f}x; prices off by more than one rounding step: {mismatches}")
+
+    # Routed distances: trips between popular spots repeat, so most pairs come from the cache
+    spots = np.stack([CITY_LAT + rng.uniform(-args.spread, args.spread, args.hotspots),
+                      CITY_LNG + rng.uniform(-args.spread, args.spread, args.hotspots)], axis=1)
+    origin = spots[rng.integers(0, args.hotspots, n)]
+    target = spots[rng.integers(0, args.hotspots, n)]
+    calls = [0]
+
+    def router(olat, olng, tlat, tlng):
+        calls[0] += 1
+        time.sleep(args.route_ms / 1000)
+        return haversine_km(olat, olng, tlat, tlng) * 1.25
+
+    routed = FareEngine(route_provider=router)
+    for label in ("cold cache", "warm cache"):
+        calls[0] = 0
+        started = time.perf_counter()
+        routed.price(origin[:, 0], origin[:, 1], target[:, 0], target[:, 1], types)
+        elapsed = time.perf_counter() - started
+        print(f"  routed, {label:<10} {elapsed * 1000:8.2f}ms  router calls {calls[0]:,} "
+              f"(vs {n:,} uncached = {n * args.route_ms / 1000:,.0f}s)")
+    print(f"  route cache {routed.route_cache.stats()}")
+
+if __name__ == "__main__":
+    main()
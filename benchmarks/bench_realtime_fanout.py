@@ -0,0 +1,161 @@
+# =====================================================
+# 📡 BENCHMARK: REAL-TIME FAN-OUT
+# Run: python -m benchmarks.bench_realtime_fanout [--connections 10000]
+# =====================================================
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import socket
+import time
+
+from benchmarks.common import summarize
+
+def _raise_fd_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+async def _client(port: int, topic: str, expected: int, latencies: list, slow: bool) -> None:
+    sock = socket.socket()
+    if slow:
+        # A small receive window, so the kernel does not soak up what the client never reads
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(f"GET /events?topic={topic} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    if slow:
+        # Never read: the server has to notice and drop this connection
+        await asyncio.sleep(3600)
+    received = 0
+    pending = b""
+    try:
+        while received < expected:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            now = time.time()
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.startswith(b"data: "):
+                    latencies.append(now - json.loads(line[6:])["ts"])
+                    received += 1
+    finally:
+        writer.close()
+
+def _client_process(port: int, topics: list, slow_flags: list, expected: int, ready, results, done) -> None:
+    """One harness process holding a share of the connections"""
+    _raise_fd_limit()
+
+    async def run():
+        latencies = []
+        tasks = []
+        for i in range(0, len(topics), 500):
+            # Connect in waves so the listen backlog never overflows
+            for topic, slow in zip(topics[i:i + 500], slow_flags[i:i + 500]):
+                tasks.append(asyncio.create_task(_client(port, topic, expected, latencies, slow)))
+            await asyncio.sleep(0.05)
+        ready.put(len(tasks))
+        fast = [t for t, slow in zip(tasks, slow_flags) if not slow]
+        await asyncio.wait(fast, timeout=120)
+        results.put(latencies)
+        # Keep the stalled connections open until the server has dealt with them
+        await asyncio.get_running_loop().run_in_executor(None, done.wait, 120)
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(run())
+
+async def _serve(args, ready, results, done, procs) -> None:
+    from realtime import PubSubHub, SSEServer
+
+    hub = PubSubHub(buffer_size=args.buffer)
+    server = await SSEServer(hub, "127.0.0.1", 0, heartbeat=5).start()
+
+    topics = [f"cell:{i // args.topics}:{i % args.topics}" for i in range(args.topics)]
+    plan = [topics[i % args.topics] for i in range(args.connections)]
+    slow = [i < args.slow for i in range(args.connections)]
+    share = -(-args.connections // args.procs)
+    ctx = multiprocessing.get_context("spawn")
+    for p in range(args.procs):
+        chunk = slice(p * share, (p + 1) * share)
+        proc = ctx.Process(target=_client_process,
+                           args=(server.port, plan[chunk], slow[chunk], args.rounds, ready, results, done))
+        proc.start()
+        procs.append(proc)
+
+    loop = asyncio.get_running_loop()
+    connected = 0
+    for _ in procs:
+        connected += await loop.run_in_executor(None, ready.get)
+    while hub.stats()["subscribers"] < args.connections:
+        await asyncio.sleep(0.1)
+    print(f"{connected:,} connections on {len(topics)} topics "
+          f"({args.connections // len(topics)} subscribers each, {args.slow} never read)")
+
+    publish_times = []
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        t0 = time.perf_counter()
+        for topic in topics:
+            hub.publish(topic, "driver_position", {"driver_id": "bench", "lat": 41.31, "lng": 69.28,
+                                                   "pad": "x" * args.payload, "ts": time.time()})
+        publish_times.append(time.perf_counter() - t0)
+        await asyncio.sleep(args.interval)
+    elapsed = time.perf_counter() - started
+
+    latencies = []
+    for _ in procs:
+        latencies += await loop.run_in_executor(None, results.get)
+    stats = summarize(latencies)
+    expected = (args.connections - args.slow) * args.rounds
+    print(f"rounds {args.rounds} x {len(topics)} publishes in {elapsed:.2f}s; "
+          f"publish loop per round p50 {summarize(publish_times)['p50_us'] / 1000:.2f}ms")
+    print(f"delivered {len(latencies):,}/{expected:,} events ({len(latencies) / elapsed:,.0f}/s)")
+    print(f"fan-out latency p50 {stats['p50_us'] / 1000:.2f}ms  p95 {stats['p95_us'] / 1000:.2f}ms  "
+          f"p99 {stats['p99_us'] / 1000:.2f}ms  max {stats['max_us'] / 1000:.2f}ms")
+
+    # The fast clients are gone; keep publishing until the stalled ones overflow
+    burst = 0
+    while hub.stats()["slow_disconnects"] < args.slow and burst < 1000:
+        for topic in topics:
+            hub.publish(topic, "driver_position", {"pad": "x" * 4096, "ts": time.time()})
+        burst += 1
+        await asyncio.sleep(0.01)
+    print(f"slow consumers dropped {hub.stats()['slow_disconnects']}/{args.slow} "
+          f"after {burst} more 4 KB events; {server.connections} connections left")
+    done.set()
+    await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE fan-out latency with many concurrent subscribers")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--topics", type=int, default=100, help="cell topics the connections spread over")
+    parser.add_argument("--rounds", type=int, default=30, help="events per connection")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between rounds")
+    parser.add_argument("--payload", type=int, default=200, help="padding bytes per event")
+    parser.add_argument("--buffer", type=int, default=16, help="per-connection buffer (events)")
+    parser.add_argument("--slow", type=int, default=50, help="connections that never read")
+    parser.add_argument("--procs", type=int, default=4, help="client harness processes")
+    args = parser.parse_args()
+
+    _raise_fd_limit()
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, done = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = []
+    try:
+        asyncio.run(_serve(args, ready, results, done, procs))
+    finally:
+        for proc in procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# =====================================================
+# 🧩 BENCHMARK: SHARDED DISPATCH WORKERS
+# One synthetic city (drivers moving, orders arriving) replayed by
+# 1, 2, 4 ... worker processes, each owning the areas the shard map
+# gives it; events arrive at their area's worker, drivers crossing into
+# another shard's area are handed off through the coordination backend.
+# Every match is persisted like run_worker does, all shards committing
+# to one shared SQLite database. Trips never finish, so each driver is
+# matched at most once.
+# Run: python -m benchmarks.bench_sharding [--workers 1,2,4 --events 400000]
+# =====================================================
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import CITY_LAT, CITY_LNG
+
+def _events(drivers: int, events: int, order_every: int, spread: float, step: float, seed: int) -> list:
+    """("d", driver, lat, lng) fixes of random-walking drivers and ("o", order, lat, lng) pickups"""
+    rng = random.Random(seed)
+    positions = [(CITY_LAT + rng.uniform(-spread, spread), CITY_LNG + rng.uniform(-spread, spread))
+                 for _ in range(drivers)]
+    stream = []
+    for i in range(events):
+        if i % order_every == 0:
+            stream.append(("o", f"o{i}", CITY_LAT + rng.uniform(-spread, spread),
+                           CITY_LNG + rng.uniform(-spread, spread)))
+            continue
+        d = rng.randrange(drivers)
+        lat, lng = positions[d]
+        lat = min(CITY_LAT + spread, max(CITY_LAT - spread, lat + rng.uniform(-step, step)))
+        lng = min(CITY_LNG + spread, max(CITY_LNG - spread, lng + rng.uniform(-step, step)))
+        positions[d] = (lat, lng)
+        stream.append(("d", f"d{d}", lat, lng))
+    return stream
+
+def _seed(database_url: str, stream: list, drivers: int) -> None:
+    """The drivers and PENDING orders of the stream, so the workers' assign transitions can land"""
+    os.environ["DATABASE_URL"] = database_url
+    import taxi
+
+    taxi.prepare_database()
+    with taxi.engine.begin() as conn:
+        conn.execute(taxi.User.__table__.insert(),
+                     [dict(id="c0", phone="c0", name="c0", role=taxi.UserRole.CUSTOMER)]
+                     + [dict(id=f"d{d}", phone=f"d{d}", name=f"d{d}", role=taxi.UserRole.DRIVER)
+                        for d in range(drivers)])
+        conn.execute(taxi.Order.__table__.insert(), [
+            dict(id=key, customer_id="c0", pickup_location="A", destination_location="B", customer_phone="c0",
+                 status=taxi.OrderStatus.PENDING, pickup_lat=lat, pickup_lng=lng)
+            for kind, key, lat, lng in stream if kind == "o"
+        ])
+
+def _worker(shard: int, shards: int, area_deg: float, url: str, database_url: str, events: list, batch: int,
+            barrier, results) -> None:
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+        import logging
+        logging.disable(logging.INFO)
+        import taxi
+        # Built before the clock starts: publish_transition reaches both
+        taxi.realtime_hub, taxi.demand_heatmap
+    from sharding import LeaderElection, ShardMap, ShardWorker, _persist_assignments, backend_from_url
+
+    backend = backend_from_url(url)
+    worker = ShardWorker(shard, ShardMap(shards, area_deg), backend)
+    election = LeaderElection(backend, "bench", f"shard-{shard}", ttl=1.0)
+    led = persisted = 0
+    barrier.wait()
+    started = time.perf_counter()
+    for i in range(0, len(events), batch):
+        for kind, key, lat, lng in events[i:i + batch]:
+            if kind == "d":
+                worker.driver_location(key, lat, lng)
+            else:
+                worker.submit_order(key, lat, lng)
+        worker.poll()
+        matches = worker.dispatch()
+        if matches and database_url:
+            persisted += worker.settle(matches, _persist_assignments(matches))
+        worker.flush()
+        led += election.is_leader()
+    # Apply the last handoffs other shards sent us
+    barrier.wait()
+    while worker.poll():
+        worker.flush()
+    elapsed = time.perf_counter() - started
+    election.resign()
+    backend.close()
+    results.put(dict(worker.stats(), elapsed=elapsed, events=len(events), led=led, persisted=persisted))
+
+def _run(shards: int, stream: list, args) -> dict:
+    from sharding import ShardMap
+
+    shard_map = ShardMap(shards, args.area_deg)
+    parts = [[] for _ in range(shards)]
+    for event in stream:
+        parts[shard_map.shard_of(event[2], event[3])].append(event)
+
+    workdir = tempfile.mkdtemp(prefix="taxi-shards-")
+    url = f"sqlite:///{workdir}/coordination.db"
+    if args.backend.startswith("redis"):
+        url = args.backend
+    ctx = multiprocessing.get_context("spawn")
+    database_url = ""
+    if args.persist:
+        database_url = f"sqlite:///{workdir}/taxi.db"
+        seeder = ctx.Process(target=_seed, args=(database_url, stream, args.drivers))
+        seeder.start()
+        seeder.join()
+    barrier, results = ctx.Barrier(shards), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(shard, shards, args.area_deg, url, database_url, parts[shard],
+                                               args.batch, barrier, results))
+             for shard in range(shards)]
+    for proc in procs:
+        proc.start()
+    reports = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = max(report["elapsed"] for report in reports)
+    total = sum(report["events"] for report in reports)
+    return {
+        "shards": shards,
+        "events_per_s": total / wall if wall else 0.0,
+        "wall_s": wall,
+        "imbalance": max(len(p) for p in parts) / (len(stream) / shards),
+        "assigned": sum(report["assigned"] for report in reports),
+        "persisted": sum(report["persisted"] for report in reports),
+        "handoffs": sum(report["handoffs_in"] for report in reports),
+        "forwarded": sum(report["forwarded"] for report in reports),
+        "leaders": sum(1 for report in reports if report["led"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch throughput with 1..N shard worker processes")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--events", type=int, default=400000)
+    parser.add_argument("--drivers", type=int, default=5000)
+    parser.add_argument("--order-every", type=int, default=10, help="one order per this many events")
+    parser.add_argument("--spread", type=float, default=0.25, help="city half-width in degrees")
+    parser.add_argument("--step", type=float, default=0.002, help="max driver move per fix in degrees")
+    parser.add_argument("--area-deg", type=float, default=0.05)
+    parser.add_argument("--batch", type=int, default=500, help="events between poll/dispatch/flush")
+    parser.add_argument("--backend", default="sqlite", help="sqlite (temp file) or a redis:// URL")
+    parser.add_argument("--no-persist", dest="persist", action="store_false",
+                        help="leave out the database transition of every match (coordination only)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.workers.split(",")]
+    stream = _events(args.drivers, args.events, args.order_every, args.spread, args.step, args.seed)
+    print(f"{args.events:,} events, {args.drivers:,} drivers, {args.area_deg} deg areas, matches "
+          f"{'persisted to one SQLite database' if args.persist else 'not persisted'}; "
+          f"{os.cpu_count()} CPUs available")
+    baseline = None
+    for shards in counts:
+        report = _run(shards, stream, args)
+        baseline = baseline or report["events_per_s"] / shards
+        persisted = f" (persisted {report['persisted']:,})" if args.persist else ""
+        print(f"{shards:>3} workers: {report['events_per_s']:>10,.0f} events/s "
+              f"(x{report['events_per_s'] / baseline:.2f}, ideal x{shards})  wall {report['wall_s']:.2f}s  "
+              f"busiest shard x{report['imbalance']:.2f} of its share  assigned {report['assigned']:,}{persisted}  "
+              f"handoffs {report['handoffs']:,}  leaders {report['leaders']}")
+    if max(counts) > (os.cpu_count() or 1):
+        print("⚠️ more workers than CPUs: scaling is capped by the cores available")
+
+if __name__ == "__main__":
+    main()
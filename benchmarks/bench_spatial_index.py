@@ -0,0 +1,53 @@
+# =====================================================
+# 📍 BENCHMARK: NEAREST-AVAILABLE-DRIVER LOOKUP
+# Run: python -m benchmarks.bench_spatial_index
+# =====================================================
+
+import argparse
+import heapq
+import random
+
+from benchmarks.common import random_points, summarize, time_calls
+from geo import haversine_km
+from spatial_index import DriverSpatialIndex
+
+def linear_scan(drivers, lat, lng, k):
+    """Baseline: what a full driver_locations scan costs per lookup"""
+    return heapq.nsmallest(k, ((haversine_km(lat, lng, dlat, dlng), did)
+                               for did, dlat, dlng, available in drivers if available))
+
+def run(fleet_size: int, queries: int, k: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    drivers = [(f"drv_{i}", lat, lng, rng.random() < 0.8)
+               for i, (lat, lng) in enumerate(random_points(fleet_size, rng))]
+    index = DriverSpatialIndex()
+    for driver_id, lat, lng, available in drivers:
+        index.upsert(driver_id, lat, lng, available)
+
+    points = random_points(queries, rng)
+    indexed = summarize(time_calls(index.nearest, [(lat, lng, k) for lat, lng in points]))
+
+    # Interleave moves with lookups to show incremental maintenance cost
+    moves = [(drivers[rng.randrange(fleet_size)][0], lat, lng, True) for lat, lng in random_points(queries, rng)]
+    updates = summarize(time_calls(index.upsert, moves))
+
+    scan_points = points[: max(10, queries // 50)]
+    scan = summarize(time_calls(linear_scan, [(drivers, lat, lng, k) for lat, lng in scan_points]))
+    return {"fleet": fleet_size, "nearest": indexed, "upsert": updates, "linear_scan": scan}
+
+def main():
+    parser = argparse.ArgumentParser(description="k-nearest driver lookup latency")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'drivers':>8} | {'nearest p50':>11} {'p99':>9} | {'upsert p99':>10} | {'scan p99':>10}  (µs)")
+    for size in (int(s) for s in args.sizes.split(",")):
+        result = run(size, args.queries, args.k, args.seed)
+        print(f"{size:>8} | {result['nearest']['p50_us']:>11.1f} {result['nearest']['p99_us']:>9.1f} | "
+              f"{result['upsert']['p99_us']:>10.1f} | {result['linear_scan']['p99_us']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# =====================================================
+# 🧭 BENCHMARK: TRAJECTORY STORE VS LOCATION TABLES
+# Bytes per million fixes on disk and in memory, trip replay
+# ("driver X between t1 and t2") and "drivers in a bbox at time t"
+# Run: python -m benchmarks.bench_trajectory [--drivers 1000 --fixes 1000]
+# =====================================================
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.common import CITY_LAT, CITY_LNG, summarize
+
+START = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+def _fixes(drivers: int, fixes: int, interval: float, seed: int):
+    """Random-walking drivers reporting every `interval` seconds, in arrival (time) order"""
+    rng = np.random.default_rng(seed)
+    lat = CITY_LAT + rng.normal(0, 0.08, drivers) + np.cumsum(rng.normal(0, 0.0004, (fixes, drivers)), axis=0)
+    lng = CITY_LNG + rng.normal(0, 0.08, drivers) + np.cumsum(rng.normal(0, 0.0004, (fixes, drivers)), axis=0)
+    offsets = np.arange(fixes)[:, None] * interval + rng.uniform(0, interval, drivers)[None, :]
+    ids = np.array([f"d{i:06d}" for i in range(drivers)], dtype=object)
+    return np.tile(ids, fixes), lat.ravel(), lng.ravel(), START.timestamp() + offsets.ravel()
+
+def _as_text(epoch: np.ndarray) -> list:
+    """SQLAlchemy's SQLite DATETIME text"""
+    stamps = (epoch * 1e6).astype("datetime64[us]")
+    return [t.replace("T", " ") for t in np.datetime_as_string(stamps, unit="us").tolist()]
+
+def _table_bytes(conn, table) -> int:
+    names = [table.name] + [index.name for index in table.indexes]
+    if table.name == "driver_locations":
+        names.append("sqlite_autoindex_driver_locations_1")
+    placeholders = ", ".join("?" * len(names))
+    return conn.exec_driver_sql(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({placeholders})",
+                                tuple(names)).scalar() or 0
+
+def _time(samples: list, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    samples.append(time.perf_counter() - started)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar trajectory store vs driver_location_history")
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--fixes", type=int, default=1000, help="fixes per driver")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between a driver's fixes")
+    parser.add_argument("--window", type=float, default=1800.0, help="trip replay window in seconds")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--sql-queries", type=int, default=20, help="bbox queries against SQL (full scans)")
+    parser.add_argument("--orm-sample", type=int, default=100000, help="ORM rows loaded to measure RAM")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taxi-trajectory-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'locations.db')}"
+    import taxi
+    from seeding import bulk_insert, synthetic_ids
+    from location_ingest import LocationFix
+    from trajectory_store import TrajectoryStore
+
+    ids, lat, lng, at = _fixes(args.drivers, args.fixes, args.interval, args.seed)
+    points = ids.size
+    per_million = 1e6 / points
+    print(f"{points:,} fixes: {args.drivers:,} drivers x {args.fixes:,}, one every {args.interval:.0f}s")
+
+    # ---------- trajectory store ----------
+    store = TrajectoryStore(os.path.join(workdir, "trajectories"), seal_delay=0)
+    fixes = [LocationFix(driver_id, fix_lat, fix_lng, recorded_at=t)
+             for driver_id, fix_lat, fix_lng, t in zip(ids.tolist(), lat.tolist(), lng.tolist(), at.tolist())]
+    started = time.perf_counter()
+    # Batches the size of one ingestor flush, journaled like in the bot
+    for i in range(0, points, args.drivers):
+        store.record_fixes(fixes[i:i + args.drivers])
+    append_s = time.perf_counter() - started
+    del fixes
+    started = time.perf_counter()
+    store.flush()
+    seal_s = time.perf_counter() - started
+    stats = store.stats()
+    print(f"\ntrajectory store: appended {points / append_s:,.0f} fixes/s, sealed {stats['partitions']} "
+          f"partitions in {seal_s:.2f}s")
+
+    # ---------- current tables ----------
+    taxi.prepare_database()
+    history, locations = taxi.DriverLocationHistory.__table__, taxi.DriverLocation.__table__
+    stamps = _as_text(at)
+    started = time.perf_counter()
+    with taxi.engine.begin() as conn:
+        chunk = 100000
+        for i in range(0, points, chunk):
+            sl = slice(i, i + chunk)
+            bulk_insert(conn, history, ("driver_id", "latitude", "longitude", "recorded_at"),
+                        list(zip(ids[sl].tolist(), lat[sl].tolist(), lng[sl].tolist(), stamps[sl])))
+            bulk_insert(conn, locations, ("id", "driver_id", "latitude", "longitude", "is_available", "updated_at"),
+                        list(zip(synthetic_ids(args.seed, "position", np.arange(i, min(i + chunk, points))),
+                                 ids[sl].tolist(), lat[sl].tolist(), lng[sl].tolist(),
+                                 [1] * len(stamps[sl]), stamps[sl])))
+    load_s = time.perf_counter() - started
+    with taxi.engine.connect() as conn:
+        history_bytes, location_bytes = _table_bytes(conn, history), _table_bytes(conn, locations)
+    print(f"SQLite: loaded both tables in {load_s:.1f}s")
+
+    sample = min(args.orm_sample, points)
+    with taxi.SessionLocal() as db:
+        tracemalloc.start()
+        rows = db.query(taxi.DriverLocation).limit(sample).all()
+        orm_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del rows
+
+    print("\nper million fixes (the store's files are memory-mapped as they are):")
+    print(f"  trajectory store on disk     {stats['disk_bytes'] * per_million / 2**20:8.1f} MB "
+          f"({stats['bytes_per_point']:.1f} B/fix)")
+    print(f"  driver_location_history      {history_bytes * per_million / 2**20:8.1f} MB "
+          f"({history_bytes / points:.1f} B/fix, table + index)")
+    print(f"  driver_locations (uuid key)  {location_bytes * per_million / 2**20:8.1f} MB "
+          f"({location_bytes / points:.1f} B/fix, table + indexes)")
+    print(f"  DriverLocation ORM objects   {orm_bytes / sample * 1e6 / 2**20:8.1f} MB "
+          f"({orm_bytes / sample:.0f} B/fix, measured on {sample:,})")
+
+    # ---------- queries ----------
+    rng = random.Random(args.seed)
+    first, last = float(at.min()), float(at.max())
+    drivers = sorted(set(ids[:args.drivers].tolist()))
+    trips = [(rng.choice(drivers), rng.uniform(first, last - args.window)) for _ in range(args.queries)]
+    store_trip, sql_trip, mismatches = [], [], 0
+    trip_sql = ("SELECT recorded_at, latitude, longitude FROM driver_location_history "
+                "WHERE driver_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at")
+    with taxi.engine.connect() as conn:
+        for driver_id, t1 in trips:
+            track = _time(store_trip, store.trajectory, driver_id, t1, t1 + args.window)
+            bounds = _as_text(np.array([t1, t1 + args.window]))
+            rows = _time(sql_trip, lambda: conn.exec_driver_sql(trip_sql, (driver_id, *bounds)).fetchall())
+            mismatches += abs(len(rows) - track.times.size) > 1  # ms vs us rounding at the window edges
+        bbox = (CITY_LAT - 0.05, CITY_LNG - 0.05, CITY_LAT + 0.05, CITY_LNG + 0.05)
+        store_bbox, sql_bbox, counts = [], [], []
+        bbox_sql = ("SELECT h.driver_id, h.latitude, h.longitude FROM driver_location_history h JOIN "
+                    "(SELECT driver_id, MAX(recorded_at) AS at FROM driver_location_history "
+                    " WHERE recorded_at BETWEEN ? AND ? GROUP BY driver_id) latest "
+                    "ON h.driver_id = latest.driver_id AND h.recorded_at = latest.at "
+                    "WHERE h.latitude BETWEEN ? AND ? AND h.longitude BETWEEN ? AND ?")
+        moments = [rng.uniform(first + 60, last) for _ in range(args.queries)]
+        for i, moment in enumerate(moments):
+            found = _time(store_bbox, store.positions_at, moment, bbox, 60.0)
+            if i < args.sql_queries:
+                bounds = _as_text(np.array([moment - 60.0, moment]))
+                rows = _time(sql_bbox, lambda: conn.exec_driver_sql(
+                    bbox_sql, (*bounds, bbox[0], bbox[2], bbox[1], bbox[3])).fetchall())
+                counts.append((len(found.driver_ids), len(rows)))
+
+    def line(label, samples):
+        s = summarize(samples)
+        print(f"  {label:<34} p50 {s['p50_us'] / 1000:9.3f} ms  p95 {s['p95_us'] / 1000:9.3f} ms")
+
+    print(f"\ntrip replay ({args.window / 60:.0f} min of one driver):")
+    line("trajectory store", store_trip)
+    line("driver_location_history (SQL)", sql_trip)
+    print("drivers in a 0.1 deg bbox at time t (last fix within 60s):")
+    line("trajectory store", store_bbox)
+    line("driver_location_history (SQL)", sql_bbox)
+    agree = sum(1 for a, b in counts if abs(a - b) <= 1)
+    print(f"\nresults agree: trips {args.queries - mismatches}/{args.queries}, bbox {agree}/{len(counts)}")
+
+if __name__ == "__main__":
+    main()
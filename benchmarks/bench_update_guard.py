@@ -0,0 +1,146 @@
+# =====================================================
+# 🚦 BENCHMARK: BUTTON SPAM VS THE UPDATE MIDDLEWARE
+# Users hammer the same role button against a Bot API stand-in
+# that enforces flood limits; compares the bot with and without
+# the per-user guard and the send scheduler.
+# Run: python -m benchmarks.bench_update_guard [--users 100 --taps 20]
+# =====================================================
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.synthetic_updates import USER_ID_BASE, callback_update, message_update
+
+TEST_TOKEN = "123456:GUARDTEST"
+
+def _payloads(users: int, taps: int):
+    """/start per user, then `taps` presses of one role button, interleaved across users"""
+    payloads, update_id = [], 1
+    for i in range(users):
+        payloads.append(message_update(update_id, USER_ID_BASE + i, "/start"))
+        update_id += 1
+    for _ in range(taps):
+        for i in range(users):
+            payloads.append(callback_update(update_id, USER_ID_BASE + i, "role_customer"))
+            update_id += 1
+    return payloads
+
+async def _run(limits: bool, args) -> dict:
+    import bot
+    import taxi
+    from sqlalchemy import event
+    from telegram import Update
+    from update_processing import ChatOrderedUpdateProcessor
+
+    writes = Counter()
+
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(" ", 1)[0].upper()
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            writes[verb] += 1
+
+    taxi.prepare_database()
+    with taxi.engine.begin() as conn:
+        # Every run starts with unregistered users
+        conn.execute(taxi.User.__table__.delete())
+    taxi.user_cache.clear()
+    engines = {taxi.async_engine.sync_engine, taxi.async_writer_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count_writes)
+
+    payloads = _payloads(args.users, args.taps)
+    processor = ChatOrderedUpdateProcessor(args.workers, len(payloads))
+    finished = 0
+    done = asyncio.Event()
+    errors = Counter()
+
+    def observe(update, _seconds):
+        nonlocal finished
+        finished += 1
+        if finished + processor.rejected >= len(payloads):
+            done.set()
+
+    processor.latency_observer = observe
+
+    async def on_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    async with FakeBotAPI(latency=args.api_latency, flood_limit=args.flood_limit,
+                          chat_flood_limit=args.chat_flood_limit) as api:
+        application = bot.build_application(TEST_TOKEN, base_url=api.base_url, update_processor=processor,
+                                            limits=limits)
+        application.add_error_handler(on_error)
+        await application.initialize()
+        await application.start()
+        try:
+            started = time.perf_counter()
+            for payload in payloads:
+                application.update_queue.put_nowait(Update.de_json(payload, application.bot))
+            deadline = started + args.timeout
+            # Rejected updates never reach the observer; poll for them too
+            while finished + processor.rejected < len(payloads) and time.perf_counter() < deadline:
+                try:
+                    await asyncio.wait_for(done.wait(), timeout=0.05)
+                except asyncio.TimeoutError:
+                    pass
+            elapsed = time.perf_counter() - started
+            scheduler = application.bot.rate_limiter
+            scheduler_stats = scheduler.stats() if scheduler else None
+        finally:
+            await application.stop()
+            await application.shutdown()
+            await taxi.dispose_engines()
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", count_writes)
+
+    guard = application.bot_data.get("update_guard")
+    return {
+        "elapsed_s": elapsed,
+        "api_calls": dict(api.calls),
+        "flooded": sum(api.flooded.values()),
+        "db_writes": dict(writes),
+        "handler_errors": dict(errors),
+        "rejected": processor.rejected,
+        "guard": guard.stats() if guard else None,
+        "scheduler": scheduler_stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Button spam with and without the update middleware")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--taps", type=int, default=20, help="presses of the same button per user")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--flood-limit", type=int, default=30, help="API calls per second before 429")
+    parser.add_argument("--chat-flood-limit", type=int, default=3, help="API calls per chat per second before 429")
+    parser.add_argument("--api-latency", type=float, default=0.005)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taxi-guard-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'guard.db')}")
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    async def run_all():
+        return [(label, await _run(limits, args)) for label, limits in (("no middleware", False),
+                                                                          ("guard + scheduler", True))]
+
+    print(f"{args.users} users x {args.taps} taps of role_customer; API allows {args.flood_limit}/s overall, "
+          f"{args.chat_flood_limit}/s per chat")
+    for label, report in asyncio.run(run_all()):
+        print(f"{label}:")
+        print(f"  finished in {report['elapsed_s']:.2f}s  api calls {report['api_calls']}")
+        print(f"  429 responses {report['flooded']}  handler errors {report['handler_errors'] or 0}  "
+              f"db writes {report['db_writes']}")
+        if report["guard"]:
+            print(f"  guard {report['guard']}")
+            print(f"  scheduler {report['scheduler']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# =====================================================
+# 📈 BENCHMARK HELPERS
+# =====================================================
+
+import random
+import time
+from typing import Callable, Dict, List, Sequence
+
+# Tashkent city centre, used as the synthetic fleet origin
+CITY_LAT = 41.3111
+CITY_LNG = 69.2797
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(pct / 100.0 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[rank]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latency samples given in seconds, reported in microseconds"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_us": percentile(ordered, 50) * 1e6,
+        "p95_us": percentile(ordered, 95) * 1e6,
+        "p99_us": percentile(ordered, 99) * 1e6,
+        "max_us": (ordered[-1] if ordered else 0.0) * 1e6,
+    }
+
+def time_calls(fn: Callable, args_list: Sequence[tuple]) -> List[float]:
+    """Latency of fn(*args) for each args tuple"""
+    samples = []
+    clock = time.perf_counter
+    for args in args_list:
+        t0 = clock()
+        fn(*args)
+        samples.append(clock() - t0)
+    return samples
+
+def random_points(n: int, rng: random.Random, spread_deg: float = 0.25) -> List[tuple]:
+    """n random (lat, lng) points around the city centre"""
+    return [
+        (CITY_LAT + rng.uniform(-spread_deg, spread_deg), CITY_LNG + rng.uniform(-spread_deg, spread_deg))
+        for _ in range(n)
+    ]
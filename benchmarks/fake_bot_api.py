@@ -0,0 +1,145 @@
+# =====================================================
+# 🧪 LOCAL TELEGRAM BOT API STAND-IN
+# Minimal HTTP/1.1 server answering the Bot API methods the bot uses
+# =====================================================
+
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Taxi Bot", "username": "taxi_test_bot"}
+
+class FakeBotAPI:
+    """Answers getMe/sendMessage/editMessageText/... with canned successes
+
+    Point the bot at it with Application.builder().base_url(server.base_url).
+    `latency` adds a fixed delay per call to mimic the real API round trip.
+    With flood limits set, calls beyond `flood_limit` per second overall or
+    `chat_flood_limit` per second in one chat get a 429 with retry_after,
+    like the real API.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 flood_limit: int = 0, chat_flood_limit: int = 0, retry_after: int = 1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.chat_flood_limit = chat_flood_limit
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.flooded: Counter = Counter()
+        self._second = 0
+        self._in_second: Counter = Counter()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._message_id = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> "FakeBotAPI":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeBotAPI":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+
+                method = path.rsplit("/", 1)[-1]
+                params = _parse_params(body, headers.get("content-type", ""))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status = b"200 OK"
+                if self._over_limit(method, params):
+                    self.flooded[method] += 1
+                    status = b"429 Too Many Requests"
+                    payload = json.dumps({
+                        "ok": False, "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    }).encode()
+                else:
+                    payload = json.dumps({"ok": True, "result": self._result(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _over_limit(self, method: str, params: dict) -> bool:
+        """Counts calls per wall-clock second, overall and per chat"""
+        if not (self.flood_limit or self.chat_flood_limit) or method in ("getMe", "getUpdates"):
+            return False
+        second = int(time.time())
+        if second != self._second:
+            self._second = second
+            self._in_second.clear()
+        chat = params.get("chat_id")
+        self._in_second[None] += 1
+        if chat is not None:
+            self._in_second[str(chat)] += 1
+        return bool((self.flood_limit and self._in_second[None] > self.flood_limit)
+                    or (self.chat_flood_limit and chat is not None
+                        and self._in_second[str(chat)] > self.chat_flood_limit))
+
+    def _result(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0) or 0)
+            return {
+                "message_id": int(params.get("message_id", self._message_id) or self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if method == "getUpdates":
+            return []
+        # answerCallbackQuery, setWebhook, deleteWebhook, ...
+        return True
+
+def _parse_params(body: bytes, content_type: str) -> dict:
+    if not body:
+        return {}
+    if "json" in content_type:
+        return json.loads(body)
+    if "urlencoded" in content_type:
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+    return {}
@@ -0,0 +1,160 @@
+# =====================================================
+# 🔥 LOAD TEST: BOT UPDATE THROUGHPUT
+# Replays synthetic updates through the real handlers against a
+# local Bot API stand-in and reports updates/sec and tail latency.
+# Run: python -m benchmarks.loadtest_bot --updates 5000 --workers 32
+# =====================================================
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, List, Optional
+
+from benchmarks.common import summarize
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.synthetic_updates import update_kind, user_journeys
+
+TEST_TOKEN = "123456:LOADTEST"
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run(args, payloads: Optional[List[dict]] = None, kind_of: Callable[[dict], str] = update_kind) -> dict:
+    """Replay payloads (default: user_journeys from args) and report throughput and latency per kind"""
+    import bot
+    import taxi
+    from telegram import Update
+    from update_processing import ChatOrderedUpdateProcessor
+
+    taxi.prepare_database()
+    if payloads is None:
+        payloads = user_journeys(args.users, args.updates, args.seed)
+    kinds = {p["update_id"]: kind_of(p) for p in payloads}
+    sent_at = {}
+    latencies = defaultdict(list)
+    done = asyncio.Event()
+    finished = 0
+
+    processor = ChatOrderedUpdateProcessor(args.workers, args.queue)
+
+    def observe(update, _handler_seconds):
+        nonlocal finished
+        started = sent_at.get(update.update_id)
+        if started is not None:
+            latencies[kinds[update.update_id]].append(time.perf_counter() - started)
+        finished += 1
+        if finished + processor.shed + processor.rejected >= len(payloads):
+            done.set()
+
+    processor.latency_observer = observe
+
+    async with FakeBotAPI(latency=args.api_latency) as api:
+        application = bot.build_application(TEST_TOKEN, base_url=api.base_url, update_processor=processor,
+                                            limits=args.limits)
+        await application.initialize()
+        await application.start()
+        try:
+            started = time.perf_counter()
+            if args.mode == "webhook":
+                await _replay_webhook(application, payloads, sent_at, args)
+            else:
+                for payload in payloads:
+                    sent_at[payload["update_id"]] = time.perf_counter()
+                    application.update_queue.put_nowait(Update.de_json(payload, application.bot))
+                    if args.rate:
+                        await asyncio.sleep(1.0 / args.rate)
+            # Shed and rejected updates never reach the observer; poll for them too
+            while not done.is_set():
+                if finished + processor.shed + processor.rejected >= len(payloads):
+                    break
+                try:
+                    await asyncio.wait_for(done.wait(), timeout=0.05)
+                except asyncio.TimeoutError:
+                    pass
+            elapsed = time.perf_counter() - started
+        finally:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            # post_shutdown only runs under run_polling/run_webhook
+            await taxi.dispose_engines()
+
+    report = {
+        "mode": args.mode,
+        "updates": len(payloads),
+        "users": args.users,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(finished / elapsed, 1) if elapsed else 0.0,
+        "processor": processor.stats(),
+        "api_calls": dict(api.calls),
+        "latency": {kind: summarize(samples) for kind, samples in latencies.items()},
+    }
+    return report
+
+async def _replay_webhook(application, payloads, sent_at, args) -> None:
+    import httpx
+
+    port = _free_port()
+    await application.updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram",
+                                            webhook_url=f"http://127.0.0.1:{port}/telegram")
+    url = f"http://127.0.0.1:{port}/telegram"
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    gate = asyncio.Semaphore(args.connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def post(payload):
+            async with gate:
+                sent_at[payload["update_id"]] = time.perf_counter()
+                await client.post(url, content=json.dumps(payload),
+                                  headers={"Content-Type": "application/json"})
+
+        tasks = []
+        for payload in payloads:
+            tasks.append(asyncio.create_task(post(payload)))
+            if args.rate:
+                await asyncio.sleep(1.0 / args.rate)
+        await asyncio.gather(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic Telegram updates through the bot")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--queue", type=int, default=1000)
+    parser.add_argument("--mode", choices=["queue", "webhook"], default="queue")
+    parser.add_argument("--connections", type=int, default=40, help="webhook mode: parallel POSTs")
+    parser.add_argument("--rate", type=float, default=0.0, help="updates/sec to offer (0 = as fast as possible)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument("--limits", action="store_true",
+                        help="keep the per-user guard and send scheduler (synthetic users tap at machine speed)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args = parser.parse_args()
+
+    # Fresh database per run unless one is configured explicitly
+    workdir = tempfile.mkdtemp(prefix="taxi_loadtest_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'loadtest.db')}")
+
+    import logging
+    logging.disable(logging.INFO)
+    report = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['updates']} updates, {report['users']} users, {report['workers']} workers ({report['mode']})")
+    print(f"throughput: {report['updates_per_s']} updates/s in {report['elapsed_s']}s; processor: {report['processor']}")
+    for kind, stats in sorted(report["latency"].items()):
+        print(f"  {kind:<16} n={stats['count']:<6} p50={stats['p50_us'] / 1000:.2f}ms "
+              f"p95={stats['p95_us'] / 1000:.2f}ms p99={stats['p99_us'] / 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
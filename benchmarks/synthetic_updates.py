@@ -0,0 +1,122 @@
+# =====================================================
+# 🧪 SYNTHETIC TELEGRAM UPDATES
+# Raw Bot API payloads for replaying user traffic
+# =====================================================
+
+import random
+import time
+from typing import Iterator, List
+
+from benchmarks.fake_bot_api import BOT_USER
+
+# Telegram user ids for synthetic users start here
+USER_ID_BASE = 700000000
+
+ROLE_CALLBACKS = ["role_customer", "role_driver", "role_dispatcher", "role_admin"]
+MENU_CALLBACKS = ["customer_order", "driver_earnings", "admin_users", "dispatcher_orders",
+                  "customer_history", "driver_rating", "back_to_menu"]
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """A private-chat text message (commands get a bot_command entity)"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """An inline-keyboard button press on a bot message"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        },
+    }
+
+def update_kind(payload: dict) -> str:
+    """Handler an update is routed to: start / select_role / profile / button_callback / message"""
+    if "callback_query" in payload:
+        return "select_role" if payload["callback_query"]["data"] in ROLE_CALLBACKS else "button_callback"
+    text = payload["message"]["text"]
+    if text.startswith("/start") or text.startswith("/role"):
+        return "start"
+    if text.startswith("/profile"):
+        return "profile"
+    return "message"
+
+def user_journeys(users: int, total: int, seed: int = 42) -> List[dict]:
+    """Interleaved sessions: /start, pick a role, browse menus, open /profile"""
+    rng = random.Random(seed)
+    sessions: List[Iterator[dict]] = []
+    update_id = 1
+
+    def session(user_id: int) -> Iterator[dict]:
+        yield ("message", "/start")
+        yield ("callback", rng.choice(ROLE_CALLBACKS))
+        while True:
+            roll = rng.random()
+            if roll < 0.7:
+                yield ("callback", rng.choice(MENU_CALLBACKS))
+            elif roll < 0.85:
+                yield ("message", "/start")
+            else:
+                yield ("message", "/profile")
+
+    sessions = [session(USER_ID_BASE + i) for i in range(users)]
+    payloads = []
+    while len(payloads) < total:
+        user_index = rng.randrange(users)
+        kind, value = next(sessions[user_index])
+        user_id = USER_ID_BASE + user_index
+        if kind == "message":
+            payloads.append(message_update(update_id, user_id, value))
+        else:
+            payloads.append(callback_update(update_id, user_id, value))
+        update_id += 1
+    return payloads
+
+def onboarding(users: int, seed: int = 42) -> List[dict]:
+    """Every user's first visit: /start, then a role button; users interleaved, each in order"""
+    rng = random.Random(seed)
+    visits = [i for i in range(users) for _ in range(2)]
+    rng.shuffle(visits)
+    started = set()
+    payloads = []
+    for update_id, user_index in enumerate(visits, start=1):
+        user_id = USER_ID_BASE + user_index
+        if user_index in started:
+            payloads.append(callback_update(update_id, user_id, rng.choice(ROLE_CALLBACKS)))
+        else:
+            started.add(user_index)
+            payloads.append(message_update(update_id, user_id, "/start"))
+    return payloads
+
+def profile_views(users: int, total: int, seed: int = 42) -> List[dict]:
+    """/profile from random (already registered) users"""
+    rng = random.Random(seed)
+    return [message_update(update_id, USER_ID_BASE + rng.randrange(users), "/profile")
+            for update_id in range(1, total + 1)]
+
+def menu_taps(users: int, total: int, seed: int = 42) -> List[dict]:
+    """Menu buttons and back_to_menu from random (already registered) users"""
+    rng = random.Random(seed)
+    return [callback_update(update_id, USER_ID_BASE + rng.randrange(users), rng.choice(MENU_CALLBACKS))
+            for update_id in range(1, total + 1)]
@@ -0,0 +1,358 @@
+# =====================================================
+# 🤖 TELEGRAM BOT
+# Handlers, application wiring and the long-running services
+# Run: python taxi.py (startup phase first, then this bot)
+# =====================================================
+
+import asyncio
+import logging
+from datetime import timezone
+from functools import partial
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.constants import ParseMode
+
+from menus import (HELP_TEXT, NOT_REGISTERED_TEXT, ROLE_CALLBACKS, UNKNOWN_MESSAGE_TEXT, WELCOME_TEXT,
+                   MenuRegistry, render_profile)
+from metrics import LoopLagMonitor, MetricsServer, SamplingProfiler, timed
+from middleware import SendScheduler, UpdateGuard
+from order_lifecycle import add_driver_listener
+from realtime import SSEServer
+from taxi import (Config, UserRole, create_or_update_user, dispose_engines, get_user_by_telegram, metrics,
+                  with_db_session)
+from update_processing import ChatOrderedUpdateProcessor
+from user_cache import UserSnapshot
+
+logger = logging.getLogger(__name__)
+
+handler_latency = metrics.histogram("taxi_handler_seconds", "Bot handler latency", ("handler",))
+
+# =====================================================
+# 🤖 TELEGRAM BOT HANDLERS
+# =====================================================
+
+# Keyboards and static texts, built once from Config
+menus = MenuRegistry(Config)
+
+@timed(handler_latency, "start")
+@with_db_session
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /start command - Show role selection"""
+    telegram_id = update.effective_user.id
+
+    # Get or create user
+    user = await get_user_by_telegram(telegram_id)
+
+    if user:
+        await show_role_menu(update, context, user)
+    else:
+        # Show welcome message and role selection
+        await update.message.reply_text(
+            WELCOME_TEXT,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=menus.welcome_keyboard
+        )
+
+@timed(handler_latency, "show_role_menu")
+async def show_role_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, user: UserSnapshot) -> None:
+    """Show menu based on user role"""
+    menu = menus.role_menu(user.role)
+    menu_text = menu.render(user.phone, user.created_at)
+
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            menu_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=menu.keyboard
+        )
+    else:
+        await update.message.reply_text(
+            menu_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=menu.keyboard
+        )
+
+@timed(handler_latency, "select_role")
+async def select_role(update: Update, context: ContextTypes.DEFAULT_TYPE, role: UserRole) -> None:
+    """Role button - register the user and show their menu"""
+    telegram_id = update.effective_user.id
+    telegram_username = update.effective_user.username or update.effective_user.first_name
+    user = await get_user_by_telegram(telegram_id)
+    if user is None or user.telegram_username != telegram_username:
+        # Known users with an unchanged username have nothing to write
+        user = await create_or_update_user(telegram_id, telegram_username, role)
+    await show_role_menu(update, context, user)
+
+@timed(handler_latency, "back_to_menu")
+async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Back button - return to the user's role menu"""
+    user = await get_user_by_telegram(update.effective_user.id)
+    if user:
+        await show_role_menu(update, context, user)
+
+@timed(handler_latency, "driver_location")
+@with_db_session
+async def driver_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Location or live-location update from a driver - hand it to the location ingestor"""
+    message = update.effective_message
+    if message is None or message.location is None:
+        return
+    user = await get_user_by_telegram(update.effective_user.id)
+    if user is None or user.role != UserRole.DRIVER:
+        return
+    from taxi import location_ingestor
+    sent = message.edit_date or message.date
+    location_ingestor.submit(user.id, message.location.latitude, message.location.longitude,
+                             recorded_at=sent.astimezone(timezone.utc).replace(tzinfo=None))
+
+# Callback data -> handler; anything else is a static screen from the menu registry
+CALLBACK_ROUTES = {
+    data: partial(select_role, role=UserRole(role_value))
+    for data, role_value in ROLE_CALLBACKS.items()
+}
+CALLBACK_ROUTES["back_to_menu"] = back_to_menu
+
+@timed(handler_latency, "button_callback")
+@with_db_session
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle button clicks"""
+    query = update.callback_query
+    await query.answer()
+
+    route = CALLBACK_ROUTES.get(query.data)
+    if route is not None:
+        await route(update, context)
+        return
+
+    text, reply_markup = menus.screen(query.data)
+    await query.edit_message_text(
+        text,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup
+    )
+
+@timed(handler_latency, "help_command")
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /help command"""
+    await update.message.reply_text(HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
+
+@timed(handler_latency, "profile_command")
+@with_db_session
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /profile command"""
+    telegram_id = update.effective_user.id
+    user = await get_user_by_telegram(telegram_id)
+
+    if not user:
+        await update.message.reply_text(NOT_REGISTERED_TEXT)
+        return
+
+    await update.message.reply_text(
+        render_profile(user), parse_mode=ParseMode.MARKDOWN, reply_markup=menus.profile_keyboard
+    )
+
+@timed(handler_latency, "handle_message")
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle regular messages"""
+    message_text = update.message.text.lower()
+
+    if message_text in ["salom", "hi", "hello", "assalom"]:
+        await start(update, context)
+    else:
+        await update.message.reply_text(UNKNOWN_MESSAGE_TEXT)
+
+# =====================================================
+# 🚀 BOT STARTUP
+# =====================================================
+
+async def start_services(application: Optional[Application] = None) -> None:
+    """Application post_init hook: real-time push, call intake and metrics"""
+    await start_realtime(application)
+    await start_location_ingest(application)
+    await start_call_intake(application)
+    await start_metrics(application)
+
+async def start_metrics(application: Optional[Application] = None) -> Optional[MetricsServer]:
+    """Watch event-loop lag; serve /metrics when METRICS_PORT is set"""
+    monitor = LoopLagMonitor(metrics, Config.LOOP_LAG_INTERVAL).start()
+    server = None
+    if Config.METRICS_PORT:
+        profiler = SamplingProfiler(Config.PROFILER_INTERVAL_MS / 1000) if Config.PROFILER_ENABLED else None
+        server = await MetricsServer(metrics, Config.METRICS_HOST, Config.METRICS_PORT, profiler).start()
+    if application is not None:
+        application.bot_data["loop_lag_monitor"] = monitor
+        application.bot_data["metrics_server"] = server
+    return server
+
+async def start_realtime(application: Optional[Application] = None) -> Optional[SSEServer]:
+    """Serve realtime_hub over SSE when REALTIME_PORT is set (Application post_init hook)"""
+    if not Config.REALTIME_PORT:
+        return None
+    from taxi import realtime_hub
+    server = await SSEServer(realtime_hub, Config.REALTIME_HOST, Config.REALTIME_PORT).start()
+    heatmap_task = asyncio.create_task(publish_heatmap())
+    if application is not None:
+        application.bot_data["realtime_server"] = server
+        application.bot_data["heatmap_task"] = heatmap_task
+    return server
+
+async def start_location_ingest(application: Optional[Application] = None):
+    """Flush driver fixes in the background; every flush feeds the live views and the trajectory store"""
+    from taxi import demand_heatmap, driver_index, location_ingestor, realtime_hub, shard_router, trajectory_store
+    location_ingestor.add_listener(driver_index.apply_fixes)
+    location_ingestor.add_listener(realtime_hub.publish_driver_positions)
+    location_ingestor.add_listener(demand_heatmap.observe_drivers)
+    location_ingestor.add_listener(trajectory_store.record_fixes)
+    if shard_router is not None:
+        # Sent from the router's own thread, never from the event loop
+        shard_router.start()
+        location_ingestor.add_listener(shard_router.driver_locations)
+    # Fixes leave availability alone; trips starting and ending change it
+    add_driver_listener(driver_index.set_available)
+    add_driver_listener(demand_heatmap.set_driver_available)
+    if shard_router is not None:
+        add_driver_listener(shard_router.driver_available)
+    await location_ingestor.start()
+    trajectory_task = asyncio.create_task(seal_trajectories())
+    if application is not None:
+        application.bot_data["location_ingestor"] = location_ingestor
+        application.bot_data["trajectory_task"] = trajectory_task
+        application.bot_data["trajectory_store"] = trajectory_store
+        application.bot_data["shard_router"] = shard_router
+    return location_ingestor
+
+async def seal_trajectories(interval: Optional[float] = None) -> None:
+    """Write finished trajectory partitions to disk, off the event loop"""
+    from taxi import trajectory_store
+    interval = interval or Config.TRAJECTORY_SEAL_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            written = await asyncio.to_thread(trajectory_store.seal)
+        except Exception as e:
+            logger.error(f"❌ Trajectory seal failed: {e}")
+            continue
+        if written:
+            logger.info(f"🧭 Sealed {written} trajectory fixes")
+
+async def start_call_intake(application: Optional[Application] = None):
+    """Run the dispatcher call writer and queue the calls a previous run left without an order"""
+    from taxi import call_intake
+    await call_intake.start()
+    recovered = await call_intake.recover()
+    if recovered:
+        logger.info(f"📞 Re-queued {recovered} dispatcher calls without an order")
+    if application is not None:
+        application.bot_data["call_intake"] = call_intake
+    return call_intake
+
+async def publish_heatmap(interval: Optional[float] = None, limit: int = 200) -> None:
+    """Push the hottest cells of every window to heatmap:<seconds> for the admin dashboard"""
+    from taxi import demand_heatmap, realtime_hub
+    interval = interval or Config.HEATMAP_PUBLISH_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        for window in demand_heatmap.windows:
+            rows = demand_heatmap.snapshot(window).rows(limit)
+            realtime_hub.publish(f"heatmap:{window}", "heatmap", {"window": window, "cells": rows})
+
+async def shutdown_services(application: Optional[Application] = None) -> None:
+    """Stop the endpoints, background feeds and writers, close the database pools
+
+    Application post_shutdown hook.
+    """
+    bot_data = application.bot_data if application is not None else {}
+    for task in ("heatmap_task", "trajectory_task"):
+        if task in bot_data:
+            bot_data.pop(task).cancel()
+    for key in ("location_ingestor", "call_intake", "realtime_server", "metrics_server", "loop_lag_monitor"):
+        service = bot_data.pop(key, None)
+        if service is not None:
+            await service.stop()
+    # After the ingestor's last flush: seal everything, the open partition included
+    trajectory_store = bot_data.pop("trajectory_store", None)
+    if trajectory_store is not None:
+        await asyncio.to_thread(trajectory_store.flush)
+    # Last: the ingestor's final flush may still have queued fixes for the shards
+    shard_router = bot_data.pop("shard_router", None)
+    if shard_router is not None:
+        await asyncio.to_thread(shard_router.stop)
+    await dispose_engines()
+
+def build_application(token: Optional[str] = None, base_url: Optional[str] = None,
+                      update_processor: Optional[ChatOrderedUpdateProcessor] = None,
+                      limits: bool = True) -> Application:
+    """Create the bot application with all handlers registered
+
+    limits=False leaves out the per-user guard and the send scheduler
+    (e.g. for load tests whose synthetic users tap faster than any human).
+    """
+    builder = (
+        Application.builder().token(token or Config.TELEGRAM_BOT_TOKEN)
+        .post_init(start_services).post_shutdown(shutdown_services)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if limits:
+        builder = builder.rate_limiter(SendScheduler(
+            Config.SEND_RATE_PER_SEC, Config.SEND_CHAT_RATE_PER_SEC, Config.SEND_GROUP_RATE_PER_MIN))
+    builder = builder.concurrent_updates(
+        update_processor or ChatOrderedUpdateProcessor(Config.UPDATE_WORKERS, Config.UPDATE_QUEUE_SIZE)
+    )
+    application = builder.build()
+
+    # Judges every update on arrival, before it reaches the handlers
+    if limits:
+        guard = UpdateGuard(Config.USER_RATE_PER_SEC, Config.USER_RATE_BURST, Config.CALLBACK_DEDUP_SECONDS)
+        application.update_processor.admission = guard.admit
+        application.bot_data["update_guard"] = guard
+        metrics.register_stats("taxi_update_guard", guard.stats)
+        metrics.register_stats("taxi_send_scheduler", application.bot.rate_limiter.stats)
+    else:
+        metrics.unregister_stats("taxi_update_guard")
+        metrics.unregister_stats("taxi_send_scheduler")
+    metrics.register_stats("taxi_updates", application.update_processor.stats)
+
+    # Add handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("role", start))  # Alias for /start
+
+    # Drivers' shared and live locations (edits of a live location arrive as edited messages)
+    application.add_handler(MessageHandler(filters.LOCATION, driver_location))
+
+    # Greetings are recognized inside handle_message
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+    # Callback handler for buttons
+    application.add_handler(CallbackQueryHandler(button_callback))
+    return application
+
+def run() -> None:
+    """Start the bot (after taxi.startup())"""
+    application = build_application()
+
+    logger.info("🤖 Telegram Bot started!")
+    logger.info(f"📱 Admin App: {Config.ADMIN_APP_URL}")
+    logger.info(f"👤 Customer App: {Config.CUSTOMER_APP_URL}")
+    logger.info(f"🚗 Driver App: {Config.DRIVER_APP_URL}")
+    logger.info(f"📞 Dispatcher App: {Config.DISPATCHER_APP_URL}")
+    logger.info(f"⚙️ Mode: {Config.BOT_MODE}, {Config.UPDATE_WORKERS} workers, queue {Config.UPDATE_QUEUE_SIZE}")
+
+    # Start bot
+    if Config.BOT_MODE == 'webhook':
+        if not Config.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+        application.run_webhook(
+            listen=Config.WEBHOOK_LISTEN,
+            port=Config.WEBHOOK_PORT,
+            url_path=Config.WEBHOOK_PATH,
+            webhook_url=f"{Config.WEBHOOK_URL.rstrip('/')}/{Config.WEBHOOK_PATH}",
+            secret_token=Config.WEBHOOK_SECRET_TOKEN or None,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling()
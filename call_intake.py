@@ -0,0 +1,624 @@
+# =====================================================
+# 📞 DISPATCHER CALL INTAKE
+# Prioritized, deduplicated queue of phone calls turned into orders in batches
+# =====================================================
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from itertools import count
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# Seconds of waiting a class is credited with on arrival
+DEFAULT_CLASS_HEAD_START = {"vip": 120.0, "corporate": 60.0}
+
+def normalize_phone(phone: str) -> str:
+    """"+998 90 123-45-67" and "998901234567" -> "+998901234567" """
+    digits = re.sub(r"\D", "", phone or "")
+    return f"+{digits}" if digits else (phone or "").strip()
+
+def parse_class_head_start(spec: str) -> Dict[str, float]:
+    """"vip:120,corporate:60" -> {"vip": 120.0, "corporate": 60.0}"""
+    head_start = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, seconds = item.partition(":")
+        head_start[name.strip().lower()] = float(seconds or 0)
+    return head_start
+
+class IncomingCall:
+    """One phone call taken by a dispatcher"""
+    __slots__ = ("customer_phone", "dispatcher_id", "customer_name", "customer_location", "destination",
+                 "passenger_count", "call_notes", "customer_class", "pickup_lat", "pickup_lng",
+                 "destination_lat", "destination_lng", "received_at", "call_id")
+
+    def __init__(self, customer_phone: str, dispatcher_id: str, customer_location: Optional[str] = None,
+                 destination: Optional[str] = None, customer_name: Optional[str] = None,
+                 passenger_count: int = 1, call_notes: Optional[str] = None, customer_class: str = "standard",
+                 pickup_lat: Optional[float] = None, pickup_lng: Optional[float] = None,
+                 destination_lat: Optional[float] = None, destination_lng: Optional[float] = None,
+                 received_at: Optional[datetime] = None, call_id: Optional[str] = None):
+        self.customer_phone = normalize_phone(customer_phone)
+        self.dispatcher_id = dispatcher_id
+        self.customer_location = customer_location
+        self.destination = destination
+        self.customer_name = customer_name
+        self.passenger_count = passenger_count
+        self.call_notes = call_notes
+        self.customer_class = (customer_class or "standard").lower()
+        self.pickup_lat = pickup_lat
+        self.pickup_lng = pickup_lng
+        # Both coordinate pairs known -> the order gets its estimated_price right away
+        self.destination_lat = destination_lat
+        self.destination_lng = destination_lng
+        self.received_at = received_at or datetime.utcnow()
+        # Set for calls already stored as dispatcher_calls rows (see recover)
+        self.call_id = call_id
+
+class CallOrder(NamedTuple):
+    """Outcome of one written call"""
+    call_id: str
+    order_id: str
+    customer_phone: str
+    customer_class: str
+    duplicate: bool
+    waited: float
+
+class _PendingCall:
+    """A queued customer: the first call plus the repeat calls folded into it"""
+    __slots__ = ("calls", "key", "attempts")
+
+    def __init__(self, call: IncomingCall, key: float):
+        self.calls = [call]
+        self.key = key
+        self.attempts = 0  # failed writes
+
+    @property
+    def first(self) -> IncomingCall:
+        return self.calls[0]
+
+class CallIntake:
+    """Priority queue in front of Order creation for the dispatch desk
+
+    Calls are served longest-wait first, where a customer class is
+    credited with a head start (vip callers count as having waited two
+    minutes already). Because every queued call ages at the same rate,
+    that is a heap ordered by received_at minus the head start.
+
+    One queue entry per customer_phone: a repeat call while the first is
+    still queued is folded into it (keeping its place, upgrading the
+    class, taking newer location / notes), and a repeat call while its
+    order is being written or within dedup_seconds after it was created
+    is linked to that order.
+    Every call still gets its dispatcher_calls row.
+
+    The writer takes up to batch_size entries at a time and creates the
+    missing customers, the orders and the call rows in one transaction.
+    Memory is bounded by max_pending queued customers.
+
+    A failed batch is split: each of its customers (and linked calls) is
+    retried in a transaction of its own, so one bad call cannot hold the
+    rest back. A call failing max_attempts times is quarantined: its rows
+    are stored with call_status "failed" and no order. If even that write
+    fails the call goes behind everything else queued and is retried later.
+
+    With record_received every call is stored as a "received" row (with
+    its class) as soon as it is taken: put() returns once it is, submit()
+    leaves it to the writer's next pass. Calls arriving together share
+    one commit, and recover() queues those rows again after a restart.
+    """
+
+    def __init__(self, session_factory=None, batch_size: int = 200, linger: float = 0.05,
+                 max_pending: int = 10000, dedup_seconds: float = 300.0,
+                 class_head_start: Optional[Dict[str, float]] = None, max_attempts: int = 3,
+                 record_received: bool = True, registry=None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_pending = max_pending
+        self.dedup_seconds = dedup_seconds
+        self.max_attempts = max_attempts
+        self.record_received = record_received
+        self.class_head_start = dict(DEFAULT_CLASS_HEAD_START if class_head_start is None else class_head_start)
+
+        self._heap: List[Tuple[float, int, str]] = []
+        self._pending: Dict[str, _PendingCall] = {}
+        self._in_flight: Dict[str, List[IncomingCall]] = {}  # phone -> repeat calls while its order is written
+        self._ordered: Dict[str, Tuple[str, float]] = {}
+        self._linked: List[Tuple[IncomingCall, str, int]] = []  # (call, order_id, failed writes)
+        self._unrecorded: List[IncomingCall] = []
+        self._seq = count()
+        self._listeners: List[Callable[[List[CallOrder]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+
+        self._time_to_order = None
+        if registry is not None:
+            self._time_to_order = registry.histogram(
+                "taxi_call_to_order_seconds", "Call received to order created", ("customer_class",),
+                buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+        self.submitted = 0
+        self.recorded = 0
+        self.duplicates = 0
+        self.linked = 0
+        self.rejected = 0
+        self.ordered = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.failed = 0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+        self.high_water = 0
+        self.max_wait = 0.0
+
+    @classmethod
+    def from_config(cls, **overrides) -> "CallIntake":
+        from taxi import Config
+        settings = {
+            "batch_size": Config.CALL_BATCH_SIZE,
+            "linger": Config.CALL_LINGER_MS / 1000,
+            "max_pending": Config.CALL_MAX_PENDING,
+            "dedup_seconds": Config.CALL_DEDUP_SECONDS,
+            "class_head_start": parse_class_head_start(Config.CALL_CLASS_HEAD_START),
+            "max_attempts": Config.CALL_MAX_ATTEMPTS,
+            "record_received": Config.CALL_RECORD_RECEIVED,
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    # ---------- intake ----------
+
+    def submit(self, call: IncomingCall) -> bool:
+        """Queue a call without waiting; False when it was rejected for backpressure"""
+        return self._offer(call)
+
+    async def put(self, call: IncomingCall) -> None:
+        """Queue a call, waiting for the writer while the queue is full and until its row is stored"""
+        while not self._offer(call, count_rejection=False):
+            self._space.clear()
+            await self._space.wait()
+        if self.record_received:
+            await self._record_now()
+
+    def _key(self, call: IncomingCall) -> float:
+        # received_at is naive UTC; without the tzinfo timestamp() would read it as local time
+        received = call.received_at.replace(tzinfo=timezone.utc).timestamp()
+        return received - self.class_head_start.get(call.customer_class, 0.0)
+
+    def _offer(self, call: IncomingCall, count_rejection: bool = True) -> bool:
+        phone = call.customer_phone
+        entry = self._pending.get(phone)
+        if entry is not None:
+            self._fold(entry, call)
+            self.duplicates += 1
+        elif phone in self._in_flight:
+            # The first call's order is being written: link this one to it afterwards
+            self._in_flight[phone].append(call)
+            self.duplicates += 1
+        else:
+            recent = self._ordered.get(phone)
+            if recent is not None and time.monotonic() - recent[1] <= self.dedup_seconds:
+                self._linked.append((call, recent[0], 0))
+                self.linked += 1
+            elif len(self._pending) >= self.max_pending:
+                if count_rejection:
+                    self.rejected += 1
+                return False
+            else:
+                entry = self._pending[phone] = _PendingCall(call, self._key(call))
+                heapq.heappush(self._heap, (entry.key, next(self._seq), phone))
+                self.high_water = max(self.high_water, len(self._pending))
+        if self.record_received and call.call_id is None:
+            self._unrecorded.append(call)
+        self.submitted += 1
+        self._ready.set()
+        return True
+
+    def _fold(self, entry: _PendingCall, call: IncomingCall) -> None:
+        """Merge a repeat call into the queued one; only ever moves it forward"""
+        first = entry.first
+        entry.calls.append(call)
+        for field in ("customer_location", "destination", "customer_name", "call_notes",
+                      "pickup_lat", "pickup_lng", "destination_lat", "destination_lng"):
+            value = getattr(call, field)
+            if value is not None:
+                setattr(first, field, value)
+        key = self._key(call)
+        if key < entry.key:
+            first.customer_class = call.customer_class
+            # The old heap item goes stale and is skipped when popped
+            entry.key = key
+            heapq.heappush(self._heap, (key, next(self._seq), first.customer_phone))
+
+    def _take(self, limit: int) -> List[_PendingCall]:
+        """Pop up to limit customers, highest priority first; one that failed before comes alone"""
+        batch = []
+        while self._heap and len(batch) < limit:
+            key, _, phone = self._heap[0]
+            entry = self._pending.get(phone)
+            if entry is None or entry.key != key:
+                heapq.heappop(self._heap)
+                continue
+            if entry.attempts and batch:
+                break
+            heapq.heappop(self._heap)
+            del self._pending[phone]
+            batch.append(entry)
+            if entry.attempts:
+                break
+        if not self._pending:
+            self._heap.clear()
+        return batch
+
+    def _next_batch(self) -> Tuple[List[_PendingCall], List[Tuple[IncomingCall, str, int]]]:
+        """Customers and linked calls for the next write; calls of a failed batch are retried one by one"""
+        if self._linked and self._linked[0][2]:
+            return [], [self._linked.pop(0)]
+        batch = self._take(self.batch_size)
+        if batch and batch[0].attempts:
+            return batch, []
+        linked, self._linked = self._linked, []
+        return batch, linked
+
+    def add_listener(self, callback: Callable[[List[CallOrder]], None]) -> None:
+        """Call callback(results) after every written batch (e.g. realtime pushes to the dispatcher app)"""
+        self._listeners.append(callback)
+
+    # ---------- writing ----------
+
+    async def start(self) -> None:
+        """Start the writer task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer task and write whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.drain()
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending and not self._linked:
+                self._ready.clear()
+                await self._ready.wait()
+                if self._unrecorded:
+                    await asyncio.shield(self._record_now())
+                # Let the rest of a burst arrive so it shares the transaction
+                await asyncio.sleep(self.linger)
+            try:
+                # Shielded so stop() never abandons a batch half-way through its write
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"❌ Call intake flush failed: {e}")
+                await asyncio.sleep(max(self.linger, 1.0))
+
+    async def drain(self) -> int:
+        """Write batches until the queue is empty; returns the number of calls written"""
+        written = 0
+        while self._pending or self._linked:
+            written += await self.flush()
+        return written
+
+    async def flush(self) -> int:
+        """Write one batch of the highest-priority calls; returns the number of calls written"""
+        async with self._flush_lock:
+            await self._record()
+            batch, linked = self._next_batch()
+            if not batch and not linked:
+                return 0
+            self._space.set()
+
+            attempts = max([entry.attempts for entry in batch] + [item[2] for item in linked])
+            if attempts >= self.max_attempts:
+                return await self._quarantine(batch, linked)
+
+            for entry in batch:
+                self._in_flight[entry.first.customer_phone] = []
+            started = time.perf_counter()
+            try:
+                results = await asyncio.to_thread(self._write, batch, linked)
+            except Exception:
+                self.flush_errors += 1
+                for entry in batch:
+                    entry.attempts += 1
+                    for call in self._in_flight.pop(entry.first.customer_phone, ()):
+                        self._fold(entry, call)
+                self._requeue(batch, [(call, order_id, tries + 1) for call, order_id, tries in linked])
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.batches += 1
+            self.last_batch_ms = elapsed_ms
+            self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+            now = time.monotonic()
+            for result in results:
+                if not result.duplicate:
+                    self.ordered += 1
+                    self._ordered[result.customer_phone] = (result.order_id, now)
+                    for call in self._in_flight.pop(result.customer_phone, ()):
+                        self._linked.append((call, result.order_id, 0))
+                    self.max_wait = max(self.max_wait, result.waited)
+                    if self._time_to_order is not None:
+                        self._time_to_order.observe(result.waited, result.customer_class)
+            self._forget_ordered(now)
+
+            for callback in self._listeners:
+                try:
+                    callback(results)
+                except Exception as e:
+                    logger.error(f"❌ Call intake listener failed: {e}")
+            return len(results)
+
+    async def _record_now(self) -> None:
+        async with self._flush_lock:
+            await self._record()
+
+    async def _record(self) -> None:
+        """Store calls taken since the last pass as "received" rows; caller holds the flush lock"""
+        # Calls a batch already wrote have their rows
+        calls = [call for call in self._unrecorded if call.call_id is None]
+        self._unrecorded = []
+        if not calls:
+            return
+        try:
+            await asyncio.to_thread(self._write_received, calls)
+        except Exception as e:
+            logger.warning(f"⚠️ Recording {len(calls)} received calls failed, retrying one by one: {e}")
+            for call in calls:
+                try:
+                    await asyncio.to_thread(self._write_received, [call])
+                except Exception as e:
+                    # Still queued in memory; the batch write stores its row
+                    logger.error(f"❌ Call from {call.customer_phone} not recorded, lost on a restart: {e}")
+
+    def _forget_ordered(self, now: float) -> None:
+        if len(self._ordered) <= self.max_pending:
+            return
+        cutoff = now - self.dedup_seconds
+        self._ordered = {phone: seen for phone, seen in self._ordered.items() if seen[1] >= cutoff}
+
+    def _requeue(self, batch: List[_PendingCall], linked: List[Tuple[IncomingCall, str, int]]) -> None:
+        """Put a failed batch back in front, merging calls that arrived meanwhile"""
+        for entry in batch:
+            newer = self._pending.pop(entry.first.customer_phone, None)
+            self._pending[entry.first.customer_phone] = entry
+            heapq.heappush(self._heap, (entry.key, next(self._seq), entry.first.customer_phone))
+            for call in newer.calls if newer is not None else ():
+                self._fold(entry, call)
+        self._linked = linked + self._linked
+
+    async def _quarantine(self, batch: List[_PendingCall], linked: List[Tuple[IncomingCall, str, int]]) -> int:
+        """Store the calls of a write that keeps failing as "failed", without an order"""
+        calls = [call for entry in batch for call in entry.calls] + [item[0] for item in linked]
+        try:
+            await asyncio.to_thread(self._write_failed, calls)
+        except Exception:
+            self.flush_errors += 1
+            # Not even the call rows go in: retry later, behind the calls waiting now
+            for entry in batch:
+                entry.key = time.time()
+            self._requeue(batch, [])
+            self._linked.extend(linked)
+            raise
+        self.failed += len(calls)
+        logger.error(f"❌ Quarantined {len(calls)} dispatcher calls from {calls[0].customer_phone} "
+                     f"after {self.max_attempts} failed writes (call_status 'failed')")
+        return len(calls)
+
+    def _write(self, batch: List[_PendingCall], linked: List[Tuple[IncomingCall, str, int]]) -> List[CallOrder]:
+        from sqlalchemy import insert, select
+        from taxi import Order, OrderStatus, User, UserRole
+
+        db = self._session()
+        try:
+            phones = [entry.first.customer_phone for entry in batch]
+            customers = dict(db.execute(select(User.phone, User.id).where(User.phone.in_(phones))).all()) \
+                if phones else {}
+            new_customers = []
+            for entry in batch:
+                call = entry.first
+                if call.customer_phone not in customers:
+                    customers[call.customer_phone] = str(uuid4())
+                    new_customers.append({"id": customers[call.customer_phone], "phone": call.customer_phone,
+                                          "name": call.customer_name or call.customer_phone,
+                                          "role": UserRole.CUSTOMER, "is_active": True})
+            if new_customers:
+                db.execute(insert(User), new_customers)
+
+            # ORM objects so the demand heatmap and other Order listeners see them
+            orders = []
+            links = []
+            for entry in batch:
+                call = entry.first
+                order = Order(
+                    id=str(uuid4()),
+                    customer_id=customers[call.customer_phone],
+                    dispatcher_id=call.dispatcher_id,
+                    pickup_location=call.customer_location or "",
+                    destination_location=call.destination or "",
+                    passengers_count=call.passenger_count,
+                    status=OrderStatus.PENDING,
+                    customer_phone=call.customer_phone,
+                    customer_name=call.customer_name,
+                    customer_comment=call.call_notes,
+                    pickup_lat=call.pickup_lat,
+                    pickup_lng=call.pickup_lng,
+                    destination_lat=call.destination_lat,
+                    destination_lng=call.destination_lng,
+                )
+                orders.append(order)
+                links.extend((repeat, order.id, i > 0) for i, repeat in enumerate(entry.calls))
+            links.extend((call, order_id, True) for call, order_id, _ in linked)
+            self._price(orders)
+            db.add_all(orders)
+            db.flush()
+
+            now = datetime.utcnow()
+            statuses = [(call, order_id, "duplicate" if duplicate else "ordered") for call, order_id, duplicate in links]
+            call_ids = self._store_calls(db, statuses, now)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        results = []
+        for (call, order_id, duplicate), call_id in zip(links, call_ids):
+            # Only now: a call keeps no id from a transaction that rolled back
+            call.call_id = call_id
+            results.append(CallOrder(call_id, order_id, call.customer_phone, call.customer_class,
+                                     duplicate, (now - call.received_at).total_seconds()))
+        return results
+
+    @staticmethod
+    def _price(orders: list) -> None:
+        """estimated_price for the whole batch with one FareEngine.price call"""
+        from pricing import live_engine, price_orders
+        if not any(o.destination_lat is not None for o in orders):
+            return
+        try:
+            prices = price_orders(orders, live_engine())
+        except Exception as e:
+            # An order without an estimate is still an order; price_open_orders can fill it in later
+            logger.error(f"❌ Could not price intake batch: {e}")
+            return
+        for order, price in zip(orders, prices.tolist()):
+            if price == price:  # NaN without both coordinate pairs
+                order.estimated_price = price
+
+    def _write_received(self, calls: List[IncomingCall]) -> None:
+        """Store newly taken calls as "received" rows without an order"""
+        db = self._session()
+        try:
+            call_ids = self._store_calls(db, [(call, None, "received") for call in calls], None)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for call, call_id in zip(calls, call_ids):
+            call.call_id = call_id
+        self.recorded += len(calls)
+
+    def _write_failed(self, calls: List[IncomingCall]) -> None:
+        """Store calls as "failed" without an order, in a transaction of their own"""
+        db = self._session()
+        try:
+            call_ids = self._store_calls(db, [(call, None, "failed") for call in calls], datetime.utcnow())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for call, call_id in zip(calls, call_ids):
+            call.call_id = call_id
+
+    @staticmethod
+    def _store_calls(db, calls: List[Tuple[IncomingCall, Optional[str], str]],
+                     now: Optional[datetime]) -> List[str]:
+        """Insert (or, for calls already stored, update) dispatcher_calls rows; returns the call ids"""
+        from sqlalchemy import insert, update
+        from taxi import DispatcherCall
+
+        new_rows, existing_rows, call_ids = [], [], []
+        for call, order_id, status in calls:
+            if call.call_id is None:
+                call_id = str(uuid4())
+                new_rows.append({
+                    "id": call_id, "dispatcher_id": call.dispatcher_id, "order_id": order_id,
+                    "customer_phone": call.customer_phone, "customer_name": call.customer_name,
+                    "customer_location": call.customer_location, "passenger_count": call.passenger_count,
+                    "call_notes": call.call_notes, "customer_class": call.customer_class,
+                    "destination": call.destination, "pickup_lat": call.pickup_lat,
+                    "pickup_lng": call.pickup_lng, "call_status": status,
+                    "received_at": call.received_at, "completed_at": now,
+                })
+            else:
+                call_id = call.call_id
+                existing_rows.append({"id": call_id, "order_id": order_id, "call_status": status,
+                                      "completed_at": now})
+            call_ids.append(call_id)
+        if new_rows:
+            db.execute(insert(DispatcherCall), new_rows)
+        if existing_rows:
+            db.execute(update(DispatcherCall), existing_rows)
+        return call_ids
+
+    def _session(self):
+        session_factory = self.session_factory
+        if session_factory is None:
+            from taxi import SessionLocal
+            session_factory = SessionLocal
+        return session_factory()
+
+    # ---------- recovery ----------
+
+    async def recover(self, limit: int = 10000) -> int:
+        """Queue dispatcher_calls rows still "received" without an order (e.g. after a restart)"""
+        calls = await asyncio.to_thread(self._load_received, limit)
+        return sum(self.submit(call) for call in calls)
+
+    def _load_received(self, limit: int) -> List[IncomingCall]:
+        from sqlalchemy import select
+        from taxi import DispatcherCall
+
+        db = self._session()
+        try:
+            rows = db.execute(
+                select(DispatcherCall)
+                .where(DispatcherCall.call_status == "received", DispatcherCall.order_id.is_(None))
+                .order_by(DispatcherCall.received_at, DispatcherCall.id)
+                .limit(limit)
+            ).scalars().all()
+            return [IncomingCall(row.customer_phone, row.dispatcher_id, row.customer_location,
+                                 customer_name=row.customer_name, passenger_count=row.passenger_count or 1,
+                                 call_notes=row.call_notes, customer_class=row.customer_class,
+                                 destination=row.destination, pickup_lat=row.pickup_lat,
+                                 pickup_lng=row.pickup_lng, received_at=row.received_at, call_id=row.id)
+                    for row in rows]
+        finally:
+            db.close()
+
+    # ---------- metrics ----------
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """Queue depth and throughput counters for the dispatch desk"""
+        return {
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "high_water": self.high_water,
+            "submitted": self.submitted,
+            "recorded": self.recorded,
+            "duplicates": self.duplicates,
+            "linked": self.linked,
+            "rejected": self.rejected,
+            "ordered": self.ordered,
+            "batches": self.batches,
+            "flush_errors": self.flush_errors,
+            "failed": self.failed,
+            "last_batch_ms": round(self.last_batch_ms, 3),
+            "max_batch_ms": round(self.max_batch_ms, 3),
+            "max_wait_s": round(self.max_wait, 3),
+        }
@@ -71,6 +71,7 @@ class CustomerApp extends TaxiApp {
         };
 
         this.activeOrder = order;
+        this.setCurrentOrder(order);
         this.orders.push(order);
         this.saveOrders(this.orders);
         
@@ -122,6 +123,7 @@ class CustomerApp extends TaxiApp {
 
         if (order) {
             this.activeOrder = null;
+            this.setCurrentOrder(null);
             this.showNotification('❌ Buyurtma bekor qilindi', 'warning');
         }
 
@@ -24,7 +24,7 @@ class DriverApp extends TaxiApp {
     // ================================
 
     toggleOnline(status) {
-        this.isOnline = status;
+        this.setOnline(status);
         if (status) {
             this.startLocationTracking();
             this.showNotification('🟢 Online holatiga o\'ttingiz', 'success');
@@ -67,6 +67,7 @@ class DriverApp extends TaxiApp {
                     const { latitude, longitude, accuracy } = position.coords;
                     this.currentLocation = { latitude, longitude, accuracy };
                     this.updateLocationUI();
+                    this.setLocation(latitude, longitude);
                     // Send to server in production
                 },
                 error => {
@@ -107,6 +108,26 @@ class DriverApp extends TaxiApp {
         return this.orders.filter(o => o.status === 'pending');
     }
 
+    receiveOffer(offer) {
+        // Already known, e.g. one we accepted ourselves
+        if (this.orders.some(o => o.id === offer.order_id)) return;
+        this.orders.push({
+            id: offer.order_id,
+            from: offer.pickup,
+            to: offer.destination,
+            fare: offer.estimated_price,
+            passengers: offer.passengers,
+            createdAt: offer.created_at,
+            version: offer.version,
+            status: 'pending'
+        });
+    }
+
+    closeOffer(offer) {
+        // Taken by another driver or cancelled
+        this.orders = this.orders.filter(o => !(o.id === offer.order_id && o.status === 'pending'));
+    }
+
     acceptOrder(orderId) {
         const order = this.updateOrder(orderId, {
             status: 'accepted',
@@ -117,6 +138,7 @@ class DriverApp extends TaxiApp {
 
         if (order) {
             this.acceptedOrders.push(order);
+            this.setCurrentOrder(order);
             this.showNotification('✅ Buyurtmani qabul qildingiz!', 'success');
             this.playNotificationSound();
         }
@@ -144,6 +166,7 @@ class DriverApp extends TaxiApp {
 
         if (order) {
             this.acceptedOrders = this.acceptedOrders.filter(o => o.id !== orderId);
+            this.setCurrentOrder(null);
             this.updateEarnings(order);
             this.showNotification('🎉 Trip muvaffaqiyatli yakunlandi!', 'success');
         }
@@ -322,6 +345,16 @@ class DriverApp extends TaxiApp {
                 }
             }
         });
+
+        // Offers around us, pushed over the cell topics (see TaxiApp.connectRealtime)
+        document.addEventListener('taxi:order-offer', (e) => {
+            this.receiveOffer(e.detail);
+            this.renderOrders();
+        });
+        document.addEventListener('taxi:order-offer-closed', (e) => {
+            this.closeOffer(e.detail);
+            this.renderOrders();
+        });
     }
 
     // ================================
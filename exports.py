@@ -0,0 +1,276 @@
+# =====================================================
+# 📤 STREAMING TABLE EXPORTS
+# Constant-memory CSV / NDJSON / Parquet dumps of orders and calls
+# plus the revenue aggregates of the admin money dashboard
+# =====================================================
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from datetime import datetime
+from enum import Enum
+from typing import IO, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from keyset import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson", "parquet")
+DEFAULT_BATCH_SIZE = 5000
+
+# table name -> (timestamp columns usable as the date/keyset column, default column)
+_DATE_COLUMNS = {
+    "orders": (("created_at", "completed_at"), "created_at"),
+    "dispatcher_calls": (("received_at", "completed_at"), "received_at"),
+}
+
+class ExportResult(NamedTuple):
+    rows: int
+    cursor: Optional[str]  # pass back as `after` to resume right after the last row
+
+def _table(name: str):
+    from taxi import DispatcherCall, Order
+    tables = {"orders": Order.__table__, "dispatcher_calls": DispatcherCall.__table__}
+    if name not in tables:
+        raise ValueError(f"Unknown export table {name!r}; expected one of {sorted(tables)}")
+    return tables[name]
+
+# =====================================================
+# 📥 ROW STREAM
+# =====================================================
+
+def stream_rows(table_name: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                date_column: Optional[str] = None, after: Optional[str] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE, bind=None) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Yield (column names, batch of rows) ordered by (date_column, id)
+
+    Uses a server-side cursor (yield_per) so only one batch is in memory.
+    Rows are filtered to start <= date_column < end and, when `after` is
+    given, to rows strictly after that keyset cursor.
+    """
+    from sqlalchemy import and_, or_, select
+
+    table = _table(table_name)
+    allowed, default = _DATE_COLUMNS[table_name]
+    date_column = date_column or default
+    if date_column not in allowed:
+        raise ValueError(f"{table_name} can only be filtered by {allowed}")
+    date_col = table.c[date_column]
+
+    stmt = select(table).where(date_col.isnot(None))
+    if start is not None:
+        stmt = stmt.where(date_col >= start)
+    if end is not None:
+        stmt = stmt.where(date_col < end)
+    if after:
+        after_ts, after_id = decode_cursor(after)
+        stmt = stmt.where(or_(date_col > after_ts, and_(date_col == after_ts, table.c.id > after_id)))
+    stmt = stmt.order_by(date_col, table.c.id)
+
+    if bind is None:
+        from taxi import engine as bind
+
+    columns = [c.name for c in table.columns]
+    with bind.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for batch in result.partitions():
+            yield columns, batch
+
+# =====================================================
+# ✍️ WRITERS
+# =====================================================
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+class _CSVWriter:
+    def __init__(self, out: IO, columns: Sequence[str], header: bool = True):
+        self._writer = csv.writer(out)
+        if header:
+            self._writer.writerow(columns)
+
+    def write(self, rows: List[tuple]) -> None:
+        self._writer.writerows([_plain(v) for v in row] for row in rows)
+
+    def close(self) -> None:
+        pass
+
+class _NDJSONWriter:
+    def __init__(self, out: IO, columns: Sequence[str]):
+        self._out = out
+        self._columns = list(columns)
+
+    def write(self, rows: List[tuple]) -> None:
+        columns = self._columns
+        self._out.write("".join(
+            json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        ))
+
+    def close(self) -> None:
+        pass
+
+class _ParquetWriter:
+    """One row group per batch; requires pyarrow"""
+
+    def __init__(self, out, columns: Sequence[str], table):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._columns = list(columns)
+        self._schema = pa.schema([(c.name, _arrow_type(pa, c.type)) for c in table.columns])
+        self._writer = pq.ParquetWriter(out, self._schema)
+
+    def write(self, rows: List[tuple]) -> None:
+        arrays = [
+            self._pa.array([_plain(row[i]) if isinstance(row[i], Enum) else row[i] for row in rows],
+                           type=self._schema.field(i).type)
+            for i in range(len(self._columns))
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+def _arrow_type(pa, column_type):
+    from sqlalchemy import Boolean, DateTime, Enum as SQLEnum, Float, Integer
+    if isinstance(column_type, SQLEnum):
+        return pa.string()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+# =====================================================
+# 🚚 EXPORT
+# =====================================================
+
+def export_table(table_name: str, out, fmt: str = "csv", start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, date_column: Optional[str] = None,
+                 after: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE, bind=None) -> ExportResult:
+    """Stream a table into `out` (text stream for csv/ndjson, path or binary stream for parquet)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {FORMATS}")
+    date_column = date_column or _DATE_COLUMNS.get(table_name, ((), None))[1]
+
+    table = _table(table_name)
+    columns = [c.name for c in table.columns]
+    if fmt == "csv":
+        # A resumed export continues a file that already has its header
+        writer = _CSVWriter(out, columns, header=not after)
+    elif fmt == "ndjson":
+        writer = _NDJSONWriter(out, columns)
+    else:
+        writer = _ParquetWriter(out, columns, table)
+    date_index = columns.index(date_column)
+    id_index = columns.index("id")
+
+    rows = 0
+    last = None
+    try:
+        for _, batch in stream_rows(table_name, start, end, date_column, after, batch_size, bind):
+            writer.write(batch)
+            rows += len(batch)
+            last = batch[-1]
+    finally:
+        writer.close()
+
+    cursor = encode_cursor(last[date_index], last[id_index]) if last is not None else after
+    logger.info(f"📤 Exported {rows} {table_name} rows")
+    return ExportResult(rows, cursor)
+
+# =====================================================
+# 💰 REVENUE AGGREGATES
+# =====================================================
+
+# period -> (SQLite strftime format, PostgreSQL to_char format)
+_PERIOD_FORMATS = {
+    "hour": ("%Y-%m-%d %H:00", "YYYY-MM-DD HH24:00"),
+    "day": ("%Y-%m-%d", "YYYY-MM-DD"),
+    "month": ("%Y-%m", "YYYY-MM"),
+}
+
+def revenue_by_period(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      period: str = "day", bind=None) -> List[dict]:
+    """Completed order count and final_price sum/avg per period, aggregated in the database"""
+    from sqlalchemy import func, select
+    from taxi import Order, OrderStatus
+
+    if period not in _PERIOD_FORMATS:
+        raise ValueError(f"Unknown period {period!r}; expected one of {sorted(_PERIOD_FORMATS)}")
+    if bind is None:
+        from taxi import engine as bind
+
+    sqlite_format, pg_format = _PERIOD_FORMATS[period]
+    if bind.dialect.name == "postgresql":
+        bucket = func.to_char(Order.completed_at, pg_format)
+    else:
+        bucket = func.strftime(sqlite_format, Order.completed_at)
+    bucket = bucket.label("period")
+
+    stmt = (
+        select(bucket, func.count(Order.id), func.coalesce(func.sum(Order.final_price), 0.0), func.avg(Order.final_price))
+        .where(Order.status == OrderStatus.COMPLETED, Order.completed_at.isnot(None))
+    )
+    if start is not None:
+        stmt = stmt.where(Order.completed_at >= start)
+    if end is not None:
+        stmt = stmt.where(Order.completed_at < end)
+    stmt = stmt.group_by(bucket).order_by(bucket)
+
+    with bind.connect() as conn:
+        return [
+            {"period": row[0], "orders": row[1], "revenue": round(row[2], 2),
+             "average": round(row[3], 2) if row[3] is not None else None}
+            for row in conn.execute(stmt)
+        ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream orders / dispatcher_calls to CSV, NDJSON or Parquet")
+    parser.add_argument("table", choices=sorted(_DATE_COLUMNS) + ["revenue"])
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--out", default="-", help="output path ('-' = stdout, not for parquet)")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, help="inclusive ISO date/time")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, help="exclusive ISO date/time")
+    parser.add_argument("--date-column", help="timestamp column to filter and paginate on")
+    parser.add_argument("--after", help="resume cursor printed by a previous run")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--period", choices=sorted(_PERIOD_FORMATS), default="day", help="revenue bucket size")
+    args = parser.parse_args(argv)
+
+    if args.table == "revenue":
+        for row in revenue_by_period(args.start, args.end, args.period):
+            print(json.dumps(row, ensure_ascii=False))
+        return
+
+    options = dict(fmt=args.format, start=args.start, end=args.end, date_column=args.date_column,
+                   after=args.after, batch_size=args.batch_size)
+    if args.format == "parquet":
+        if args.out == "-":
+            parser.error("parquet output needs --out PATH")
+        result = export_table(args.table, args.out, **options)
+    elif args.out == "-":
+        result = export_table(args.table, sys.stdout, **options)
+    else:
+        # Appending keeps a resumed export in the same file
+        with open(args.out, "a" if args.after else "w", newline="", encoding="utf-8") as out:
+            result = export_table(args.table, out, **options)
+
+    print(f"rows={result.rows} cursor={result.cursor or ''}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# =====================================================
+# 🌍 GEO HELPERS
+# Distances and grid cells shared by dispatch modules
+# (the vectorized distances import numpy when first called)
+# =====================================================
+
+import math
+from typing import Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180.0
+
+# Default grid cell edge in degrees (~1.1 km of latitude)
+DEFAULT_CELL_SIZE_DEG = 0.01
+
+Cell = Tuple[int, int]
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def cell_of(lat: float, lng: float, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> Cell:
+    """Square grid cell containing a point"""
+    return (math.floor(lat / cell_size_deg), math.floor(lng / cell_size_deg))
+
+def cell_center(cell: Cell, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> Tuple[float, float]:
+    """Centre point of a grid cell"""
+    return ((cell[0] + 0.5) * cell_size_deg, (cell[1] + 0.5) * cell_size_deg)
+
+def km_per_deg_lng(lat: float) -> float:
+    """Kilometres per degree of longitude at a latitude"""
+    return KM_PER_DEG_LAT * math.cos(math.radians(min(abs(lat), 89.999)))
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    """Pairwise great-circle distances in km, shape (len(lat1), len(lat2))"""
+    import numpy as np
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    dlmb = np.radians(np.asarray(lng2, dtype=np.float64))[None, :] - np.radians(np.asarray(lng1, dtype=np.float64))[:, None]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_pairs(lat1, lng1, lat2, lng2):
+    """Element-wise great-circle distances in km between two equally long point arrays"""
+    import numpy as np
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dlmb = np.radians(np.asarray(lng2) - np.asarray(lng1))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,289 @@
+# =====================================================
+# 🔥 DEMAND HEATMAP
+# Pending orders vs available drivers per grid cell over sliding windows
+# =====================================================
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from geo import DEFAULT_CELL_SIZE_DEG, Cell, cell_center, cell_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOWS = (60, 300, 900)
+
+# Statuses an order never leaves; anything else may still return to PENDING
+_FINISHED = ("COMPLETED", "CANCELLED")
+
+class HeatmapSnapshot(NamedTuple):
+    window: int  # seconds
+    cells: List[Cell]
+    demand: np.ndarray  # pending orders per cell, averaged over the window
+    supply: np.ndarray  # available drivers per cell, averaged over the window
+    ratio: np.ndarray  # demand / supply, with supply floored at one driver
+    pending: np.ndarray  # orders waiting for a driver per cell right now
+
+    def rows(self, limit: Optional[int] = None, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> List[dict]:
+        """Cells by descending ratio, as JSON-ready dicts for the admin dashboard"""
+        order = np.argsort(-self.ratio, kind="stable")[:limit]
+        result = []
+        for i in order.tolist():
+            lat, lng = cell_center(self.cells[i], cell_size_deg)
+            result.append({"cell": list(self.cells[i]), "lat": round(lat, 6), "lng": round(lng, 6),
+                           "demand": round(float(self.demand[i]), 2), "supply": round(float(self.supply[i]), 2),
+                           "ratio": round(float(self.ratio[i]), 3), "pending": int(self.pending[i])})
+        return result
+
+class DemandHeatmap:
+    """Streaming demand/supply counters on the dispatch grid
+
+    Time is cut into slots of slot_seconds. Every cell has a ring of
+    pending-order samples and a ring of available-driver samples (the
+    counts of the cell when the slot opened), plus one running total per
+    window that is updated as slots enter and leave it. Nothing is
+    re-queried: a status change is O(1), advancing a slot is
+    O(cells x windows) and a snapshot is O(cells).
+
+    Demand is what is still waiting: an order counts from the moment it is
+    PENDING until it is assigned, accepted or cancelled, and again if a
+    driver releases it. Drivers are tracked by their last fix; a driver not
+    heard from for driver_ttl seconds no longer counts as supply, and
+    neither does one on a trip (see set_driver_available): a fix without
+    availability keeps what the heatmap last heard.
+    """
+
+    def __init__(self, windows: Sequence[int] = DEFAULT_WINDOWS, slot_seconds: int = 10,
+                 cell_size_deg: float = DEFAULT_CELL_SIZE_DEG, driver_ttl: float = 60.0,
+                 clock=time.time):
+        if any(w % slot_seconds for w in windows):
+            raise ValueError("every window must be a whole number of slots")
+        self.windows = tuple(sorted(windows))
+        self.slot_seconds = slot_seconds
+        self.cell_size_deg = cell_size_deg
+        self.driver_ttl = driver_ttl
+        self._clock = clock
+        self._spans = [w // slot_seconds for w in self.windows]
+        self._ring = max(self._spans)
+        self._lock = threading.Lock()
+
+        self._rows: Dict[Cell, int] = {}
+        self._cells: List[Cell] = []
+        capacity = 256
+        self._demand = np.zeros((capacity, self._ring), dtype=np.int32)
+        self._supply = np.zeros((capacity, self._ring), dtype=np.int32)
+        self._demand_totals = np.zeros((len(self.windows), capacity), dtype=np.int64)
+        self._supply_totals = np.zeros((len(self.windows), capacity), dtype=np.int64)
+        self._available = np.zeros(capacity, dtype=np.int32)  # drivers available right now
+        self._pending = np.zeros(capacity, dtype=np.int32)  # orders waiting right now
+
+        self._drivers: Dict[str, Tuple[int, float]] = {}  # driver_id -> (row, last seen)
+        self._busy: Set[str] = set()  # drivers on a trip
+        self._orders: Dict[str, Tuple[int, bool]] = {}  # unfinished order_id -> (row, pending)
+        self._slot: Optional[int] = None
+        self._first_slot: Optional[int] = None
+
+        self.status_updates = 0
+        self.fixes_observed = 0
+
+    # ---------- cells and slots ----------
+
+    def _row(self, cell: Cell) -> int:
+        row = self._rows.get(cell)
+        if row is None:
+            row = len(self._cells)
+            if row == self._available.size:
+                self._grow()
+            self._rows[cell] = row
+            self._cells.append(cell)
+        return row
+
+    def _grow(self) -> None:
+        capacity = self._available.size * 2
+        for name in ("_demand", "_supply"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, self._ring), dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+        for name in ("_demand_totals", "_supply_totals"):
+            old = getattr(self, name)
+            new = np.zeros((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+        for name in ("_available", "_pending"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:old.size] = old
+            setattr(self, name, new)
+
+    def _advance(self, now: float) -> int:
+        """Move to the slot containing now; returns its ring position"""
+        slot = int(now // self.slot_seconds)
+        if self._slot is None:
+            self._slot = self._first_slot = slot
+            self._open(slot)
+        elif slot > self._slot:
+            self._expire_drivers(now)
+            if slot - self._slot >= self._ring:
+                # Idle for longer than the largest window: every ring is stale
+                for array in (self._demand, self._supply, self._demand_totals, self._supply_totals):
+                    array.fill(0)
+                self._first_slot = slot
+                self._open(slot)
+            else:
+                for step in range(self._slot + 1, slot + 1):
+                    self._open(step)
+            self._slot = slot
+        return self._slot % self._ring
+
+    def _open(self, slot: int) -> None:
+        """Drop the slot leaving each window, then start `slot` with a demand and a supply sample"""
+        n = len(self._cells)
+        pos = slot % self._ring
+        for w, span in enumerate(self._spans):
+            leaving = (slot - span) % self._ring
+            self._demand_totals[w, :n] -= self._demand[:n, leaving]
+            self._supply_totals[w, :n] -= self._supply[:n, leaving]
+        self._demand[:n, pos] = self._pending[:n]
+        self._demand_totals[:, :n] += self._pending[:n]
+        self._supply[:n, pos] = self._available[:n]
+        self._supply_totals[:, :n] += self._available[:n]
+
+    def _expire_drivers(self, now: float) -> None:
+        cutoff = now - self.driver_ttl
+        stale = [driver_id for driver_id, (_, seen) in self._drivers.items() if seen < cutoff]
+        for driver_id in stale:
+            row, _ = self._drivers.pop(driver_id)
+            self._available[row] -= 1
+
+    # ---------- events ----------
+
+    def track_order(self, order_id: str, status, lat: Optional[float] = None, lng: Optional[float] = None,
+                    now: Optional[float] = None) -> None:
+        """An order's new status; without a pickup point the cell it was last seen in is kept"""
+        with self._lock:
+            self._advance(self._clock() if now is None else now)
+            self._track(order_id, getattr(status, "name", status), lat, lng)
+
+    def track_orders(self, orders: Iterable[Tuple[str, object, Optional[float], Optional[float]]]) -> None:
+        """Many (order_id, status, lat, lng) at once (e.g. one ORM flush)"""
+        with self._lock:
+            self._advance(self._clock())
+            for order_id, status, lat, lng in orders:
+                self._track(order_id, getattr(status, "name", status), lat, lng)
+
+    def _track(self, order_id: str, status: str, lat: Optional[float], lng: Optional[float]) -> None:
+        known = self._orders.pop(order_id, None)
+        if known is not None and known[1]:
+            self._pending[known[0]] -= 1
+        if status in _FINISHED:
+            return
+        if lat is not None and lng is not None:
+            row = self._row(cell_of(lat, lng, self.cell_size_deg))
+        elif known is not None:
+            row = known[0]
+        else:
+            return  # no pickup point, so not on the map
+        pending = status == "PENDING"
+        if pending:
+            self._pending[row] += 1
+        self._orders[order_id] = (row, pending)
+        self.status_updates += 1
+
+    def observe_drivers(self, fixes: Iterable) -> None:
+        """LocationIngestor listener: move each driver's supply to its current cell"""
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            for fix in fixes:
+                previous = self._drivers.pop(fix.driver_id, None)
+                if previous is not None:
+                    self._available[previous[0]] -= 1
+                available = fix.is_available
+                if available is None:
+                    available = fix.driver_id not in self._busy
+                elif available:
+                    self._busy.discard(fix.driver_id)
+                else:
+                    self._busy.add(fix.driver_id)
+                if available:
+                    row = self._row(cell_of(fix.latitude, fix.longitude, self.cell_size_deg))
+                    self._available[row] += 1
+                    self._drivers[fix.driver_id] = (row, now)
+                self.fixes_observed += 1
+
+    def set_driver_available(self, driver_id: str, is_available: bool) -> None:
+        """A driver started or finished a trip; busy drivers stop counting as supply right away"""
+        with self._lock:
+            if is_available:
+                self._busy.discard(driver_id)
+                return
+            self._busy.add(driver_id)
+            previous = self._drivers.pop(driver_id, None)
+            if previous is not None:
+                self._available[previous[0]] -= 1
+
+    def watch(self, order_model) -> None:
+        """Track every Order the ORM inserts, or whose status it changes"""
+        from sqlalchemy import event, inspect
+        from sqlalchemy.orm import Session
+
+        @event.listens_for(Session, "after_flush")
+        def _after_flush(session, flush_context):
+            changes = [(o.id, o.status or "PENDING", o.pickup_lat, o.pickup_lng) for o in session.new
+                       if isinstance(o, order_model)]
+            changes += [(o.id, o.status, o.pickup_lat, o.pickup_lng) for o in session.dirty
+                        if isinstance(o, order_model) and inspect(o).attrs.status.history.added]
+            if changes:
+                self.track_orders(changes)
+
+    def load(self, db) -> int:
+        """Start from the orders the database still has open; returns how many"""
+        from taxi import Order, OrderStatus
+        rows = (
+            db.query(Order.id, Order.status, Order.pickup_lat, Order.pickup_lng)
+            .filter(Order.status.in_([OrderStatus.PENDING, OrderStatus.ASSIGNED,
+                                      OrderStatus.ACCEPTED, OrderStatus.STARTED]),
+                    Order.pickup_lat.isnot(None), Order.pickup_lng.isnot(None))
+            .all()
+        )
+        self.track_orders(rows)
+        return len(rows)
+
+    # ---------- reads ----------
+
+    def snapshot(self, window: int = 300, now: Optional[float] = None) -> HeatmapSnapshot:
+        """Per-cell demand, supply and ratio for one of the configured windows"""
+        if window not in self.windows:
+            raise ValueError(f"window must be one of {self.windows}")
+        w = self.windows.index(window)
+        with self._lock:
+            self._advance(self._clock() if now is None else now)
+            n = len(self._cells)
+            # Early on fewer slots than the window holds have been sampled
+            sampled = min(self._spans[w], self._slot - self._first_slot + 1)
+            demand = self._demand_totals[w, :n] / sampled
+            supply = self._supply_totals[w, :n] / sampled
+            pending = self._pending[:n].copy()
+            cells = list(self._cells)
+        return HeatmapSnapshot(window, cells, demand, supply, demand / np.maximum(supply, 1.0), pending)
+
+    def surge_map(self, window: int = 300, threshold: float = 1.0, sensitivity: float = 0.5,
+                  max_surge: float = 3.0) -> Dict[Cell, float]:
+        """Multipliers for FareEngine.set_surge: cells whose ratio exceeds threshold"""
+        snap = self.snapshot(window)
+        surge = np.minimum(1.0 + sensitivity * (snap.ratio - threshold), max_surge)
+        return {snap.cells[i]: float(surge[i]) for i in np.flatnonzero(snap.ratio > threshold).tolist()}
+
+    def stats(self) -> dict:
+        return {
+            "cells": len(self._cells),
+            "drivers": len(self._drivers),
+            "busy_drivers": len(self._busy),
+            "pending_orders": int(self._pending.sum()),
+            "status_updates": self.status_updates,
+            "fixes_observed": self.fixes_observed,
+        }
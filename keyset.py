@@ -0,0 +1,18 @@
+# =====================================================
+# 🔑 KEYSET CURSORS
+# Opaque (timestamp, id) positions shared by exports and paginated lists
+# =====================================================
+
+from datetime import datetime
+from typing import Tuple
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """Position right after the row with this (timestamp, id) key"""
+    return f"{timestamp.isoformat()}|{row_id}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; ValueError for anything it did not produce"""
+    timestamp, _, row_id = cursor.partition("|")
+    if not row_id:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+    return datetime.fromisoformat(timestamp), row_id
@@ -0,0 +1,270 @@
+# =====================================================
+# 🛰️ DRIVER LOCATION INGESTION
+# Buffers GPS fixes per driver and flushes them in bulk
+# =====================================================
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class LocationFix:
+    """One GPS fix reported by a driver app
+
+    is_available is None for a plain position report: the driver's
+    availability is left as it is (order transitions change it).
+    """
+    __slots__ = ("driver_id", "latitude", "longitude", "is_available", "recorded_at")
+
+    def __init__(self, driver_id: str, latitude: float, longitude: float,
+                 is_available: Optional[bool] = None, recorded_at: Optional[datetime] = None):
+        self.driver_id = driver_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.is_available = is_available
+        self.recorded_at = recorded_at or datetime.utcnow()
+
+class LocationIngestor:
+    """Write-coalescing buffer in front of driver_positions
+
+    Each driver has at most one pending fix; a newer fix replaces the
+    buffered one. Every flush_interval seconds the buffer is swapped out
+    and written as one bulk upsert into driver_positions plus one bulk
+    insert into driver_location_history, in a single transaction.
+
+    Memory is bounded by max_pending distinct drivers. When the buffer
+    is full, submit() rejects fixes from drivers that are not already
+    buffered and put() waits for the next flush.
+    """
+
+    def __init__(self, session_factory=None, flush_interval: float = 1.0,
+                 max_pending: int = 50000, keep_history: bool = True):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.keep_history = keep_history
+
+        self._pending: Dict[str, LocationFix] = {}
+        self._listeners: List[Callable[[List[LocationFix]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.stale = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.high_water = 0
+
+    @classmethod
+    def from_config(cls, **overrides) -> "LocationIngestor":
+        from taxi import Config
+        settings = {
+            "flush_interval": Config.LOCATION_FLUSH_SECONDS,
+            "max_pending": Config.LOCATION_MAX_PENDING,
+            "keep_history": Config.LOCATION_KEEP_HISTORY,
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    # ---------- intake ----------
+
+    def submit(self, driver_id: str, latitude: float, longitude: float,
+               is_available: Optional[bool] = None, recorded_at: Optional[datetime] = None) -> bool:
+        """Buffer a fix without waiting; False when it was rejected for backpressure"""
+        return self._offer(LocationFix(driver_id, latitude, longitude, is_available, recorded_at))
+
+    async def put(self, driver_id: str, latitude: float, longitude: float,
+                  is_available: Optional[bool] = None, recorded_at: Optional[datetime] = None) -> None:
+        """Buffer a fix, waiting for a flush while the buffer is full"""
+        fix = LocationFix(driver_id, latitude, longitude, is_available, recorded_at)
+        while not self._offer(fix, count_rejection=False):
+            self._space.clear()
+            await self._space.wait()
+
+    def _offer(self, fix: LocationFix, count_rejection: bool = True) -> bool:
+        current = self._pending.get(fix.driver_id)
+        if current is not None:
+            if fix.recorded_at < current.recorded_at:
+                self.stale += 1
+                return True
+            if fix.is_available is None:
+                # A newer position must not drop an availability change still buffered
+                fix.is_available = current.is_available
+            self.coalesced += 1
+        elif len(self._pending) >= self.max_pending:
+            if count_rejection:
+                self.rejected += 1
+            return False
+        self._pending[fix.driver_id] = fix
+        self.submitted += 1
+        if len(self._pending) > self.high_water:
+            self.high_water = len(self._pending)
+        return True
+
+    def add_listener(self, callback: Callable[[List[LocationFix]], None]) -> None:
+        """Call callback(fixes) after every successful flush (e.g. DriverSpatialIndex updates)"""
+        self._listeners.append(callback)
+
+    # ---------- flushing ----------
+
+    async def start(self) -> None:
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush task and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Shielded so stop() never abandons a batch half-way through its write
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"❌ Location flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Write the buffered fixes now; returns the number of drivers written"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = list(self._pending.values()), {}
+            self._space.set()
+
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                self.flush_errors += 1
+                self._requeue(batch)
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+            for callback in self._listeners:
+                try:
+                    callback(batch)
+                except Exception as e:
+                    logger.error(f"❌ Location listener failed: {e}")
+            return len(batch)
+
+    def _requeue(self, batch: List[LocationFix]) -> None:
+        """Put a failed batch back unless newer fixes arrived meanwhile"""
+        for fix in batch:
+            current = self._pending.get(fix.driver_id)
+            if current is None and len(self._pending) < self.max_pending:
+                self._pending[fix.driver_id] = fix
+
+    def _write(self, batch: List[LocationFix]) -> None:
+        from taxi import DriverLocationHistory, DriverPosition
+
+        session_factory = self.session_factory
+        if session_factory is None:
+            from taxi import SessionLocal
+            session_factory = SessionLocal
+
+        rows = []
+        for fix in batch:
+            row = {"driver_id": fix.driver_id, "latitude": fix.latitude, "longitude": fix.longitude,
+                   "updated_at": fix.recorded_at}
+            if fix.is_available is not None:
+                row["is_available"] = fix.is_available
+            rows.append(row)
+
+        db = session_factory()
+        try:
+            # One statement per shape: fixes without availability leave the column alone
+            for with_availability in (False, True):
+                group = [row for row in rows if ("is_available" in row) == with_availability]
+                if group:
+                    db.execute(_upsert_statement(db, DriverPosition, with_availability), group)
+            if self.keep_history:
+                db.execute(
+                    DriverLocationHistory.__table__.insert(),
+                    [
+                        {"driver_id": r["driver_id"], "latitude": r["latitude"],
+                         "longitude": r["longitude"], "recorded_at": r["updated_at"]}
+                        for r in rows
+                    ],
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # ---------- metrics ----------
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """Counters and gauges for backpressure monitoring"""
+        return {
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "high_water": self.high_water,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "stale": self.stale,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+def _upsert_statement(db, model, with_availability: bool = True):
+    """INSERT ... ON CONFLICT (driver_id) DO UPDATE that never moves a position backwards in time
+
+    Without with_availability an existing row keeps its is_available
+    (a new one gets the column default).
+    """
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Bulk position upsert is not supported on {dialect}")
+
+    stmt = insert(table)
+    set_ = {
+        "latitude": stmt.excluded.latitude,
+        "longitude": stmt.excluded.longitude,
+        "updated_at": stmt.excluded.updated_at,
+    }
+    if with_availability:
+        set_["is_available"] = stmt.excluded.is_available
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.driver_id],
+        set_=set_,
+        where=stmt.excluded.updated_at >= table.c.updated_at,
+    )
@@ -0,0 +1,175 @@
+# =====================================================
+# 📋 BOT MENUS & MESSAGE TEMPLATES
+# Keyboards and static text built once at startup
+# =====================================================
+
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+WELCOME_TEXT = """
+🎉 *Xush Kelibsiz Taxi Sistemasiga!*
+
+Iltimos, siz kim ekanligingizni tanlang:
+
+👤 *Mijoz* - Taksi buyurtma qilish
+🚗 *Haydovchi* - Taksi bilan pulga raqib
+📞 *Dispatcher* - Taksi qo'ng'iroqlarni boshqarish
+🔑 *Admin* - Tizimni boshqarish
+        """
+
+HELP_TEXT = """
+🆘 *Yordam va Buyruqlar*
+
+*Asosiy Buyruqlar:*
+/start - Boshlanish
+/help - Yordam
+/profile - Mening Profilim
+/role - Roli o'zgartirish
+
+*Mijoz Buyruqlari:*
+/order - Taksi Buyurtma Qilish
+/history - Tarixim
+/support - Yordam So'rash
+
+*Haydovchi Buyruqlari:*
+/online - Online Bo'lish
+/offline - Offline Bo'lish
+/earnings - Daromadim
+/rating - Reyting
+
+*Admin Buyruqlari:*
+/dashboard - Dashboard
+/users - Foydalanuvchilar
+/settings - Sozlamalar
+
+*Dispatcher Buyruqlari:*
+/calls - Qo'ng'iroqlar
+/drivers - Haydovchilar
+/orders - Buyurtmalar
+    """
+
+NOT_REGISTERED_TEXT = "❌ Siz ro'yxatdan o'tmagansiz. /start buyrug'isini yuboring."
+UNKNOWN_MESSAGE_TEXT = "🤔 Men bu buyruqni tushunmasdim. /help buyrug'isini yuboring."
+UNKNOWN_CALLBACK_TEXT = "❌ Noma'lum buyruq"
+
+# Callback data -> role value for the role selection buttons
+ROLE_CALLBACKS = {
+    "role_customer": "customer",
+    "role_driver": "driver",
+    "role_dispatcher": "dispatcher",
+    "role_admin": "admin",
+}
+
+# role value -> (app button, app url attribute on Config, menu buttons, title, message)
+_ROLE_MENUS = {
+    "admin": (
+        "📊 Admin Panel", "ADMIN_APP_URL",
+        [("👥 Foydalanuvchilar", "admin_users"), ("💰 Moliya", "admin_money"), ("⚙️ Sozlamalar", "admin_settings")],
+        "🔑 Admin Panel", "Admin paneliga xush kelibsiz!",
+    ),
+    "driver": (
+        "🚗 Haydovchi Applikatsiyasi", "DRIVER_APP_URL",
+        [("💰 Daromadim", "driver_earnings"), ("⭐ Reyting", "driver_rating"), ("🆘 Yordam", "driver_support")],
+        "🚗 Haydovchi Applikatsiyasi", "Haydovchi applikatsiyasiga xush kelibsiz!",
+    ),
+    "dispatcher": (
+        "📞 Dispatcher Panel", "DISPATCHER_APP_URL",
+        [("📋 Buyurtmalar", "dispatcher_orders"), ("👥 Haydovchilar", "dispatcher_drivers"), ("🆘 Yordam", "dispatcher_support")],
+        "📞 Dispatcher Panel", "Dispatcher paneliga xush kelibsiz!",
+    ),
+    "customer": (
+        "👤 Mijoz Applikatsiyasi", "CUSTOMER_APP_URL",
+        [("🚕 Taksi Buyurtma Qilish", "customer_order"), ("📋 Tarixim", "customer_history"), ("🆘 Yordam", "customer_support")],
+        "👤 Mijoz Applikatsiyasi", "Mijoz applikatsiyasiga xush kelibsiz!",
+    ),
+}
+
+# Callback data -> (text, app button, app url attribute) for screens that point at a web app
+_APP_SCREENS = {
+    "customer_order": ("🚕 *Taksi Buyurtma Qilish*\n\nTaksi buyurtmasini qilish uchun mijoz applikatsiyasini oching:",
+                       "👤 Mijoz Applikatsiyasi", "CUSTOMER_APP_URL"),
+    "driver_earnings": ("💰 *Mening Daromadim*\n\nSizning daromadingizni ko'rish uchun haydovchi applikatsiyasini oching:",
+                        "🚗 Haydovchi Applikatsiyasi", "DRIVER_APP_URL"),
+    "admin_users": ("👥 *Foydalanuvchilar*\n\nFoydalanuvchilarni boshqarish uchun admin panelini oching:",
+                    "🔑 Admin Panel", "ADMIN_APP_URL"),
+    "dispatcher_orders": ("📋 *Buyurtmalar*\n\nBuyurtmalarni boshqarish uchun dispatcher panelini oching:",
+                          "📞 Dispatcher Panel", "DISPATCHER_APP_URL"),
+}
+
+# Callback data for features that only exist in the web apps
+_OPEN_APP_CALLBACKS = ("customer_history", "customer_support", "driver_rating", "driver_support",
+                       "dispatcher_drivers", "dispatcher_support", "admin_money", "admin_settings")
+_OPEN_APP_TEXT = "📱 *Applikatsiyani Oching*\n\nBu funksiyani ishlatish uchun applikatsiyani oching:"
+
+def format_created(created_at: Optional[datetime]) -> str:
+    return created_at.strftime('%Y-%m-%d %H:%M') if created_at else ""
+
+class RoleMenu:
+    """Keyboard and pre-rendered text of one role's main menu"""
+    __slots__ = ("keyboard", "_prefix")
+
+    def __init__(self, keyboard: InlineKeyboardMarkup, title: str, message: str, role_label: str):
+        self.keyboard = keyboard
+        self._prefix = f"\n{title}\n\n{message}\n\n*Sizning roli:* {role_label}\n*Telefon:* "
+
+    def render(self, phone: str, created_at: Optional[datetime]) -> str:
+        """Menu text with the per-user fields filled in"""
+        return f"{self._prefix}{phone}\n*Yaratilgan:* {format_created(created_at)}\n    "
+
+class MenuRegistry:
+    """Every keyboard and static screen of the bot, keyed for O(1) lookup"""
+
+    def __init__(self, config):
+        self.welcome_keyboard = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("👤 Mijoz", callback_data="role_customer"),
+                InlineKeyboardButton("🚗 Haydovchi", callback_data="role_driver"),
+            ],
+            [
+                InlineKeyboardButton("📞 Dispatcher", callback_data="role_dispatcher"),
+                InlineKeyboardButton("🔑 Admin", callback_data="role_admin"),
+            ]
+        ])
+        self.profile_keyboard = InlineKeyboardMarkup(
+            [[InlineKeyboardButton("🔄 Roli O'zgartirish", callback_data="role_customer")]]
+        )
+        back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_menu")]])
+
+        self.role_menus: Dict[str, RoleMenu] = {}
+        for role, (app_label, url_attr, buttons, title, message) in _ROLE_MENUS.items():
+            rows = [[InlineKeyboardButton(app_label, url=getattr(config, url_attr))]]
+            rows += [[InlineKeyboardButton(label, callback_data=data)] for label, data in buttons]
+            self.role_menus[role] = RoleMenu(InlineKeyboardMarkup(rows), title, message, role.upper())
+
+        self.screens: Dict[str, Tuple[str, InlineKeyboardMarkup]] = {}
+        for data, (text, app_label, url_attr) in _APP_SCREENS.items():
+            self.screens[data] = (text, InlineKeyboardMarkup([[InlineKeyboardButton(app_label, url=getattr(config, url_attr))]]))
+        for data in _OPEN_APP_CALLBACKS:
+            self.screens[data] = (_OPEN_APP_TEXT, back_keyboard)
+        self.unknown_screen = (UNKNOWN_CALLBACK_TEXT, back_keyboard)
+
+    def role_menu(self, role) -> RoleMenu:
+        """Menu for a UserRole (or its value); unknown roles get the customer menu"""
+        return self.role_menus.get(getattr(role, "value", role)) or self.role_menus["customer"]
+
+    def screen(self, callback_data: str) -> Tuple[str, InlineKeyboardMarkup]:
+        """(text, keyboard) of a static callback screen"""
+        return self.screens.get(callback_data, self.unknown_screen)
+
+def render_profile(user) -> str:
+    """/profile text for a user snapshot"""
+    status = '✅ Faol' if user.is_active else '❌ Nofaol'
+    username = user.telegram_username if user.telegram_username else "Noma'lum"
+    return f"""
+👤 *Mening Profilim*
+
+*Ism:* {user.name}
+*Telefon:* {user.phone}
+*Roli:* {user.role.value.upper()}
+*Status:* {status}
+*Yaratilgan:* {format_created(user.created_at)}
+
+*Telegram:* @{username}
+    """
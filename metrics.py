@@ -0,0 +1,444 @@
+# =====================================================
+# 📊 METRICS & PROFILING
+# Handler / query latency histograms, event-loop lag, a Prometheus
+# text endpoint and an opt-in sampling profiler
+# =====================================================
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Seconds; fine at the bottom for cache hits and SQLite reads, coarse at the top
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        slot = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+class Histogram:
+    """Cumulative-bucket latency histogram, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> _HistogramChild:
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float, *labels) -> None:
+        self.labels(*labels).observe(value)
+
+    def time(self, *labels):
+        """with histogram.time("label"): ... observes the block's duration"""
+        return self.labels(*labels).time()
+
+    def samples(self) -> Iterator[str]:
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, values)} {total!r}"
+            yield f"{self.name}_count{_label_text(self.labelnames, values)} {cumulative}"
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, values)} {_number(value)}"
+
+class Gauge:
+    """Value read from a callback when the endpoint is scraped"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_number(self.read())}"
+
+class MetricsRegistry:
+    """Every metric of the process, rendered in the Prometheus text format
+
+    Components that already keep a stats() dict (processor, caches, hub,
+    scheduler...) are registered as a whole: each numeric entry becomes a
+    gauge named <prefix>_<key>, read at scrape time, so they cost nothing
+    in between.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._stats: Dict[str, Tuple[Callable[[], dict], str]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, factory())
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        gauge = Gauge(name, help, read)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict], help: str = "") -> None:
+        """Expose a component's stats() dict; registering a prefix again replaces it"""
+        with self._lock:
+            self._stats[prefix] = (stats, help)
+
+    def unregister_stats(self, prefix: str) -> None:
+        with self._lock:
+            self._stats.pop(prefix, None)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for prefix, (stats, help) in sorted(self._stats.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"⚠️ Metrics: {prefix} stats failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help or prefix.replace('_', ' ')} {key.replace('_', ' ')}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+# =====================================================
+# ⏱️ INSTRUMENTATION
+# =====================================================
+
+def timed(histogram: Histogram, *labels):
+    """Decorator recording an async function's latency, exceptions included"""
+    def decorate(fn):
+        child = histogram.labels(*labels)
+        clock = time.perf_counter
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                child.observe(clock() - started)
+        return wrapper
+    return decorate
+
+_STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+def instrument_engine(registry: MetricsRegistry, engine, name: str) -> None:
+    """Time every cursor execution of a (sync) engine, by statement kind
+
+    For an AsyncEngine pass engine.sync_engine. The start time is kept on
+    the connection, as in SQLAlchemy's own query-profiling recipe.
+    """
+    from sqlalchemy import event
+
+    queries = registry.histogram("taxi_db_query_seconds", "Database statement latency",
+                                 ("engine", "statement"))
+    errors = registry.counter("taxi_db_errors_total", "Database statements that raised", ("engine",))
+    children = {kind: queries.labels(name, kind.lower()) for kind in _STATEMENT_KINDS}
+    other = queries.labels(name, "other")
+    clock = time.perf_counter
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(clock())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = clock() - conn.info["query_started"].pop()
+        children.get(statement.lstrip()[:6].upper(), other).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+        errors.inc(name)
+
+class LoopLagMonitor:
+    """How late the event loop wakes a task that asked to sleep `interval`
+
+    Lag is time the loop spent running something else: blocking calls,
+    long synchronous handlers, CPU-bound work. One sleeping task, so the
+    cost is a timer wakeup per interval.
+    """
+
+    def __init__(self, registry: MetricsRegistry, interval: float = 0.5):
+        self.interval = interval
+        self.histogram = registry.histogram("taxi_event_loop_lag_seconds", "Event loop wakeup delay")
+        self.last = 0.0
+        self.max = 0.0
+        registry.gauge("taxi_event_loop_lag_last_seconds", "Most recent event loop wakeup delay",
+                       lambda: self.last)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "LoopLagMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, clock() - started - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.histogram.observe(lag)
+
+# =====================================================
+# 🔥 SAMPLING PROFILER
+# =====================================================
+
+class SamplingProfiler:
+    """Wall-clock stack sampler whose output feeds flamegraph.pl / speedscope
+
+    Nothing runs until start(): then a daemon thread reads every other
+    thread's current frame each `interval` seconds and counts the folded
+    stacks ("thread;outer (file.py);...;inner (file.py) 42"). Being
+    wall-clock, an idle event loop shows up under its selector call.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks: _Tally = _Tally()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"🔥 Sampling profiler started ({self.interval * 1000:.1f} ms)")
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            logger.info(f"🔥 Sampling profiler stopped after {self.samples} samples")
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def dump(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return path
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{getattr(code, 'co_qualname', code.co_name)} "
+                                 f"({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+# =====================================================
+# 🌐 HTTP ENDPOINT
+# =====================================================
+
+class MetricsServer:
+    """GET /metrics (Prometheus text) and, with a profiler, /debug/profile
+
+    /debug/profile?seconds=N samples for N seconds and returns the folded
+    stacks; /debug/profile/start and /debug/profile/stop toggle it.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "0.0.0.0", port: int = 9100,
+                 profiler: Optional[SamplingProfiler] = None, max_profile_seconds: float = 300.0):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.profiler = profiler
+        self.max_profile_seconds = max_profile_seconds
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "MetricsServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"📊 Metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split(" ")
+            url = urlsplit(parts[1]) if len(parts) >= 2 and parts[0] == "GET" else None
+            status, body = b"404 Not Found", ""
+            content_type = b"text/plain; charset=utf-8"
+            if url is not None and url.path == "/metrics":
+                status, body = b"200 OK", self.registry.render()
+                content_type = b"text/plain; version=0.0.4; charset=utf-8"
+            elif url is not None and self.profiler is not None and url.path.startswith("/debug/profile"):
+                status, body = await self._profile(url)
+            payload = body.encode()
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: " + content_type
+                         + f"\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _profile(self, url) -> Tuple[bytes, str]:
+        profiler = self.profiler
+        if url.path == "/debug/profile/start":
+            profiler.start()
+            return b"200 OK", "started\n"
+        if url.path == "/debug/profile/stop":
+            return b"200 OK", profiler.stop()
+        if url.path != "/debug/profile":
+            return b"404 Not Found", ""
+        if profiler.running:
+            return b"409 Conflict", "profiler already running\n"
+        try:
+            seconds = float(parse_qs(url.query).get("seconds", ["10"])[0])
+        except ValueError:
+            return b"400 Bad Request", "seconds must be a number\n"
+        profiler.start()
+        try:
+            await asyncio.sleep(min(max(seconds, 0.0), self.max_profile_seconds))
+        finally:
+            stacks = profiler.stop()
+        return b"200 OK", stacks
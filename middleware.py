@@ -0,0 +1,294 @@
+# =====================================================
+# 🚦 UPDATE MIDDLEWARE
+# Per-user rate limits, duplicate taps and a flood-safe send scheduler
+# =====================================================
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+# =====================================================
+# 📥 INCOMING UPDATES
+# =====================================================
+
+class UpdateGuard:
+    """Admission check for incoming updates (ChatOrderedUpdateProcessor.admission)
+
+    Runs when an update arrives, before it waits behind the same chat's
+    earlier updates, so a burst of taps is judged by when it was made.
+    Drops updates from users over their token bucket and repeated taps of
+    the same button: a callback query whose data equals the user's
+    previous callback within dedup_seconds. Dropped callback queries are
+    not answered: that would cost the same Bot API call the guard is there
+    to save, and the press that got through answers the spinner. Per-user
+    state is an LRU bounded by max_users.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 5.0, dedup_seconds: float = 2.0,
+                 max_users: int = 100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_seconds = dedup_seconds
+        self.max_users = max_users
+        self._clock = clock
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._last_callback: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+
+        self.passed = 0
+        self.rate_limited = 0
+        self.duplicates = 0
+
+    def _remember(self, table: OrderedDict, key: int, value) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        if len(table) > self.max_users:
+            table.popitem(last=False)
+
+    def check(self, user_id: int, callback_data: Optional[str] = None) -> Optional[str]:
+        """None if the update may run, else why it is dropped ("duplicate" / "rate_limited")"""
+        now = self._clock()
+        if callback_data is not None:
+            previous = self._last_callback.get(user_id)
+            if previous is not None and previous[0] == callback_data and now - previous[1] < self.dedup_seconds:
+                self.duplicates += 1
+                return "duplicate"
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+        self._remember(self._buckets, user_id, bucket)
+        if not bucket.take(now):
+            self.rate_limited += 1
+            return "rate_limited"
+        if callback_data is not None:
+            self._remember(self._last_callback, user_id, (callback_data, now))
+        self.passed += 1
+        return None
+
+    def admit(self, update: object) -> bool:
+        if not isinstance(update, Update) or update.effective_user is None:
+            return True
+        query = update.callback_query
+        return self.check(update.effective_user.id, query.data if query is not None else None) is None
+
+    def stats(self) -> dict:
+        return {
+            "passed": self.passed,
+            "rate_limited": self.rate_limited,
+            "duplicates": self.duplicates,
+            "users": len(self._buckets),
+        }
+
+# =====================================================
+# 📤 OUTGOING BOT API CALLS
+# =====================================================
+
+# Edits of one message: a newer queued edit replaces an older one
+_EDIT_ENDPOINTS = ("editMessageText", "editMessageReplyMarkup", "editMessageCaption")
+# Identical sends to one chat that are queued together go out once
+_SEND_ENDPOINTS = ("sendMessage",)
+
+class _Pending:
+    __slots__ = ("args", "kwargs", "future")
+
+    def __init__(self, args, kwargs, future: asyncio.Future):
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+
+def _coalesce_key(endpoint: str, data: Dict[str, Any]) -> Optional[tuple]:
+    if endpoint in _EDIT_ENDPOINTS:
+        target = data.get("inline_message_id") or (data.get("chat_id"), data.get("message_id"))
+        return (endpoint, target)
+    if endpoint in _SEND_ENDPOINTS:
+        return (endpoint, data.get("chat_id"), json.dumps(data, sort_keys=True, default=str))
+    return None
+
+class SendScheduler(BaseRateLimiter):
+    """Global Bot API send scheduler (ExtBot rate_limiter)
+
+    Every request waits for a token from the bot-wide bucket (Telegram
+    allows about 30 messages per second) and, if it targets a chat, from
+    that chat's bucket (about 1 per second in private chats, 20 per minute
+    in groups). The bot-wide bucket holds a single token, so sends are
+    paced evenly rather than bursting at the start of every second. A 429
+    pauses all sending for retry_after and the request is retried,
+    instead of every worker hammering the API at once.
+
+    While a request waits its turn, a newer edit of the same message takes
+    its place and identical sendMessage calls to the same chat join it;
+    every caller gets the result of the one call that is made.
+    """
+
+    def __init__(self, overall_per_second: float = 30.0, chat_per_second: float = 1.0,
+                 group_per_minute: float = 20.0, chat_burst: float = 2.0, max_retries: int = 3,
+                 max_chats: int = 100000, clock=time.monotonic):
+        self.overall_per_second = overall_per_second
+        self.chat_per_second = chat_per_second
+        self.group_per_minute = group_per_minute
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._clock = clock
+        self._overall: Optional[TokenBucket] = None
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._pending: Dict[tuple, _Pending] = {}
+        self._open: Optional[asyncio.Event] = None  # cleared while a 429 pause is in effect
+
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.throttled_s = 0.0
+
+    async def initialize(self) -> None:
+        self._overall = TokenBucket(self.overall_per_second, 1.0, self._clock())
+        self._open = asyncio.Event()
+        self._open.set()
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Idle chats have full buckets; forgetting them changes nothing
+                for key in [k for k, b in self._chats.items() if b.full(now)]:
+                    del self._chats[key]
+            try:
+                is_group = int(chat_id) < 0
+            except (TypeError, ValueError):
+                is_group = True  # "@channelusername"
+            rate = self.group_per_minute / 60.0 if is_group else self.chat_per_second
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    async def _acquire(self, chat_id) -> None:
+        started = self._clock()
+        while True:
+            await self._open.wait()
+            now = self._clock()
+            chat = self._chat_bucket(chat_id, now) if chat_id is not None else None
+            wait = max(self._overall.delay(now), chat.delay(now) if chat is not None else 0.0)
+            if wait <= 0.0:
+                self._overall.take(now)
+                if chat is not None:
+                    chat.take(now)
+                self.throttled_s += now - started
+                return
+            await asyncio.sleep(wait)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Any],
+    ) -> Any:
+        if self._overall is None:
+            await self.initialize()
+        key = _coalesce_key(endpoint, data)
+        if key is not None:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.args, pending.kwargs = args, kwargs
+                self.coalesced += 1
+                return await asyncio.shield(pending.future)
+            pending = self._pending[key] = _Pending(args, kwargs, asyncio.get_running_loop().create_future())
+
+        try:
+            chat_id = data.get("chat_id") if endpoint != "answerCallbackQuery" else None
+            attempt = 0
+            while True:
+                await self._acquire(chat_id)
+                if key is not None and self._pending.get(key) is pending:
+                    # From here on a new request for the key starts its own turn
+                    del self._pending[key]
+                    args, kwargs = pending.args, pending.kwargs
+                try:
+                    result = await callback(*args, **kwargs)
+                    self.sent += 1
+                    break
+                except RetryAfter as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    self.retries += 1
+                    await self._pause(e.retry_after)
+        except BaseException as e:
+            if key is not None:
+                if self._pending.get(key) is pending:
+                    del self._pending[key]
+                if not pending.future.done():
+                    if isinstance(e, Exception):
+                        pending.future.set_exception(e)
+                        # Marks it retrieved even when nobody joined
+                        pending.future.exception()
+                    else:
+                        pending.future.cancel()
+            raise
+        if key is not None:
+            pending.future.set_result(result)
+        return result
+
+    async def _pause(self, retry_after) -> None:
+        delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+        if self._open.is_set():
+            logger.warning(f"⏳ Bot API flood limit hit, pausing sends for {delay:.1f}s")
+            self._open.clear()
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._open.set()
+        else:
+            await self._open.wait()
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "throttled_s": round(self.throttled_s, 3),
+            "chats": len(self._chats),
+        }
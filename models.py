@@ -0,0 +1,178 @@
+# =====================================================
+# 🗄️ DATABASE MODELS
+# SQLAlchemy ORM tables; `import taxi` leaves them unloaded until first use
+# =====================================================
+
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Enum as SQLEnum, Boolean, Index, literal_column
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+
+from rollups import OrderRollups
+from taxi import ACTIVE_ORDER_STATUSES, OrderStatus, UserRole, user_cache
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = "users"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    phone = Column(String, unique=True, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    role = Column(SQLEnum(UserRole), nullable=False, default=UserRole.CUSTOMER)
+    telegram_id = Column(String, nullable=True, unique=True)
+    telegram_username = Column(String, nullable=True)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    orders_as_customer = relationship("Order", foreign_keys="Order.customer_id", back_populates="customer")
+    orders_as_driver = relationship("Order", foreign_keys="Order.driver_id", back_populates="driver")
+    dispatcher_calls = relationship("DispatcherCall", back_populates="dispatcher")
+    driver_locations = relationship("DriverLocation", back_populates="driver")
+
+class Order(Base):
+    __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset order of the streaming exports / date-range reports
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_completed_at_id", "completed_at", "id"),
+        # "My history" of customers and drivers (see order_history.py)
+        Index("ix_orders_customer_created_at_id", "customer_id", "created_at", "id"),
+        Index("ix_orders_driver_created_at_id", "driver_id", "created_at", "id"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    customer_id = Column(String, ForeignKey("users.id"), nullable=False)
+    driver_id = Column(String, ForeignKey("users.id"), nullable=True)
+    dispatcher_id = Column(String, ForeignKey("users.id"), nullable=True)
+    
+    pickup_location = Column(String, nullable=False)
+    destination_location = Column(String, nullable=False)
+    passengers_count = Column(Integer, default=1)
+    order_type = Column(String, default="standard")
+    
+    status = Column(SQLEnum(OrderStatus), default=OrderStatus.PENDING)
+    estimated_price = Column(Float, nullable=True)
+    final_price = Column(Float, nullable=True)
+    
+    customer_phone = Column(String, nullable=False)
+    customer_name = Column(String, nullable=True)
+    customer_comment = Column(String, nullable=True)
+    
+    pickup_lat = Column(Float, nullable=True)
+    pickup_lng = Column(Float, nullable=True)
+    destination_lat = Column(Float, nullable=True)
+    destination_lng = Column(Float, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    assigned_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    scheduled_time = Column(DateTime, nullable=True)
+
+    # Bumped by every status change (see order_lifecycle.py); ORM flushes check it too
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    __mapper_args__ = {"version_id_col": version}
+    
+    # Relationships
+    customer = relationship("User", foreign_keys=[customer_id], back_populates="orders_as_customer")
+    driver = relationship("User", foreign_keys=[driver_id], back_populates="orders_as_driver")
+
+# Literal values, not bound parameters, so SQLite can match queries against the partial index
+ACTIVE_ORDER_FILTER = Order.status.in_([literal_column(f"'{status.name}'") for status in ACTIVE_ORDER_STATUSES])
+Index("ix_orders_active_created_at_id", Order.created_at, Order.id,
+      sqlite_where=ACTIVE_ORDER_FILTER, postgresql_where=ACTIVE_ORDER_FILTER)
+
+class DriverLocation(Base):
+    __tablename__ = "driver_locations"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    driver_id = Column(String, ForeignKey("users.id"), nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    is_available = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    driver = relationship("User", back_populates="driver_locations")
+
+class DriverPosition(Base):
+    """Current position of a driver - one row per driver, upserted in bulk"""
+    __tablename__ = "driver_positions"
+
+    driver_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    is_available = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class DriverLocationHistory(Base):
+    """Append-only trail of driver positions"""
+    __tablename__ = "driver_location_history"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    driver_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class DispatcherCall(Base):
+    __tablename__ = "dispatcher_calls"
+    __table_args__ = (
+        Index("ix_dispatcher_calls_received_at_id", "received_at", "id"),
+        Index("ix_dispatcher_calls_completed_at_id", "completed_at", "id"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    dispatcher_id = Column(String, ForeignKey("users.id"), nullable=False)
+    order_id = Column(String, ForeignKey("orders.id"), nullable=True)
+    
+    customer_phone = Column(String, nullable=False)
+    customer_name = Column(String, nullable=True)
+    customer_location = Column(String, nullable=True)
+    passenger_count = Column(Integer, default=1)
+    call_notes = Column(String, nullable=True)
+    # Kept so a call recovered after a restart is queued as it was taken
+    customer_class = Column(String, nullable=True)
+    destination = Column(String, nullable=True)
+    pickup_lat = Column(Float, nullable=True)
+    pickup_lng = Column(Float, nullable=True)
+    
+    call_status = Column(String, default="received")
+    received_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    
+    dispatcher = relationship("User", back_populates="dispatcher_calls")
+
+class RollupCounters:
+    """Counters shared by the order rollup tables (see rollups.py)"""
+    completed_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    trip_seconds = Column(Float, nullable=False, default=0.0)
+    timed_trips = Column(Integer, nullable=False, default=0)
+
+class OrderRollupHourly(RollupCounters, Base):
+    __tablename__ = "order_rollup_hourly"
+
+    bucket = Column(DateTime, primary_key=True)
+
+class OrderRollupDaily(RollupCounters, Base):
+    __tablename__ = "order_rollup_daily"
+
+    bucket = Column(DateTime, primary_key=True)
+
+class DriverRollupDaily(RollupCounters, Base):
+    __tablename__ = "driver_rollup_daily"
+
+    driver_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+
+# Telegram user lookups - role changes made through the ORM invalidate entries
+user_cache.invalidate_on_change(User)
+
+order_rollups = OrderRollups(OrderRollupHourly, OrderRollupDaily, DriverRollupDaily)
+order_rollups.watch(Order)
@@ -0,0 +1,102 @@
+# =====================================================
+# 📜 ORDER HISTORY QUERIES
+# Keyset-paginated "my history" and open orders lists
+# =====================================================
+
+from typing import Iterable, List, NamedTuple, Optional
+
+from keyset import decode_cursor, encode_cursor
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class HistoryPage(NamedTuple):
+    orders: List  # Order rows of this page
+    next_cursor: Optional[str]  # None on the last page
+
+# =====================================================
+# 🧱 STATEMENTS
+# =====================================================
+# Each list walks one index in (created_at, id) order and seeks past the
+# cursor instead of using OFFSET, so page N costs the same as page 1.
+
+def _page(stmt, limit: int, cursor: Optional[str], newest_first: bool):
+    from sqlalchemy import tuple_
+    from taxi import Order
+
+    key = tuple_(Order.created_at, Order.id)
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        after = tuple_(created_at, order_id)
+        stmt = stmt.where(key < after if newest_first else key > after)
+    if newest_first:
+        stmt = stmt.order_by(Order.created_at.desc(), Order.id.desc())
+    else:
+        stmt = stmt.order_by(Order.created_at, Order.id)
+    # One extra row tells whether there is a next page
+    return stmt.limit(_clamp(limit) + 1)
+
+def customer_history_query(customer_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    """Newest first; served by ix_orders_customer_created_at_id"""
+    from sqlalchemy import select
+    from taxi import Order
+    return _page(select(Order).where(Order.customer_id == customer_id), limit, cursor, newest_first=True)
+
+def driver_history_query(driver_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    """Newest first; served by ix_orders_driver_created_at_id"""
+    from sqlalchemy import select
+    from taxi import Order
+    return _page(select(Order).where(Order.driver_id == driver_id), limit, cursor, newest_first=True)
+
+def open_orders_query(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                      statuses: Optional[Iterable] = None):
+    """Oldest first, as dispatchers work them; served by the partial ix_orders_active_created_at_id"""
+    from sqlalchemy import select
+    from taxi import ACTIVE_ORDER_FILTER, Order
+
+    stmt = select(Order).where(ACTIVE_ORDER_FILTER)
+    if statuses is not None:
+        stmt = stmt.where(Order.status.in_(list(statuses)))
+    return _page(stmt, limit, cursor, newest_first=False)
+
+def _clamp(limit: int) -> int:
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def to_page(orders: List, limit: int) -> HistoryPage:
+    """Trim the look-ahead row and derive the cursor of the next page"""
+    limit = _clamp(limit)
+    if len(orders) <= limit:
+        return HistoryPage(list(orders), None)
+    orders = list(orders[:limit])
+    last = orders[-1]
+    return HistoryPage(orders, encode_cursor(last.created_at, last.id))
+
+# =====================================================
+# 🔍 QUERIES
+# =====================================================
+
+async def _fetch(stmt, limit: int, session) -> HistoryPage:
+    if session is not None:
+        return to_page((await session.scalars(stmt)).all(), limit)
+    from taxi import db_session
+    async with db_session() as session:
+        return to_page((await session.scalars(stmt)).all(), limit)
+
+async def customer_history(customer_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                           session=None) -> HistoryPage:
+    """A customer's orders, newest first"""
+    return await _fetch(customer_history_query(customer_id, limit, cursor), limit, session)
+
+async def driver_history(driver_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                         session=None) -> HistoryPage:
+    """A driver's orders, newest first"""
+    return await _fetch(driver_history_query(driver_id, limit, cursor), limit, session)
+
+async def open_orders(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                      statuses: Optional[Iterable] = None, session=None) -> HistoryPage:
+    """Pending/assigned/accepted/started orders, oldest first"""
+    return await _fetch(open_orders_query(limit, cursor, statuses), limit, session)
+
+def page_sync(stmt, limit: int, db) -> HistoryPage:
+    """Run one of the *_query statements on a sync Session"""
+    return to_page(db.scalars(stmt).all(), limit)
@@ -0,0 +1,290 @@
+# =====================================================
+# 🔄 ORDER LIFECYCLE
+# Status transitions as single compare-and-set UPDATEs
+# =====================================================
+
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# event -> (statuses it may start from, status it leads to, timestamp column it stamps)
+TRANSITIONS = {
+    "assign": (("PENDING",), "ASSIGNED", "assigned_at"),
+    "accept": (("PENDING", "ASSIGNED"), "ACCEPTED", "assigned_at"),
+    "release": (("ASSIGNED", "ACCEPTED"), "PENDING", None),
+    "start": (("ACCEPTED",), "STARTED", "started_at"),
+    "complete": (("STARTED",), "COMPLETED", "completed_at"),
+    "cancel": (("PENDING", "ASSIGNED", "ACCEPTED", "STARTED"), "CANCELLED", "completed_at"),
+}
+
+# A driver with an order in one of these is not free for another
+ACTIVE_STATUSES = ("ASSIGNED", "ACCEPTED", "STARTED")
+
+# Events that end the driver's part in an order
+_FREES_DRIVER = ("release", "complete", "cancel")
+
+class TransitionResult(NamedTuple):
+    applied: bool
+    order_id: str
+    status: Optional[object]  # OrderStatus after the attempt; None if the order does not exist
+    version: Optional[int]
+    driver_id: Optional[str]
+    reason: Optional[str] = None  # why a transition was refused
+    freed_driver_id: Optional[str] = None  # driver an applied release / complete / cancel set free
+
+# Callbacks(driver_id, is_available) of the in-memory driver views (see add_driver_listener)
+_driver_listeners: List[Callable[[str, bool], None]] = []
+
+def _statement(event: str, order_id: str, driver_id: Optional[str], expected_version: Optional[int],
+               final_price: Optional[float], now: datetime):
+    """UPDATE ... WHERE id AND status (AND version) - the row either moves or nothing happens"""
+    from sqlalchemy import and_, func, or_, update
+    from taxi import Order, OrderStatus
+
+    if event not in TRANSITIONS:
+        raise ValueError(f"Unknown order event {event!r}; expected one of {sorted(TRANSITIONS)}")
+    sources, target, stamp = TRANSITIONS[event]
+    orders = Order.__table__
+    c = orders.c
+
+    conditions = [c.id == order_id, c.status.in_([OrderStatus[s] for s in sources])]
+    if expected_version is not None:
+        conditions.append(c.version == expected_version)
+    values = {"status": OrderStatus[target], "version": c.version + 1}
+    if stamp == "assigned_at":
+        # An accepted assignment keeps the time it was first assigned
+        values["assigned_at"] = func.coalesce(c.assigned_at, now)
+    elif stamp is not None:
+        values[stamp] = now
+
+    if event in ("assign", "accept"):
+        if driver_id is None:
+            raise ValueError(f"'{event}' needs a driver_id")
+        values["driver_id"] = driver_id
+        if event == "accept":
+            # Anyone may take a pending order; an assigned one only its driver
+            conditions.append(or_(c.status == OrderStatus.PENDING,
+                                  and_(c.status == OrderStatus.ASSIGNED, c.driver_id == driver_id)))
+    elif event == "release":
+        values.update(driver_id=None, assigned_at=None)
+        if driver_id is not None:
+            conditions.append(c.driver_id == driver_id)
+    elif driver_id is not None:
+        conditions.append(c.driver_id == driver_id)
+    if event == "complete" and final_price is not None:
+        values["final_price"] = final_price
+
+    return (
+        update(orders).where(*conditions).values(**values)
+        .returning(c.status, c.version, c.driver_id, c.final_price, c.started_at, c.completed_at, c.created_at)
+    )
+
+def _refusal(event: str, row, driver_id: Optional[str], expected_version: Optional[int]) -> str:
+    if row is None:
+        return "not_found"
+    status, version, current_driver = row
+    if status.name not in TRANSITIONS[event][0]:
+        return "wrong_status"
+    if expected_version is not None and version != expected_version:
+        return "stale_version"
+    if driver_id is not None and current_driver not in (None, driver_id):
+        return "other_driver"
+    return "conflict"
+
+def _current_statement(order_id: str):
+    from sqlalchemy import select
+    from taxi import Order
+    return select(Order.status, Order.version, Order.driver_id).where(Order.id == order_id)
+
+def _with_freed(result: TransitionResult, change: Optional[Tuple[str, bool]]) -> TransitionResult:
+    if change is not None and change[1]:
+        return result._replace(freed_driver_id=change[0])
+    return result
+
+def _finish(event: str, order_id: str, row, current, driver_id, expected_version) -> TransitionResult:
+    if row is not None:
+        return TransitionResult(True, order_id, row[0], row[1], row[2])
+    reason = _refusal(event, current, driver_id, expected_version)
+    if current is None:
+        return TransitionResult(False, order_id, None, None, None, reason)
+    return TransitionResult(False, order_id, current[0], current[1], current[2], reason)
+
+def _driver_change(event: str, row, driver_id: Optional[str]) -> Optional[Tuple[str, bool]]:
+    """(driver_id, is_available) an applied event means for driver_positions, if anything"""
+    if event in ("assign", "accept"):
+        return row[2], False
+    freed = driver_id if event == "release" else row[2]
+    if event in _FREES_DRIVER and freed is not None:
+        return freed, True
+    return None
+
+def _availability_statement(driver_ids: Sequence[str], is_available: bool):
+    from sqlalchemy import update
+    from taxi import DriverPosition
+    positions = DriverPosition.__table__
+    return update(positions).where(positions.c.driver_id.in_(list(driver_ids))).values(is_available=is_available)
+
+def _record_rollups(connection, row) -> None:
+    from taxi import order_rollups
+    status, _, driver_id, final_price, started_at, completed_at, created_at = row
+    order_rollups.record(connection, [(status, driver_id, final_price, started_at, completed_at, created_at)])
+
+# =====================================================
+# 🚦 TRANSITIONS
+# =====================================================
+
+def transition_sync(db, order_id: str, event: str, driver_id: Optional[str] = None,
+                    expected_version: Optional[int] = None, final_price: Optional[float] = None,
+                    now: Optional[datetime] = None) -> TransitionResult:
+    """Apply one lifecycle event inside the caller's transaction
+
+    The caller commits, then hands an applied result to publish_transition().
+    The driver's driver_positions.is_available follows in the same
+    transaction: busy once assigned or accepted, free again once released,
+    completed or cancelled.
+    """
+    now = now or datetime.utcnow()
+    if event == "release" and driver_id is None:
+        # Released from whichever driver holds it now, so that driver can be set free
+        current = db.execute(_current_statement(order_id)).first()
+        driver_id = current[2] if current is not None else None
+    row = db.execute(_statement(event, order_id, driver_id, expected_version, final_price, now)).first()
+    current = change = None
+    if row is None:
+        current = db.execute(_current_statement(order_id)).first()
+    else:
+        if event in ("complete", "cancel"):
+            _record_rollups(db.connection(), row)
+        change = _driver_change(event, row, driver_id)
+        if change is not None:
+            db.execute(_availability_statement([change[0]], change[1]))
+    return _with_freed(_finish(event, order_id, row, current, driver_id, expected_version), change)
+
+def assign_many(db, pairs: Sequence[Tuple[str, str]], now: Optional[datetime] = None,
+                chunk: int = 500) -> List[TransitionResult]:
+    """The "assign" event for many (order_id, driver_id) pairs, one UPDATE ... RETURNING per chunk
+
+    Same compare-and-set as transition_sync: only orders still PENDING
+    move, and only to a driver without another ASSIGNED / ACCEPTED /
+    STARTED order (refused with reason "driver_busy"; a driver listed
+    twice gets the first order). Exactly the drivers whose order landed
+    become unavailable in driver_positions. Inside the caller's
+    transaction; results are in input order.
+    """
+    from sqlalchemy import and_, case, exists, select, update
+    from taxi import Order, OrderStatus
+
+    now = now or datetime.utcnow()
+    orders = Order.__table__
+    c = orders.c
+    other = orders.alias("active")
+    active = [OrderStatus[name] for name in ACTIVE_STATUSES]
+    seen = set()
+    unique = [(order_id, driver_id) for order_id, driver_id in pairs
+              if driver_id not in seen and not seen.add(driver_id)]
+    landed = {}
+    for i in range(0, len(unique), chunk):
+        part = dict(unique[i:i + chunk])
+        driver = case(part, value=c.id)
+        busy = exists().where(and_(other.c.driver_id == driver, other.c.status.in_(active)))
+        rows = db.execute(
+            update(orders)
+            .where(c.id.in_(list(part)), c.status == OrderStatus.PENDING, ~busy)
+            .values(driver_id=driver, status=OrderStatus.ASSIGNED, assigned_at=now, version=c.version + 1)
+            .returning(c.id, c.status, c.version, c.driver_id)
+        ).all()
+        landed.update((row[0], row[1:]) for row in rows)
+    if landed:
+        db.execute(_availability_statement([row[2] for row in landed.values()], False))
+    missed = [order_id for order_id, _ in pairs if order_id not in landed]
+    current = {}
+    if missed:
+        current = {row[0]: row[1:] for row in db.execute(
+            select(c.id, c.status, c.version, c.driver_id).where(c.id.in_(missed)))}
+    results = []
+    for order_id, driver_id in pairs:
+        row = landed.get(order_id)
+        if row is not None and row[2] == driver_id:
+            results.append(TransitionResult(True, order_id, *row))
+        elif row is None and order_id in current and current[order_id][0] == OrderStatus.PENDING:
+            results.append(TransitionResult(False, order_id, *current[order_id], reason="driver_busy"))
+        else:
+            results.append(_finish("assign", order_id, None, current.get(order_id, row), driver_id, None))
+    return results
+
+async def transition(order_id: str, event: str, driver_id: Optional[str] = None,
+                     expected_version: Optional[int] = None, final_price: Optional[float] = None,
+                     session=None, now: Optional[datetime] = None) -> TransitionResult:
+    """Apply one lifecycle event
+
+    With a session the caller owns the transaction (and calls
+    publish_transition() after committing); without one the event runs
+    and commits in its own write session and is published right away. In
+    that case the order is first read on a reader connection, so drivers
+    who already lost a race are turned away without queueing for the writer.
+    """
+    if session is None:
+        from taxi import db_session, db_write_session
+        async with db_session() as reader:
+            current = (await reader.execute(_current_statement(order_id))).first()
+        reason = _refusal(event, current, driver_id, expected_version)
+        if reason != "conflict":
+            return _finish(event, order_id, None, current, driver_id, expected_version)
+        async with db_write_session() as session:
+            result = await transition(order_id, event, driver_id, expected_version, final_price, session, now)
+            await session.commit()
+        if result.applied:
+            publish_transition(result)
+        return result
+
+    now = now or datetime.utcnow()
+    if event == "release" and driver_id is None:
+        current = (await session.execute(_current_statement(order_id))).first()
+        driver_id = current[2] if current is not None else None
+    row = (await session.execute(_statement(event, order_id, driver_id, expected_version, final_price, now))).first()
+    current = change = None
+    if row is None:
+        current = (await session.execute(_current_statement(order_id))).first()
+    else:
+        if event in ("complete", "cancel"):
+            connection = await session.connection()
+            await connection.run_sync(_record_rollups, row)
+        change = _driver_change(event, row, driver_id)
+        if change is not None:
+            await session.execute(_availability_statement([change[0]], change[1]))
+    result = _with_freed(_finish(event, order_id, row, current, driver_id, expected_version), change)
+    if result.applied:
+        logger.info(f"🔄 Order {order_id} {event} -> {result.status.value} (v{result.version})")
+    return result
+
+def publish_transition(result: TransitionResult) -> None:
+    """Push a committed transition to the order's real-time subscribers, the demand heatmap and the driver views"""
+    from taxi import demand_heatmap, realtime_hub
+    realtime_hub.publish_order_status(result.order_id, result.status, result.version, result.driver_id)
+    demand_heatmap.track_order(result.order_id, result.status)
+    if result.freed_driver_id is not None:
+        _notify_drivers(result.freed_driver_id, True)
+    elif result.driver_id is not None and getattr(result.status, "name", result.status) in ACTIVE_STATUSES:
+        _notify_drivers(result.driver_id, False)
+
+def add_driver_listener(callback: Callable[[str, bool], None]) -> None:
+    """Call callback(driver_id, is_available) when a published transition starts or ends a driver's trip"""
+    _driver_listeners.append(callback)
+
+def _notify_drivers(driver_id: str, is_available: bool) -> None:
+    for callback in _driver_listeners:
+        try:
+            callback(driver_id, is_available)
+        except Exception as e:
+            logger.error(f"❌ Driver availability listener failed: {e}")
+
+async def accept_order(order_id: str, driver_id: str, expected_version: Optional[int] = None) -> TransitionResult:
+    """Driver taps "accept" - exactly one of several racing drivers wins"""
+    return await transition(order_id, "accept", driver_id, expected_version)
+
+def allowed_events(status) -> Tuple[str, ...]:
+    """Events that may be applied to an order in `status`"""
+    name = getattr(status, "name", status)
+    return tuple(event for event, (sources, _, _) in TRANSITIONS.items() if name in sources)
@@ -0,0 +1,295 @@
+# =====================================================
+# 💰 FARE ESTIMATION
+# Vectorized distance, duration and tariff for batches of orders
+# =====================================================
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from geo import DEFAULT_CELL_SIZE_DEG, Cell, cell_center, haversine_pairs
+
+logger = logging.getLogger(__name__)
+
+class Tariff(NamedTuple):
+    base_fare: float  # UZS
+    per_km: float
+    per_min: float = 0.0
+    minimum_fare: float = 0.0
+
+# Same numbers the customer web app shows (customer.js calculateFare)
+DEFAULT_TARIFFS: Dict[str, Tariff] = {
+    "standard": Tariff(50000.0, 5000.0),
+    "premium": Tariff(75000.0, 5000.0),
+    "shared": Tariff(35000.0, 5000.0),
+}
+
+class FareQuote(NamedTuple):
+    distance_km: float
+    duration_min: float
+    surge: float
+    price: float
+
+# (origin lat, origin lng, destination lat, destination lng) of two cell centres -> road km
+RouteProvider = Callable[[float, float, float, float], float]
+
+class RouteCache:
+    """LRU of road distances between (origin cell, destination cell) pairs"""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[Cell, Cell], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[Cell, Cell]) -> Optional[float]:
+        with self._lock:
+            km = self._entries.get(key)
+            if km is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return km
+
+    def put(self, key: Tuple[Cell, Cell], km: float) -> None:
+        with self._lock:
+            self._entries[key] = km
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+def _cell_keys(lat: np.ndarray, lng: np.ndarray, cell_size_deg: float) -> np.ndarray:
+    """One int64 per point for its grid cell (same grid as geo.cell_of)"""
+    cy = np.floor(lat / cell_size_deg).astype(np.int64)
+    cx = np.floor(lng / cell_size_deg).astype(np.int64)
+    return (cy << 32) + cx
+
+def _cell_of_key(key: int) -> Cell:
+    cy = (key + (1 << 31)) >> 32
+    return (cy, key - (cy << 32))
+
+class FareEngine:
+    """Prices whole batches of orders with a handful of numpy passes
+
+    Distance is the haversine length times a road factor, unless a route
+    provider (e.g. a routing service) is given: its answers are memoized
+    per (origin cell, destination cell) pair on a fine grid, and one batch
+    asks it once per distinct pair. Surge is a multiplier per pickup cell
+    of the dispatch grid.
+    """
+
+    def __init__(self, tariffs: Optional[Mapping[str, Tariff]] = None, road_factor: float = 1.3,
+                 average_speed_kmh: float = 25.0, surge: Optional[Mapping[Cell, float]] = None,
+                 max_surge: float = 3.0, surge_cell_size_deg: float = DEFAULT_CELL_SIZE_DEG,
+                 route_provider: Optional[RouteProvider] = None, route_cell_size_deg: float = 0.002,
+                 route_cache_size: int = 100000, rounding: float = 100.0):
+        self.tariffs = dict(tariffs or DEFAULT_TARIFFS)
+        self.default_type = "standard" if "standard" in self.tariffs else next(iter(self.tariffs))
+        self.road_factor = road_factor
+        self.average_speed_kmh = average_speed_kmh
+        self.max_surge = max_surge
+        self.surge_cell_size_deg = surge_cell_size_deg
+        self.route_provider = route_provider
+        self.route_cell_size_deg = route_cell_size_deg
+        self.route_cache = RouteCache(route_cache_size)
+        self.rounding = rounding
+        self._surge: Dict[Cell, float] = {}
+        # (sorted cell keys for searchsorted, multipliers) - swapped as one, intake threads price concurrently
+        self._surge_table = (np.empty(0, dtype=np.int64), np.empty(0))
+        self.set_surge(surge or {})
+
+    @classmethod
+    def from_config(cls, **overrides) -> "FareEngine":
+        """Engine using the dispatching and pricing settings from Config"""
+        from taxi import Config
+        settings = {
+            "road_factor": Config.ROAD_FACTOR,
+            "average_speed_kmh": Config.AVERAGE_SPEED_KMH,
+            "max_surge": Config.SURGE_MAX,
+            "route_cache_size": Config.ROUTE_CACHE_SIZE,
+            "rounding": Config.FARE_ROUNDING,
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def set_surge(self, multipliers: Mapping[Cell, float]) -> None:
+        """Replace the surge map; cells not in it price at 1.0"""
+        surge = {tuple(cell): min(max(float(m), 1.0), self.max_surge) for cell, m in multipliers.items()}
+        keys = np.array([(cy << 32) + cx for cy, cx in surge], dtype=np.int64)
+        order = np.argsort(keys)
+        self._surge = surge
+        self._surge_table = (keys[order], np.array(list(surge.values()))[order] if surge else np.empty(0))
+
+    # ---------- components ----------
+
+    def distances(self, pickup_lat, pickup_lng, dest_lat, dest_lng) -> np.ndarray:
+        """Road distance in km per order"""
+        plat, plng = np.asarray(pickup_lat, dtype=np.float64), np.asarray(pickup_lng, dtype=np.float64)
+        dlat, dlng = np.asarray(dest_lat, dtype=np.float64), np.asarray(dest_lng, dtype=np.float64)
+        if self.route_provider is None:
+            return haversine_pairs(plat, plng, dlat, dlng) * self.road_factor
+
+        km = np.full(plat.size, np.nan)
+        known = ~(np.isnan(plat) | np.isnan(plng) | np.isnan(dlat) | np.isnan(dlng))
+        if not known.any():
+            return km
+        size = self.route_cell_size_deg
+        origins = _cell_keys(plat[known], plng[known], size)
+        targets = _cell_keys(dlat[known], dlng[known], size)
+        unique, inverse = np.unique(np.stack([origins, targets], axis=1), axis=0, return_inverse=True)
+        per_pair = np.empty(len(unique))
+        for i, (origin, target) in enumerate(unique.tolist()):
+            key = (_cell_of_key(origin), _cell_of_key(target))
+            cached = self.route_cache.get(key)
+            if cached is None:
+                (olat, olng), (tlat, tlng) = cell_center(key[0], size), cell_center(key[1], size)
+                cached = float(self.route_provider(olat, olng, tlat, tlng))
+                self.route_cache.put(key, cached)
+            per_pair[i] = cached
+        km[known] = per_pair[inverse.reshape(-1)]
+        return km
+
+    def durations(self, distance_km) -> np.ndarray:
+        """Trip time in minutes at the average city speed"""
+        return np.asarray(distance_km, dtype=np.float64) / self.average_speed_kmh * 60.0
+
+    def surge_multipliers(self, pickup_lat, pickup_lng) -> np.ndarray:
+        """Surge of each order's pickup cell, looked up with one searchsorted"""
+        plat, plng = np.asarray(pickup_lat, dtype=np.float64), np.asarray(pickup_lng, dtype=np.float64)
+        surge = np.ones(plat.size)
+        surge_keys, surge_values = self._surge_table
+        if not surge_keys.size:
+            return surge
+        known = ~(np.isnan(plat) | np.isnan(plng))
+        keys = _cell_keys(plat[known], plng[known], self.surge_cell_size_deg)
+        slot = np.minimum(np.searchsorted(surge_keys, keys), surge_keys.size - 1)
+        surge[known] = np.where(surge_keys[slot] == keys, surge_values[slot], 1.0)
+        return surge
+
+    def _tariff_columns(self, order_types: Optional[Sequence[Optional[str]]], n: int) -> np.ndarray:
+        """(n, 4) base_fare/per_km/per_min/minimum_fare; unknown types use the default tariff"""
+        if order_types is None:
+            return np.tile(np.array(self.tariffs[self.default_type], dtype=np.float64), (n, 1))
+        kinds = list(self.tariffs)
+        index = {kind: i for i, kind in enumerate(kinds)}
+        default = index[self.default_type]
+        codes = np.fromiter((index.get(t, default) for t in order_types), dtype=np.intp, count=n)
+        return np.array([self.tariffs[k] for k in kinds], dtype=np.float64)[codes]
+
+    # ---------- pricing ----------
+
+    def price(self, pickup_lat, pickup_lng, dest_lat, dest_lng,
+              order_types: Optional[Sequence[Optional[str]]] = None) -> Dict[str, np.ndarray]:
+        """distance_km / duration_min / surge / price arrays; NaN where coordinates are missing"""
+        km = self.distances(pickup_lat, pickup_lng, dest_lat, dest_lng)
+        minutes = self.durations(km)
+        surge = self.surge_multipliers(pickup_lat, pickup_lng)
+        tariff = self._tariff_columns(order_types, km.size)
+        fare = np.maximum(tariff[:, 0] + tariff[:, 1] * km + tariff[:, 2] * minutes, tariff[:, 3]) * surge
+        if self.rounding:
+            fare = np.round(fare / self.rounding) * self.rounding
+        return {"distance_km": km, "duration_min": minutes, "surge": surge, "price": fare}
+
+    def quote(self, pickup_lat: float, pickup_lng: float, dest_lat: float, dest_lng: float,
+              order_type: Optional[str] = None) -> FareQuote:
+        """Single-order convenience wrapper around price()"""
+        result = self.price([pickup_lat], [pickup_lng], [dest_lat], [dest_lng], [order_type])
+        return FareQuote(*(float(result[k][0]) for k in ("distance_km", "duration_min", "surge", "price")))
+
+_default_engine: Optional[FareEngine] = None
+
+def default_engine() -> FareEngine:
+    """Process-wide engine, so the route cache survives between batches"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = FareEngine.from_config()
+    return _default_engine
+
+def live_engine() -> FareEngine:
+    """The default engine with its surge refreshed from the live demand heatmap"""
+    from taxi import demand_heatmap
+    engine = default_engine()
+    engine.set_surge(demand_heatmap.surge_map(max_surge=engine.max_surge))
+    return engine
+
+# =====================================================
+# 💾 DATABASE INTEGRATION
+# =====================================================
+
+def price_open_orders(db=None, engine: Optional[FareEngine] = None, reprice: bool = False) -> int:
+    """Fill estimated_price for the whole dispatcher queue in one pass
+
+    Prices every PENDING/ASSIGNED order that has both coordinate pairs
+    (only those without an estimate unless reprice) and writes the
+    results back with one executemany. The default engine takes its surge
+    from the live demand heatmap.
+    """
+    from sqlalchemy import bindparam, update
+    from taxi import Order, OrderStatus, SessionLocal
+
+    engine = engine or live_engine()
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        query = db.query(Order.id, Order.pickup_lat, Order.pickup_lng, Order.destination_lat,
+                         Order.destination_lng, Order.order_type).filter(
+            Order.status.in_([OrderStatus.PENDING, OrderStatus.ASSIGNED]),
+            Order.pickup_lat.isnot(None), Order.pickup_lng.isnot(None),
+            Order.destination_lat.isnot(None), Order.destination_lng.isnot(None),
+        )
+        if not reprice:
+            query = query.filter(Order.estimated_price.is_(None))
+        rows = query.all()
+        if not rows:
+            return 0
+
+        ids, plat, plng, dlat, dlng, types = zip(*rows)
+        prices = engine.price(plat, plng, dlat, dlng, types)["price"]
+        orders = Order.__table__
+        db.execute(
+            update(orders).where(orders.c.id == bindparam("b_order_id"))
+            .values(estimated_price=bindparam("b_price")),
+            [{"b_order_id": order_id, "b_price": float(p)} for order_id, p in zip(ids, prices.tolist())],
+        )
+        db.commit()
+        logger.info(f"💰 Priced {len(rows)} open orders")
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+def price_orders(orders: List, engine: Optional[FareEngine] = None) -> np.ndarray:
+    """Prices for already loaded Order objects (or rows with the same attributes)"""
+    engine = engine or default_engine()
+    nan = float("nan")
+    columns = [[nan if v is None else v for v in (getattr(o, name) for o in orders)]
+               for name in ("pickup_lat", "pickup_lng", "destination_lat", "destination_lng")]
+    return engine.price(*columns, [getattr(o, "order_type", None) for o in orders])["price"]
@@ -0,0 +1,373 @@
+# =====================================================
+# 📡 REAL-TIME PUSH
+# In-process pub/sub hub with a Server-Sent Events endpoint
+# =====================================================
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+from urllib.parse import parse_qs, urlsplit
+
+from geo import DEFAULT_CELL_SIZE_DEG, cell_of
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest")
+
+def order_topic(order_id: str) -> str:
+    return f"order:{order_id}"
+
+def cell_topic(lat: float, lng: float, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> str:
+    cy, cx = cell_of(lat, lng, cell_size_deg)
+    return f"cell:{cy}:{cx}"
+
+def nearby_cell_topics(lat: float, lng: float, rings: int = 1,
+                       cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> List[str]:
+    """Topics of the (2 * rings + 1)^2 cells around a point - what a driver app subscribes to"""
+    cy, cx = cell_of(lat, lng, cell_size_deg)
+    return [f"cell:{y}:{x}" for y in range(cy - rings, cy + rings + 1) for x in range(cx - rings, cx + rings + 1)]
+
+def encode_event(event_type: str, data: dict) -> bytes:
+    """One SSE frame; encoded once per publish and shared by every subscriber"""
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n".encode()
+
+class Subscriber:
+    """One connection's topics and its bounded outgoing buffer"""
+    __slots__ = ("topics", "max_buffer", "policy", "dropped", "closed", "close_reason", "on_close",
+                 "_buffer", "_ready")
+
+    def __init__(self, topics: Iterable[str], max_buffer: int, policy: str):
+        self.topics: Set[str] = set(topics)
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self.on_close: Optional[Callable[[], None]] = None  # e.g. abort the socket of a stalled client
+        self._buffer: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def offer(self, frame: bytes) -> bool:
+        """Queue a frame without blocking; False if this subscriber is (now) too slow"""
+        if self.closed:
+            return False
+        if len(self._buffer) >= self.max_buffer:
+            if self.policy == "disconnect":
+                self.close("slow_consumer")
+                return False
+            self._buffer.popleft()
+            self.dropped += 1
+        self._buffer.append(frame)
+        self._ready.set()
+        return True
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[bytes]:
+        """Everything buffered so far; [] on timeout or once closed"""
+        if not self._buffer and not self.closed:
+            if timeout is None:
+                await self._ready.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+        batch = list(self._buffer)
+        self._buffer.clear()
+        self._ready.clear()
+        return batch
+
+    def close(self, reason: str = "closed") -> None:
+        if not self.closed:
+            self.closed = True
+            self.close_reason = reason
+            self._buffer.clear()
+            self._ready.set()
+            if self.on_close is not None:
+                self.on_close()
+
+class PubSubHub:
+    """Topic fan-out to many subscribers
+
+    publish() never awaits: it encodes the event once and appends it to
+    each subscriber's buffer. A subscriber whose buffer is full is either
+    disconnected (it reconnects and re-reads state) or loses its oldest
+    frames, so one stalled client never holds up the rest.
+    """
+
+    def __init__(self, buffer_size: int = 256, slow_consumer: str = "disconnect"):
+        if slow_consumer not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"slow_consumer must be one of {SLOW_CONSUMER_POLICIES}")
+        self.buffer_size = buffer_size
+        self.slow_consumer = slow_consumer
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._subscribers: Set[Subscriber] = set()
+        # Unfinished orders offered to drivers: id -> [cell topic, offer, still pending]
+        self._offers: Dict[str, list] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+
+        self.published = 0
+        self.delivered = 0
+        self.slow_disconnects = 0
+
+    def subscribe(self, topics: Iterable[str], buffer_size: Optional[int] = None,
+                  slow_consumer: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(topics, buffer_size or self.buffer_size, slow_consumer or self.slow_consumer)
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+        self._subscribers.add(subscriber)
+        for topic in subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.close()
+        self._subscribers.discard(subscriber)
+        for topic in subscriber.topics:
+            self._detach(topic, subscriber)
+
+    def set_topics(self, subscriber: Subscriber, topics: Iterable[str]) -> None:
+        """Replace a subscriber's topics, e.g. when a driver moves to another cell"""
+        topics = set(topics)
+        for topic in subscriber.topics - topics:
+            self._detach(topic, subscriber)
+        for topic in topics - subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        subscriber.topics = topics
+
+    def _detach(self, topic: str, subscriber: Subscriber) -> None:
+        members = self._topics.get(topic)
+        if members is not None:
+            members.discard(subscriber)
+            if not members:
+                del self._topics[topic]
+
+    def publish(self, topic: str, event_type: str, data: dict) -> int:
+        """Push an event to every subscriber of topic; returns how many got it"""
+        members = self._topics.get(topic)
+        self.published += 1
+        if not members:
+            return 0
+        frame = encode_event(event_type, data)
+        delivered = 0
+        slow = None
+        for subscriber in members:
+            if subscriber.offer(frame):
+                delivered += 1
+            elif subscriber.closed:
+                slow = slow or []
+                slow.append(subscriber)
+        for subscriber in slow or ():
+            self.slow_disconnects += 1
+            self.unsubscribe(subscriber)
+        self.delivered += delivered
+        return delivered
+
+    def _off_loop(self, method, *args) -> bool:
+        """Hand a call made from a worker thread (e.g. an ORM commit hook) to the subscribers' loop"""
+        if self._loop_thread is None or threading.get_ident() == self._loop_thread:
+            return False
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(method, *args)
+        return True
+
+    # ---------- domain events ----------
+
+    def publish_order_status(self, order_id: str, status, version: Optional[int] = None,
+                             driver_id: Optional[str] = None) -> int:
+        if self._off_loop(self.publish_order_status, order_id, status, version, driver_id):
+            return 0
+        delivered = self.publish(order_topic(order_id), "order_status", {
+            "order_id": order_id, "status": getattr(status, "value", status),
+            "version": version, "driver_id": driver_id, "ts": time.time(),
+        })
+        offer = self._offers.get(order_id)
+        if offer is None:
+            return delivered
+        name = getattr(status, "name", status)
+        if name in ("COMPLETED", "CANCELLED"):
+            del self._offers[order_id]
+        topic, data, open_ = offer
+        if name == "PENDING":
+            # Released back to the pool - offer it again
+            offer[2] = True
+            delivered += self.publish(topic, "order_offer", dict(data, version=version, ts=time.time()))
+        elif open_:
+            offer[2] = False
+            delivered += self.publish(topic, "order_offer_closed", {
+                "order_id": order_id, "status": getattr(status, "value", status),
+                "version": version, "ts": time.time(),
+            })
+        return delivered
+
+    def publish_order_offers(self, orders) -> int:
+        """New PENDING orders go to the cell topic of their pickup point"""
+        if self._off_loop(self.publish_order_offers, orders):
+            return 0
+        delivered = 0
+        for order in orders:
+            topic = cell_topic(order["lat"], order["lng"])
+            self._offers[order["order_id"]] = [topic, order, True]
+            delivered += self.publish(topic, "order_offer", dict(order, ts=time.time()))
+        return delivered
+
+    def watch(self, order_model) -> None:
+        """Offer every PENDING Order the ORM inserts with a pickup point once its transaction commits"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        @event.listens_for(Session, "after_flush")
+        def _after_flush(session, flush_context):
+            offers = [
+                {"order_id": o.id, "lat": o.pickup_lat, "lng": o.pickup_lng,
+                 "pickup": o.pickup_location, "destination": o.destination_location,
+                 "passengers": o.passengers_count, "estimated_price": o.estimated_price,
+                 "created_at": o.created_at, "version": o.version}
+                for o in session.new
+                if isinstance(o, order_model) and o.pickup_lat is not None and o.pickup_lng is not None
+                and getattr(o.status, "name", o.status or "PENDING") == "PENDING"
+            ]
+            if offers:
+                session.info.setdefault("realtime_offers", []).extend(offers)
+
+        @event.listens_for(Session, "after_commit")
+        def _after_commit(session):
+            offers = session.info.pop("realtime_offers", None)
+            if offers:
+                self.publish_order_offers(offers)
+
+        @event.listens_for(Session, "after_rollback")
+        def _after_rollback(session):
+            session.info.pop("realtime_offers", None)
+
+    def publish_driver_positions(self, fixes) -> int:
+        """LocationIngestor listener: each flushed fix goes to its cell topic"""
+        delivered = 0
+        for fix in fixes:
+            delivered += self.publish(cell_topic(fix.latitude, fix.longitude), "driver_position", {
+                "driver_id": fix.driver_id, "lat": fix.latitude, "lng": fix.longitude,
+                "available": fix.is_available, "ts": time.time(),
+            })
+        return delivered
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "topics": len(self._topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "slow_disconnects": self.slow_disconnects,
+            "open_offers": len(self._offers),
+            "dropped": sum(s.dropped for s in self._subscribers),
+        }
+
+# =====================================================
+# 🌐 SSE ENDPOINT
+# =====================================================
+
+class SSEServer:
+    """GET /events?topic=order:<id>&topic=cell:<y>:<x> -> text/event-stream
+
+    Plain asyncio streams, so it runs next to the bot without another web
+    framework. Browsers consume it with EventSource, which reconnects by
+    itself after a slow-consumer disconnect.
+    """
+
+    PING = b": ping\n\n"
+
+    def __init__(self, hub: PubSubHub, host: str = "0.0.0.0", port: int = 8765,
+                 path: str = "/events", heartbeat: float = 15.0, max_topics: int = 64,
+                 write_buffer: int = 16384):
+        self.hub = hub
+        self.host = host
+        self.port = port
+        self.path = path
+        self.heartbeat = heartbeat
+        self.max_topics = max_topics
+        self.write_buffer = write_buffer  # bytes queued in the socket transport before drain() waits
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self._active: Set[Subscriber] = set()
+
+    @property
+    def connections(self) -> int:
+        return len(self._active)
+
+    async def start(self) -> "SSEServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"📡 Real-time events on http://{self.host}:{self.port}{self.path}")
+        return self
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        self._heartbeat_task.cancel()
+        for subscriber in list(self._active):
+            subscriber.close("shutdown")
+        # Let every handler leave its loop instead of being cancelled at loop teardown
+        await asyncio.gather(*self._handlers, self._heartbeat_task, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _heartbeat(self) -> None:
+        """One timer for all connections instead of a timeout per wait"""
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscriber in list(self._active):
+                if not subscriber.buffered:
+                    subscriber.offer(self.PING)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subscriber = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split(" ")
+            url = urlsplit(parts[1]) if len(parts) >= 2 else None
+            topics = parse_qs(url.query).get("topic", []) if url else []
+            if url is None or parts[0] != "GET" or url.path != self.path or not topics:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            if len(topics) > self.max_topics:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+
+            writer.transport.set_write_buffer_limits(high=self.write_buffer)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n: connected\n\n")
+            await writer.drain()
+            subscriber = self.hub.subscribe(topics)
+            # A client too slow to keep its buffer below the limit may also be stuck in
+            # drain() below; dropping it must not wait for that client to read
+            subscriber.on_close = writer.transport.abort
+            self._active.add(subscriber)
+            while True:
+                batch = await subscriber.next_batch()
+                if subscriber.closed:
+                    break
+                writer.write(b"".join(batch))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            if subscriber is not None:
+                self._active.discard(subscriber)
+                self.hub.unsubscribe(subscriber)
+            writer.close()
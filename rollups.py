@@ -0,0 +1,285 @@
+# =====================================================
+# 📈 ORDER ROLLUPS
+# Hourly / daily / per-driver trip and revenue counters kept up to date
+# on every COMPLETED / CANCELLED transition
+# =====================================================
+
+import argparse
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("completed_count", "cancelled_count", "revenue", "trip_seconds", "timed_trips")
+TERMINAL_STATUSES = ("completed", "cancelled")
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def order_counters(status, final_price: Optional[float], started_at: Optional[datetime],
+                   completed_at: Optional[datetime]) -> Optional[Dict[str, float]]:
+    """What one finished order adds to its buckets, or None if it is not finished"""
+    status = getattr(status, "value", status)
+    if status not in TERMINAL_STATUSES:
+        return None
+    counters = dict.fromkeys(COUNTERS, 0)
+    if status == "completed":
+        counters["completed_count"] = 1
+        counters["revenue"] = final_price or 0.0
+        if started_at is not None and completed_at is not None and completed_at >= started_at:
+            counters["trip_seconds"] = (completed_at - started_at).total_seconds()
+            counters["timed_trips"] = 1
+    else:
+        counters["cancelled_count"] = 1
+    return counters
+
+class _Accumulator:
+    """Sums counters per rollup row before they are written"""
+
+    def __init__(self):
+        self.hourly: Dict[datetime, Dict[str, float]] = {}
+        self.daily: Dict[datetime, Dict[str, float]] = {}
+        self.driver: Dict[Tuple[str, datetime], Dict[str, float]] = {}
+
+    def add(self, driver_id: Optional[str], finished_at: datetime, counters: Dict[str, float],
+            sign: int = 1) -> None:
+        if sign != 1:
+            counters = {name: value * sign for name, value in counters.items()}
+        _merge(self.hourly, hour_bucket(finished_at), counters)
+        day = day_bucket(finished_at)
+        _merge(self.daily, day, counters)
+        if driver_id:
+            _merge(self.driver, (driver_id, day), counters)
+
+    def __bool__(self) -> bool:
+        return bool(self.hourly)
+
+def _merge(rows: dict, key, counters: Dict[str, float]) -> None:
+    row = rows.get(key)
+    if row is None:
+        rows[key] = dict(counters)
+    else:
+        for name, value in counters.items():
+            row[name] += value
+
+# Order attributes a rollup row depends on, in the tuple order record() takes
+_TRACKED_FIELDS = ("status", "driver_id", "final_price", "started_at", "completed_at", "created_at")
+_PREVIOUS_KEY = "order_rollups_previous"
+
+def _bucket_time(completed_at: Optional[datetime], created_at: Optional[datetime], now: datetime) -> datetime:
+    """When a finished order counts - the same rule for incremental updates and rebuild()"""
+    return completed_at or created_at or now
+
+def _add_order(acc: _Accumulator, order, now: datetime, sign: int = 1) -> bool:
+    status, driver_id, final_price, started_at, completed_at, created_at = order
+    counters = order_counters(status, final_price, started_at, completed_at)
+    if counters is None:
+        return False
+    acc.add(driver_id, _bucket_time(completed_at, created_at, now), counters, sign)
+    return True
+
+class OrderRollups:
+    """Maintains and reads the order rollup tables
+
+    Each finished order is folded into its hour, its day and its driver's
+    day, bucketed by completed_at (or created_at when a finished order has
+    no completed_at, both here and in rebuild()). Dashboards read O(buckets) rows instead of
+    scanning orders.
+    """
+
+    def __init__(self, hourly_model, daily_model, driver_model):
+        self.hourly = hourly_model.__table__
+        self.daily = daily_model.__table__
+        self.driver = driver_model.__table__
+
+    # ---------- writing ----------
+
+    def record(self, connection, orders: Iterable[tuple], now: Optional[datetime] = None) -> int:
+        """Add finished orders to the rollups inside the caller's transaction
+
+        `orders` yields (status, driver_id, final_price, started_at,
+        completed_at, created_at) of orders that have just become COMPLETED/CANCELLED.
+        Call this from any code that finishes orders with Core UPDATEs;
+        ORM flushes are picked up by watch().
+        """
+        now = now or datetime.utcnow()
+        acc = _Accumulator()
+        recorded = sum(_add_order(acc, order, now) for order in orders)
+        if acc:
+            self._write(connection, acc, _increment_statement)
+        return recorded
+
+    def watch(self, order_model, target=None) -> None:
+        """Keep the rollups in step with Order rows flushed through the ORM
+
+        Covers orders entering or leaving COMPLETED/CANCELLED as well as
+        price, driver or timestamp corrections on already finished orders.
+        """
+        from sqlalchemy import event, inspect, select
+        from sqlalchemy.orm import Session
+
+        target = target if target is not None else Session
+        tracked = [getattr(order_model, f) for f in _TRACKED_FIELDS]
+
+        def before_flush(session, flush_context, instances):
+            # Read what the rollups currently hold for the orders about to change;
+            # the in-memory history is useless once commit has expired the old values
+            changed = [obj for obj in session.dirty
+                       if isinstance(obj, order_model) and session.is_modified(obj)
+                       and any(inspect(obj).attrs[f].history.added for f in _TRACKED_FIELDS)]
+            deleted = [obj for obj in session.deleted if isinstance(obj, order_model)]
+            ids = [inspect(obj).identity[0] for obj in changed + deleted]
+            if not ids:
+                return
+            rows = session.connection().execute(
+                select(order_model.id, *tracked).where(order_model.id.in_(ids))
+            ).all()
+            session.info[_PREVIOUS_KEY] = ({row[0]: tuple(row[1:]) for row in rows}, changed)
+
+        def after_flush(session, flush_context):
+            now = datetime.utcnow()
+            acc = _Accumulator()
+            previous, changed = session.info.pop(_PREVIOUS_KEY, ({}, []))
+            for old in previous.values():
+                _add_order(acc, old, now, sign=-1)
+            for obj in list(session.new) + changed:
+                if isinstance(obj, order_model):
+                    _add_order(acc, [getattr(obj, f) for f in _TRACKED_FIELDS], now)
+            if acc:
+                self._write(session.connection(), acc, _increment_statement)
+
+        def after_rollback(session):
+            session.info.pop(_PREVIOUS_KEY, None)
+
+        event.listen(target, "before_flush", before_flush)
+        event.listen(target, "after_flush", after_flush)
+        event.listen(target, "after_rollback", after_rollback)
+
+    def rebuild(self, db=None, batch_size: int = 5000) -> int:
+        """Recompute every rollup row from the orders table (backfill)"""
+        from sqlalchemy import delete, select
+        from taxi import Order, OrderStatus, SessionLocal
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            connection = db.connection()
+            stmt = (
+                select(Order.status, Order.driver_id, Order.final_price, Order.started_at,
+                       Order.completed_at, Order.created_at)
+                .where(Order.status.in_([OrderStatus.COMPLETED, OrderStatus.CANCELLED]))
+            )
+            acc = _Accumulator()
+            orders = 0
+            result = connection.execute(stmt, execution_options={"yield_per": batch_size})
+            for status, driver_id, final_price, started_at, completed_at, created_at in result:
+                counters = order_counters(status, final_price, started_at, completed_at)
+                if counters is not None:
+                    acc.add(driver_id, _bucket_time(completed_at, created_at, None), counters)
+                    orders += 1
+
+            for table in (self.hourly, self.daily, self.driver):
+                connection.execute(delete(table))
+            if acc:
+                self._write(connection, acc, lambda conn, table: table.insert())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+        logger.info(f"📈 Rollups rebuilt from {orders} finished orders")
+        return orders
+
+    def _write(self, connection, acc: _Accumulator, statement) -> None:
+        for table, rows in (
+            (self.hourly, [dict(row, bucket=bucket) for bucket, row in acc.hourly.items()]),
+            (self.daily, [dict(row, bucket=bucket) for bucket, row in acc.daily.items()]),
+            (self.driver, [dict(row, driver_id=driver_id, bucket=bucket)
+                           for (driver_id, bucket), row in acc.driver.items()]),
+        ):
+            if rows:
+                connection.execute(statement(connection, table), rows)
+
+    # ---------- reading ----------
+
+    def series(self, period: str = "day", start: Optional[datetime] = None,
+               end: Optional[datetime] = None, db=None) -> List[dict]:
+        """Per-hour or per-day totals between start (inclusive) and end (exclusive)"""
+        from sqlalchemy import select
+
+        if period not in ("hour", "day"):
+            raise ValueError(f"Unknown rollup period {period!r}; expected 'hour' or 'day'")
+        table = self.hourly if period == "hour" else self.daily
+        stmt = select(table)
+        if start is not None:
+            stmt = stmt.where(table.c.bucket >= start)
+        if end is not None:
+            stmt = stmt.where(table.c.bucket < end)
+        return [_report(row) for row in self._read(stmt.order_by(table.c.bucket), db)]
+
+    def driver_totals(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      driver_id: Optional[str] = None, db=None) -> List[dict]:
+        """Per-driver totals over a day range, best earners first"""
+        from sqlalchemy import func, select
+
+        table = self.driver
+        revenue = func.sum(table.c.revenue).label("revenue")
+        stmt = select(table.c.driver_id, *[func.sum(table.c[name]).label(name) for name in COUNTERS if name != "revenue"],
+                      revenue).group_by(table.c.driver_id)
+        if start is not None:
+            stmt = stmt.where(table.c.bucket >= day_bucket(start))
+        if end is not None:
+            stmt = stmt.where(table.c.bucket < end)
+        if driver_id is not None:
+            stmt = stmt.where(table.c.driver_id == driver_id)
+        return [_report(row) for row in self._read(stmt.order_by(revenue.desc()), db)]
+
+    def _read(self, stmt, db):
+        if db is not None:
+            return db.execute(stmt).mappings().all()
+        from taxi import get_db
+        with get_db() as db:
+            return db.execute(stmt).mappings().all()
+
+def _report(row) -> dict:
+    report = {key: value for key, value in row.items() if key not in ("trip_seconds", "timed_trips")}
+    report["revenue"] = round(row["revenue"] or 0.0, 2)
+    timed = row["timed_trips"] or 0
+    report["average_trip_min"] = round(row["trip_seconds"] / timed / 60, 1) if timed else None
+    return report
+
+def _increment_statement(connection, table):
+    """INSERT ... ON CONFLICT (primary key) DO UPDATE that adds to the stored counters"""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Rollup upsert is not supported on {dialect}")
+
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Order rollup maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    from taxi import order_rollups, prepare_database
+    prepare_database()
+    orders = order_rollups.rebuild(batch_size=args.batch_size)
+    print(f"rebuilt rollups from {orders} orders")
+
+if __name__ == "__main__":
+    main()
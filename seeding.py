@@ -0,0 +1,451 @@
+# =====================================================
+# 🌱 SYNTHETIC DATA SEEDING
+# Millions of users, driver positions, orders and dispatcher calls
+# for load tests, generated deterministically and bulk inserted
+# Run: python seeding.py --customers 1000000 --orders 5000000
+# =====================================================
+
+import argparse
+import csv
+import io
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tashkent city centre, where the synthetic fleet and demand live
+CITY_LAT = 41.3111
+CITY_LNG = 69.2797
+
+# Random streams; every (seed, stream, block) gets its own generator
+_STREAMS = {"customer": 1, "driver": 2, "dispatcher": 3, "order": 4, "call": 5, "position": 6}
+# Phone numbers are +998 9<role digit><8-digit index>
+_PHONE_DIGIT = {"customer": 1, "driver": 2, "dispatcher": 3}
+MAX_PER_ROLE = 10 ** 8
+
+# OrderStatus names (as stored) by code, in lifecycle order
+_STATUSES = ("PENDING", "ASSIGNED", "ACCEPTED", "STARTED", "COMPLETED", "CANCELLED")
+PENDING, ASSIGNED, ACCEPTED, STARTED, COMPLETED, CANCELLED = range(6)
+ORDER_TYPES = ("standard", "premium", "shared")
+
+# Rows are tuples in these column orders, holding the values as stored
+USER_COLUMNS = ("id", "phone", "name", "role", "telegram_id", "is_active", "created_at", "updated_at")
+POSITION_COLUMNS = ("driver_id", "latitude", "longitude", "is_available", "updated_at")
+ORDER_COLUMNS = ("id", "customer_id", "driver_id", "dispatcher_id", "pickup_location", "destination_location",
+                 "passengers_count", "order_type", "status", "estimated_price", "final_price", "customer_phone",
+                 "customer_name", "pickup_lat", "pickup_lng", "destination_lat", "destination_lng",
+                 "created_at", "assigned_at", "started_at", "completed_at", "version")
+CALL_COLUMNS = ("id", "dispatcher_id", "order_id", "customer_phone", "customer_name", "customer_location",
+                "passenger_count", "call_status", "received_at", "completed_at")
+
+class SeedReport(NamedTuple):
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: a bijection that scatters consecutive integers"""
+    x = x.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_HEX_POSITIONS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+def synthetic_ids(seed: int, stream: str, index) -> List[str]:
+    """Random-looking version 4 UUID strings that are a pure function of (seed, stream, index)
+
+    Rows of one table can refer to rows of another by index alone (an
+    order to its customer), without keeping millions of ids in memory.
+    """
+    with np.errstate(over="ignore"):
+        base = np.uint64((seed * 0x9E3779B97F4A7C15 + _STREAMS[stream] * 0xD1B54A32D192ED03) % 2 ** 64)
+        keys = np.asarray(index, dtype=np.uint64) + base
+        halves = np.stack([_mix64(keys), _mix64(keys ^ np.uint64(0x5851F42D4C957F2D))], axis=1)
+    raw = halves.astype(">u8").view(np.uint8).reshape(-1, 16)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    text = np.full((raw.shape[0], 36), ord("-"), dtype=np.uint8)
+    text[:, _HEX_POSITIONS[0::2]] = _HEX[raw >> 4]
+    text[:, _HEX_POSITIONS[1::2]] = _HEX[raw & 0x0F]
+    return text.view("S36").ravel().astype("U36").tolist()
+
+def synthetic_phones(role: str, index) -> List[str]:
+    prefix = f"+9989{_PHONE_DIGIT[role]}"
+    return [f"{prefix}{i:08d}" for i in np.asarray(index).tolist()]
+
+def _timestamps(start: datetime, seconds) -> List[Optional[str]]:
+    """start + seconds in SQLAlchemy's SQLite DATETIME text (also valid COPY input); NaN -> None"""
+    offsets = (np.asarray(seconds, dtype=np.float64) * 1e6).astype("timedelta64[us]")
+    text = np.datetime_as_string(np.datetime64(start, "us") + offsets, unit="us").tolist()
+    return [None if t == "NaT" else t.replace("T", " ") for t in text]
+
+# =====================================================
+# 💾 BULK WRITES
+# =====================================================
+
+_PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+def bulk_insert(connection, table, columns: Sequence[str], rows: List[tuple]) -> None:
+    """COPY ... FROM STDIN on PostgreSQL, one DBAPI executemany elsewhere
+
+    Rows hold values as the database stores them (enum names, timestamp
+    text), so they go to the driver without SQLAlchemy's per-value bind
+    processing, which costs more than the insert itself.
+    """
+    if not rows:
+        return
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.name == "postgresql" and hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                               io.StringIO(_csv(rows)))
+            return
+        if connection.dialect.name == "postgresql" and hasattr(cursor, "copy"):
+            with cursor.copy(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+        placeholder = _PLACEHOLDERS.get(connection.dialect.paramstyle)
+        if placeholder is None:
+            raise NotImplementedError(f"Bulk insert is not supported with paramstyle {connection.dialect.paramstyle}")
+        cursor.executemany(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})",
+            rows,
+        )
+    finally:
+        cursor.close()
+
+def _csv(rows: List[tuple]) -> str:
+    """COPY csv text: an unquoted empty field is NULL"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow(["" if v is None else ("t" if v else "f") if v is True or v is False else v for v in row])
+    return buffer.getvalue()
+
+# =====================================================
+# 🌱 SEEDER
+# =====================================================
+
+class Seeder:
+    """Deterministic synthetic data, written one block at a time
+
+    Every block of block_size rows is generated from its own random
+    stream, so the rows depend only on (seed, block_size) and a block can
+    be produced without the ones before it. Ids and phone numbers are
+    functions of a row's index, which keeps references between tables
+    consistent without holding millions of ids. Each block is one bulk
+    write in its own transaction; the secondary indexes of orders and
+    dispatcher_calls are dropped for the load and rebuilt afterwards
+    when defer_indexes is set.
+    """
+
+    def __init__(self, engine=None, seed: int = 42, block_size: int = 10000,
+                 start: datetime = datetime(2025, 1, 1), days: float = 90.0, spread_deg: float = 0.25,
+                 open_fraction: float = 0.02, linked_call_fraction: float = 0.8,
+                 telegram_id_base: Optional[int] = None, defer_indexes: bool = True, fare_engine=None):
+        if engine is None:
+            from taxi import engine, prepare_database
+            prepare_database()
+        if fare_engine is None:
+            from pricing import FareEngine
+            fare_engine = FareEngine.from_config()
+        self.engine = engine
+        self.seed = seed
+        self.block_size = block_size
+        self.start = start
+        self.days = days
+        self.spread_deg = spread_deg
+        self.open_fraction = open_fraction  # newest orders that are still in play
+        self.linked_call_fraction = linked_call_fraction  # calls that became an order
+        self.telegram_id_base = telegram_id_base
+        self.defer_indexes = defer_indexes
+        self.fare_engine = fare_engine
+
+    def _rng(self, stream: str, block: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, _STREAMS[stream], block])
+
+    def _blocks(self, count: int) -> Iterator[Tuple[int, np.ndarray]]:
+        for block, first in enumerate(range(0, count, self.block_size)):
+            yield block, np.arange(first, min(first + self.block_size, count), dtype=np.int64)
+
+    def _exists(self, table, row_id: str) -> bool:
+        from sqlalchemy import exists, select
+        with self.engine.connect() as conn:
+            return bool(conn.execute(select(exists().where(table.c.id == row_id))).scalar())
+
+    def _load(self, label: str, table, columns: Sequence[str], count: int,
+              make_rows: Callable[[int, np.ndarray], List[tuple]]) -> SeedReport:
+        started = time.perf_counter()
+        rows = 0
+        for block, index in self._blocks(count):
+            batch = make_rows(block, index)
+            with self.engine.begin() as conn:
+                bulk_insert(conn, table, columns, batch)
+            rows += len(batch)
+        return _logged(SeedReport(label, rows, time.perf_counter() - started))
+
+    def _deferred_indexes(self, *tables) -> list:
+        if not self.defer_indexes:
+            return []
+        indexes = [index for table in tables for index in table.indexes if not index.unique]
+        for index in indexes:
+            index.drop(self.engine, checkfirst=True)
+        return indexes
+
+    def _rebuild_indexes(self, indexes: list) -> float:
+        started = time.perf_counter()
+        for index in indexes:
+            index.create(self.engine, checkfirst=True)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        return time.perf_counter() - started
+
+    # ---------- users ----------
+
+    def users(self, role: str, count: int) -> SeedReport:
+        """count users of one role ("customer" / "driver" / "dispatcher")"""
+        from taxi import User
+
+        if count > MAX_PER_ROLE:
+            raise ValueError(f"at most {MAX_PER_ROLE:,} users per role")
+        table = User.__table__
+        label = f"users ({role})"
+        if count and self._exists(table, synthetic_ids(self.seed, role, [0])[0]):
+            logger.info(f"🌱 {label}: already seeded with seed {self.seed}, skipped")
+            return SeedReport(label, 0, 0.0)
+        stored_role = role.upper()
+        title = role.capitalize()
+        telegram_base = self.telegram_id_base if role == "customer" else None
+        created = _timestamps(self.start, [0.0])[0]
+
+        def make_rows(block: int, index: np.ndarray) -> List[tuple]:
+            return [
+                (user_id, phone, f"{title} {i + 1}", stored_role,
+                 None if telegram_base is None else str(telegram_base + i), True, created, created)
+                for user_id, phone, i in zip(synthetic_ids(self.seed, role, index), synthetic_phones(role, index),
+                                             index.tolist())
+            ]
+
+        return self._load(label, table, USER_COLUMNS, count, make_rows)
+
+    def driver_positions(self, drivers: int) -> SeedReport:
+        """Latest position of every driver, scattered around the city centre"""
+        from taxi import DriverPosition
+
+        at = _timestamps(self.start, [self.days * 86400.0])[0]
+
+        def make_rows(block: int, index: np.ndarray) -> List[tuple]:
+            rng = self._rng("position", block)
+            lat = CITY_LAT + rng.normal(0.0, self.spread_deg / 2, index.size)
+            lng = CITY_LNG + rng.normal(0.0, self.spread_deg / 2, index.size)
+            available = rng.random(index.size) < 0.7
+            return [(d, la, lo, av, at) for d, la, lo, av in zip(synthetic_ids(self.seed, "driver", index),
+                                                                 lat.tolist(), lng.tolist(), available.tolist())]
+
+        return self._load("driver_positions", DriverPosition.__table__, POSITION_COLUMNS, drivers, make_rows)
+
+    # ---------- orders and calls ----------
+
+    def orders(self, count: int, customers: int, drivers: int, dispatchers: int = 0,
+               calls: int = 0) -> List[SeedReport]:
+        """count orders over `days` in every status, plus `calls` dispatcher calls
+
+        Orders are spread evenly in time; the newest open_fraction are still
+        PENDING/ASSIGNED/ACCEPTED/STARTED, the rest COMPLETED or CANCELLED
+        with timestamps and a version that match the transitions they went
+        through. linked_call_fraction of the calls placed an order (the
+        order carries the dispatcher); the others ended without one.
+        """
+        from taxi import DispatcherCall, Order
+
+        if count and (not customers or not drivers):
+            raise ValueError("orders need at least one customer and one driver")
+        if calls and (not dispatchers or not customers):
+            raise ValueError("dispatcher calls need at least one dispatcher and one customer")
+        orders_table, calls_table = Order.__table__, DispatcherCall.__table__
+        if count and self._exists(orders_table, synthetic_ids(self.seed, "order", [0])[0]):
+            logger.info(f"🌱 orders: already seeded with seed {self.seed}, skipped")
+            return [SeedReport("orders", 0, 0.0), SeedReport("dispatcher_calls", 0, 0.0)]
+        linked = min(int(calls * self.linked_call_fraction), count)
+        indexes = self._deferred_indexes(orders_table, calls_table)
+
+        order_seconds = call_seconds = 0.0
+        call_rows = 0
+        for block, index in self._blocks(count):
+            t0 = time.perf_counter()
+            order_rows, linked_calls = self._order_rows(block, index, count, customers, drivers,
+                                                        dispatchers, linked)
+            with self.engine.begin() as conn:
+                bulk_insert(conn, orders_table, ORDER_COLUMNS, order_rows)
+                t1 = time.perf_counter()
+                bulk_insert(conn, calls_table, CALL_COLUMNS, linked_calls)
+            t2 = time.perf_counter()
+            order_seconds += t1 - t0
+            call_seconds += t2 - t1
+            call_rows += len(linked_calls)
+
+        t0 = time.perf_counter()
+        for block, index in self._blocks(calls - linked):
+            batch = self._unlinked_call_rows(block, index, count, customers, dispatchers)
+            with self.engine.begin() as conn:
+                bulk_insert(conn, calls_table, CALL_COLUMNS, batch)
+            call_rows += len(batch)
+        call_seconds += time.perf_counter() - t0
+
+        index_seconds = self._rebuild_indexes(indexes)
+        if indexes:
+            logger.info(f"🌱 rebuilt {len(indexes)} indexes in {index_seconds:.1f}s")
+        # Index builds are part of the load; they are split by row count
+        total = max(1, count + call_rows)
+        return [_logged(SeedReport("orders", count, order_seconds + index_seconds * count / total)),
+                _logged(SeedReport("dispatcher_calls", call_rows,
+                                   call_seconds + index_seconds * call_rows / total))]
+
+    def _order_rows(self, block: int, index: np.ndarray, count: int, customers: int, drivers: int,
+                    dispatchers: int, linked: int) -> Tuple[List[tuple], List[tuple]]:
+        rng = self._rng("order", block)
+        n = index.size
+        created = (index + rng.random(n)) * (self.days * 86400.0 / count)
+
+        status = np.where(rng.random(n) < 0.85, COMPLETED, CANCELLED)
+        is_open = index >= count * (1.0 - self.open_fraction)
+        status[is_open] = rng.choice([PENDING, ASSIGNED, ACCEPTED, STARTED], size=int(is_open.sum()),
+                                     p=[0.35, 0.15, 0.2, 0.3])
+        # How far an order got; a cancelled one at any step before STARTED ended
+        reached = np.where(status == CANCELLED, rng.choice(4, size=n, p=[0.5, 0.2, 0.15, 0.15]), status)
+        # Every transition bumps the version (assign, accept, start, complete / cancel)
+        version = np.where(status == CANCELLED, reached + 1, status)
+        has_driver = reached >= ASSIGNED
+        has_started = reached >= STARTED
+
+        spread = self.spread_deg
+        plat = np.clip(CITY_LAT + rng.normal(0.0, spread / 3, n), CITY_LAT - spread, CITY_LAT + spread)
+        plng = np.clip(CITY_LNG + rng.normal(0.0, spread / 3, n), CITY_LNG - spread, CITY_LNG + spread)
+        dlat = plat + rng.normal(0.0, 0.04, n)
+        dlng = plng + rng.normal(0.0, 0.04, n)
+        type_names = [ORDER_TYPES[t] for t in rng.choice(3, size=n, p=[0.8, 0.12, 0.08]).tolist()]
+        fare = self.fare_engine.price(plat, plng, dlat, dlng, type_names)
+
+        assigned = np.where(has_driver, created + rng.uniform(20, 240, n), np.nan)
+        started = np.where(has_started, assigned + rng.uniform(120, 600, n), np.nan)
+        finished = np.where(status == COMPLETED, started + fare["duration_min"] * 60.0, np.nan)
+        last_step = np.where(has_started, started, np.where(has_driver, assigned, created))
+        finished = np.where(status == CANCELLED, last_step + rng.uniform(30, 300, n), finished)
+
+        customer = rng.integers(0, customers, n)
+        driver_ids = synthetic_ids(self.seed, "driver", rng.integers(0, drivers, n))
+        # Exactly `linked` of all orders came from a dispatcher call, spread evenly
+        from_call = (index * linked) // count != ((index + 1) * linked) // count
+        dispatcher_ids = (synthetic_ids(self.seed, "dispatcher", rng.integers(0, dispatchers, n))
+                          if dispatchers else [None] * n)
+        passengers = rng.choice([1, 1, 1, 2, 2, 3, 4], size=n).tolist()
+        prices = fare["price"].tolist()
+
+        ids = synthetic_ids(self.seed, "order", index)
+        call_ids = synthetic_ids(self.seed, "call", index)  # only the linked orders' are used
+        phones = synthetic_phones("customer", customer)
+        created_at, assigned_at = _timestamps(self.start, created), _timestamps(self.start, assigned)
+        started_at, completed_at = _timestamps(self.start, started), _timestamps(self.start, finished)
+
+        orders, calls = [], []
+        for i, (order_id, customer_id, c, s, pla, pln, dla, dln) in enumerate(zip(
+                ids, synthetic_ids(self.seed, "customer", customer), customer.tolist(), status.tolist(),
+                plat.tolist(), plng.tolist(), dlat.tolist(), dlng.tolist())):
+            pickup = f"{pla:.5f}, {pln:.5f}"
+            name = f"Customer {c + 1}"
+            dispatcher_id = dispatcher_ids[i] if from_call[i] else None
+            orders.append((
+                order_id, customer_id, driver_ids[i] if has_driver[i] else None, dispatcher_id,
+                pickup, f"{dla:.5f}, {dln:.5f}", passengers[i], type_names[i], _STATUSES[s], prices[i],
+                prices[i] if s == COMPLETED else None, phones[i], name, pla, pln, dla, dln,
+                created_at[i], assigned_at[i], started_at[i], completed_at[i], int(version[i]),
+            ))
+            if dispatcher_id is not None:
+                calls.append((call_ids[i], dispatcher_id, order_id, phones[i], name, pickup, passengers[i],
+                              "completed", created_at[i], created_at[i]))
+        return orders, calls
+
+    def _unlinked_call_rows(self, block: int, index: np.ndarray, orders: int, customers: int,
+                            dispatchers: int) -> List[tuple]:
+        rng = self._rng("call", block)
+        n = index.size
+        received = rng.uniform(0.0, self.days * 86400.0, n)
+        customer = rng.integers(0, customers, n)
+        # Linked calls take the ids of their orders' indexes; these come after them
+        ids = synthetic_ids(self.seed, "call", orders + index)
+        return [
+            (call_id, dispatcher_id, None, phone, f"Customer {c + 1}", None, 1, "cancelled", received_at, ended_at)
+            for call_id, dispatcher_id, phone, c, received_at, ended_at in zip(
+                ids, synthetic_ids(self.seed, "dispatcher", rng.integers(0, dispatchers, n)),
+                synthetic_phones("customer", customer), customer.tolist(),
+                _timestamps(self.start, received), _timestamps(self.start, received + rng.uniform(30, 180, n)))
+        ]
+
+    # ---------- everything ----------
+
+    def run(self, customers: int, drivers: int, dispatchers: int, orders: int, calls: int,
+            rollups: bool = True) -> List[SeedReport]:
+        reports = [self.users("customer", customers), self.users("driver", drivers),
+                   self.users("dispatcher", dispatchers)]
+        if reports[1].rows:
+            reports.append(self.driver_positions(drivers))
+        reports += self.orders(orders, customers, drivers, dispatchers, calls)
+        if rollups and reports[-2].rows:
+            # Bulk inserts bypass the ORM hooks that keep the rollups current
+            from taxi import order_rollups
+            started = time.perf_counter()
+            order_rollups.rebuild()
+            logger.info(f"🌱 rollups rebuilt in {time.perf_counter() - started:.1f}s")
+        return reports
+
+def _logged(report: SeedReport) -> SeedReport:
+    logger.info(f"🌱 {report.table}: {report.rows:,} rows in {report.seconds:.1f}s "
+                f"({report.rows_per_second:,.0f} rows/s)")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with deterministic synthetic load-test data")
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--drivers", type=int, default=5000)
+    parser.add_argument("--dispatchers", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--calls", type=int, default=100000, help="dispatcher calls")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--block-size", type=int, default=10000, help="rows per bulk write")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2025, 1, 1),
+                        help="time of the first order (YYYY-MM-DD)")
+    parser.add_argument("--days", type=float, default=90.0, help="days the orders are spread over")
+    parser.add_argument("--telegram-id-base", type=int, default=None,
+                        help="give customer i the Telegram id base + i (e.g. 700000000 for the load tests)")
+    parser.add_argument("--keep-indexes", action="store_true", help="insert with the secondary indexes in place")
+    parser.add_argument("--no-rollups", action="store_true", help="skip rebuilding the rollup tables")
+    args = parser.parse_args(argv)
+
+    seeder = Seeder(seed=args.seed, block_size=args.block_size, start=args.start, days=args.days,
+                    telegram_id_base=args.telegram_id_base, defer_indexes=not args.keep_indexes)
+    started = time.perf_counter()
+    reports = seeder.run(args.customers, args.drivers, args.dispatchers, args.orders, args.calls,
+                         rollups=not args.no_rollups)
+    elapsed = time.perf_counter() - started
+    for report in reports:
+        print(f"{report.table:<20} {report.rows:>12,} rows {report.seconds:>8.1f}s "
+              f"{report.rows_per_second:>12,.0f} rows/s")
+    rows = sum(report.rows for report in reports)
+    print(f"{'total':<20} {rows:>12,} rows {elapsed:>8.1f}s {rows / elapsed if elapsed else 0:>12,.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,891 @@
+# =====================================================
+# 🧩 SHARDED WORKERS
+# Orders and drivers partitioned by area across worker processes,
+# a pluggable coordination backend for handoffs and leader election
+# Run: python sharding.py --workers 4
+# =====================================================
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from assignment import AssignmentEngine
+from geo import DEFAULT_CELL_SIZE_DEG, Cell, cell_of
+from spatial_index import DriverSpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# Coarse areas (~5.5 km of latitude); an order and the drivers that can reach it share one
+DEFAULT_AREA_SIZE_DEG = 0.05
+
+class ShardMap:
+    """Which shard owns a point: coarse grid areas hashed onto `shards`
+
+    The hash is crc32 of the area, so every process maps a point to the
+    same shard without talking to the others.
+    """
+
+    def __init__(self, shards: int, area_size_deg: float = DEFAULT_AREA_SIZE_DEG):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.shards = shards
+        self.area_size = area_size_deg
+        self._owners: Dict[Cell, int] = {}
+
+    @classmethod
+    def from_config(cls, **overrides) -> "ShardMap":
+        from taxi import Config
+        settings = {"shards": Config.SHARDS, "area_size_deg": Config.SHARD_AREA_DEG}
+        settings.update(overrides)
+        return cls(**settings)
+
+    def area_of(self, lat: float, lng: float) -> Cell:
+        return cell_of(lat, lng, self.area_size)
+
+    def shard_of_area(self, area: Cell) -> int:
+        shard = self._owners.get(area)
+        if shard is None:
+            shard = self._owners[area] = zlib.crc32(f"{area[0]}:{area[1]}".encode()) % self.shards
+        return shard
+
+    def shard_of(self, lat: float, lng: float) -> int:
+        return self.shard_of_area(self.area_of(lat, lng))
+
+# =====================================================
+# 🔗 COORDINATION BACKENDS
+# =====================================================
+
+class CoordinationBackend:
+    """Per-shard mailboxes, leases and a small key-value store shared by all workers
+
+    Mailboxes carry JSON-serializable dicts in FIFO order. A lease is
+    held by one owner until it expires or is released; acquiring a lease
+    you already hold renews it. Lease expiry uses wall-clock seconds,
+    since the workers share no monotonic clock.
+    """
+
+    def send(self, shard: int, message: dict) -> None:
+        self.send_many([(shard, message)])
+
+    def send_many(self, messages: Iterable[Tuple[int, dict]]) -> None:
+        raise NotImplementedError
+
+    def receive(self, shard: int, limit: int = 1000) -> List[dict]:
+        raise NotImplementedError
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def release(self, key: str, owner: str) -> bool:
+        raise NotImplementedError
+
+    def holder(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def exchange(self, key: str, value: str) -> Optional[str]:
+        """Set key to value and return what it was"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class MemoryBackend(CoordinationBackend):
+    """In-process stand-in: shards running as threads of one process, and tests"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._mailboxes: Dict[int, Deque[str]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._values: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def send_many(self, messages: Iterable[Tuple[int, dict]]) -> None:
+        encoded = [(shard, json.dumps(message)) for shard, message in messages]
+        with self._lock:
+            for shard, payload in encoded:
+                self._mailboxes.setdefault(shard, deque()).append(payload)
+
+    def receive(self, shard: int, limit: int = 1000) -> List[dict]:
+        with self._lock:
+            mailbox = self._mailboxes.get(shard)
+            if not mailbox:
+                return []
+            payloads = [mailbox.popleft() for _ in range(min(limit, len(mailbox)))]
+        return [json.loads(payload) for payload in payloads]
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            current = self._leases.get(key)
+            if current is not None and current[0] != owner and current[1] > now:
+                return False
+            self._leases[key] = (owner, now + ttl)
+            return True
+
+    def release(self, key: str, owner: str) -> bool:
+        with self._lock:
+            current = self._leases.get(key)
+            if current is None or current[0] != owner:
+                return False
+            del self._leases[key]
+            return True
+
+    def holder(self, key: str) -> Optional[str]:
+        with self._lock:
+            current = self._leases.get(key)
+            return current[0] if current is not None and current[1] > self._clock() else None
+
+    def exchange(self, key: str, value: str) -> Optional[str]:
+        with self._lock:
+            previous = self._values.get(key)
+            self._values[key] = value
+            return previous
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._values.get(key)
+
+_SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS coordination_mailbox (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "shard INTEGER NOT NULL, payload TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_coordination_mailbox_shard ON coordination_mailbox (shard, id)",
+    "CREATE TABLE IF NOT EXISTS coordination_leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, "
+    "expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS coordination_values (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+class SQLiteBackend(CoordinationBackend):
+    """Workers on one host sharing a SQLite file (WAL); tests and single-node deployments
+
+    Every process opens its own connection on first use, so a backend
+    created before forking the workers is safe to hand to them.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000, clock=time.time):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._clock = clock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(statement)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], object]):
+        """BEGIN IMMEDIATE takes the write lock up front, so read-then-write cannot interleave"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def send_many(self, messages: Iterable[Tuple[int, dict]]) -> None:
+        rows = [(shard, json.dumps(message)) for shard, message in messages]
+        if rows:
+            self._transaction(lambda conn: conn.executemany(
+                "INSERT INTO coordination_mailbox (shard, payload) VALUES (?, ?)", rows))
+
+    def receive(self, shard: int, limit: int = 1000) -> List[dict]:
+        def take(conn):
+            rows = conn.execute("SELECT id, payload FROM coordination_mailbox WHERE shard = ? ORDER BY id LIMIT ?",
+                                (shard, limit)).fetchall()
+            if rows:
+                conn.execute("DELETE FROM coordination_mailbox WHERE shard = ? AND id <= ?", (shard, rows[-1][0]))
+            return rows
+
+        # Cheap check first: idle shards poll without taking the write lock
+        with self._lock:
+            if self._connection().execute("SELECT 1 FROM coordination_mailbox WHERE shard = ? LIMIT 1",
+                                          (shard,)).fetchone() is None:
+                return []
+        return [json.loads(payload) for _, payload in self._transaction(take)]
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        now = self._clock()
+        return self._transaction(lambda conn: conn.execute(
+            "INSERT INTO coordination_leases (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE coordination_leases.owner = excluded.owner OR coordination_leases.expires_at <= ?",
+            (key, owner, now + ttl, now)).rowcount == 1)
+
+    def release(self, key: str, owner: str) -> bool:
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM coordination_leases WHERE key = ? AND owner = ?", (key, owner)).rowcount == 1)
+
+    def holder(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT owner FROM coordination_leases WHERE key = ? AND expires_at > ?",
+                (key, self._clock())).fetchone()
+        return row[0] if row else None
+
+    def exchange(self, key: str, value: str) -> Optional[str]:
+        def swap(conn):
+            row = conn.execute("SELECT value FROM coordination_values WHERE key = ?", (key,)).fetchone()
+            conn.execute("INSERT INTO coordination_values (key, value) VALUES (?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+            return row[0] if row else None
+        return self._transaction(swap)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM coordination_values WHERE key = ?",
+                                             (key,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+# Renew only if still ours / delete only if still ours - one round trip each, atomic on the server
+_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class RedisBackend(CoordinationBackend):
+    """Production backend on Redis or a Redis-compatible server (Valkey, KeyDB, Dragonfly)
+
+    Mailboxes are lists, leases are keys with a PX expiry, and the lease
+    checks run as Lua scripts. Uses only commands every compatible server
+    implements (RPUSH, LRANGE/LTRIM in MULTI, EVAL, GETSET).
+    """
+
+    def __init__(self, client, prefix: str = "taxi:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "taxi:") -> "RedisBackend":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The Redis coordination backend needs redis-py: pip install redis") from e
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def _mailbox(self, shard: int) -> str:
+        return f"{self.prefix}mailbox:{shard}"
+
+    @staticmethod
+    def _text(value) -> Optional[str]:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def send_many(self, messages: Iterable[Tuple[int, dict]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for shard, message in messages:
+            pipe.rpush(self._mailbox(shard), json.dumps(message))
+        pipe.execute()
+
+    def receive(self, shard: int, limit: int = 1000) -> List[dict]:
+        key = self._mailbox(shard)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(key, 0, limit - 1)
+        pipe.ltrim(key, limit, -1)
+        payloads, _ = pipe.execute()
+        return [json.loads(payload) for payload in payloads]
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(self.client.eval(_ACQUIRE_SCRIPT, 1, self.prefix + key, owner, max(1, int(ttl * 1000))))
+
+    def release(self, key: str, owner: str) -> bool:
+        return bool(self.client.eval(_RELEASE_SCRIPT, 1, self.prefix + key, owner))
+
+    def holder(self, key: str) -> Optional[str]:
+        return self._text(self.client.get(self.prefix + key))
+
+    def exchange(self, key: str, value: str) -> Optional[str]:
+        return self._text(self.client.getset(self.prefix + key, value))
+
+    def get(self, key: str) -> Optional[str]:
+        return self._text(self.client.get(self.prefix + key))
+
+    def close(self) -> None:
+        self.client.close()
+
+def backend_from_url(url: str) -> CoordinationBackend:
+    """memory://, sqlite:///path/to/file.db or redis://host:port/db (also rediss://, unix://)"""
+    if url.startswith("memory:"):
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"Unknown coordination backend {url!r}; expected memory://, sqlite:/// or redis://")
+
+# =====================================================
+# 👑 LEADER ELECTION
+# =====================================================
+
+class LeaderElection:
+    """At most one worker runs the batch job `name` at a time
+
+    The leader renews its lease every ttl/3; if it dies the lease lapses
+    and the next worker to ask takes over within ttl seconds.
+    """
+
+    def __init__(self, backend: CoordinationBackend, name: str, owner: str, ttl: float = 15.0,
+                 clock=time.monotonic):
+        self.backend = backend
+        self.key = f"leader:{name}"
+        self.owner = owner
+        self.ttl = ttl
+        self._clock = clock
+        self._leader = False
+        self._checked = float("-inf")
+
+    def is_leader(self) -> bool:
+        now = self._clock()
+        if now - self._checked >= self.ttl / 3:
+            self._leader = self.backend.acquire(self.key, self.owner, self.ttl)
+            self._checked = now
+        return self._leader
+
+    def run_if_leader(self, job: Callable, *args, **kwargs):
+        """job(*args, **kwargs) on the leader; None elsewhere"""
+        return job(*args, **kwargs) if self.is_leader() else None
+
+    def run_every(self, interval: float, job: Callable) -> bool:
+        """job() on the leader once `interval` seconds have passed since any worker last ran it
+
+        Asks for leadership on every call, so a leader keeps renewing its
+        lease between runs. The last run time is kept in the backend
+        (wall-clock seconds), so a new leader does not repeat a job the
+        previous one has just run.
+        """
+        if not self.is_leader():
+            return False
+        key = f"last_run:{self.key}"
+        now = time.time()
+        last = self.backend.get(key)
+        if last is not None and now - float(last) < interval:
+            return False
+        self.backend.exchange(key, repr(now))
+        job()
+        return True
+
+    def resign(self) -> None:
+        if self._leader:
+            self.backend.release(self.key, self.owner)
+        self._leader = False
+        self._checked = float("-inf")
+
+# =====================================================
+# 🚕 SHARD WORKERS
+# =====================================================
+
+class ShardRouter:
+    """Producers' side: sends driver fixes and new orders to the shard that owns them
+
+    Sends go straight to the backend until start(); from then on they
+    are queued and a sender thread delivers them, so producers on the
+    bot's event loop never wait on SQLite locks or Redis round trips.
+    """
+
+    def __init__(self, shard_map: ShardMap, backend: CoordinationBackend):
+        self.shard_map = shard_map
+        self.backend = backend
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.sent = 0
+        self.send_errors = 0
+
+    def start(self) -> "ShardRouter":
+        """Deliver from a background thread from now on"""
+        if self._thread is None:
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._sender, name="shard-router", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Deliver what is queued, then stop the sender thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = self._queue = None
+
+    def _send(self, messages: List[Tuple[Optional[int], dict]]) -> None:
+        """shard None: the driver's current owner, looked up when the message goes out"""
+        if self._queue is not None:
+            self._queue.put(messages)
+        else:
+            self._deliver(messages)
+
+    def _deliver(self, messages: List[Tuple[Optional[int], dict]]) -> None:
+        resolved = []
+        for shard, message in messages:
+            if shard is None:
+                owner = self.backend.get(f"driver:{message['id']}")
+                if owner is None:
+                    continue
+                shard = int(owner)
+            resolved.append((shard, message))
+        if resolved:
+            self.backend.send_many(resolved)
+            self.sent += len(resolved)
+
+    def _sender(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch, done = [], item is None
+            while item is not None:
+                batch.extend(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                done = item is None
+            if batch:
+                try:
+                    self._deliver(batch)
+                except Exception as e:
+                    self.send_errors += 1
+                    logger.error(f"❌ Sending {len(batch)} messages to the shards failed: {e}")
+            if done:
+                return
+
+    def driver_location(self, driver_id: str, lat: float, lng: float, is_available: Optional[bool] = None) -> int:
+        shard = self.shard_map.shard_of(lat, lng)
+        self._send([(shard, {"type": "driver", "id": driver_id, "lat": lat, "lng": lng,
+                             "available": is_available})])
+        return shard
+
+    def driver_available(self, driver_id: str, is_available: bool = True) -> None:
+        """Availability changes (trip started or finished) go to the driver's current owner"""
+        self._send([(None, {"type": "available", "id": driver_id, "available": is_available})])
+
+    def driver_locations(self, fixes: Iterable) -> int:
+        """LocationIngestor listener: a flush of fixes in one round trip"""
+        messages = [(self.shard_map.shard_of(fix.latitude, fix.longitude),
+                     {"type": "driver", "id": fix.driver_id, "lat": fix.latitude, "lng": fix.longitude,
+                      "available": fix.is_available})
+                    for fix in fixes]
+        if messages:
+            self._send(messages)
+        return len(messages)
+
+    def order(self, order_id: str, lat: float, lng: float) -> int:
+        shard = self.shard_map.shard_of(lat, lng)
+        self._send([(shard, {"type": "order", "id": order_id, "lat": lat, "lng": lng})])
+        return shard
+
+    def orders(self, orders: Iterable[Tuple[str, float, float]]) -> int:
+        messages = [(self.shard_map.shard_of(lat, lng), {"type": "order", "id": order_id, "lat": lat, "lng": lng})
+                    for order_id, lat, lng in orders]
+        if messages:
+            self._send(messages)
+        return len(messages)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize() if self._queue is not None else 0,
+                "sent": self.sent, "send_errors": self.send_errors}
+
+    def watch(self, order_model) -> None:
+        """Send every Order the ORM inserts with a pickup point to its shard once the insert commits"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        @event.listens_for(Session, "after_flush")
+        def _after_flush(session, flush_context):
+            new = [(o.id, o.pickup_lat, o.pickup_lng) for o in session.new
+                   if isinstance(o, order_model) and o.pickup_lat is not None and o.pickup_lng is not None]
+            if new:
+                session.info.setdefault("shard_orders", []).extend(new)
+
+        @event.listens_for(Session, "after_commit")
+        def _after_commit(session):
+            orders = session.info.pop("shard_orders", None)
+            if orders:
+                try:
+                    self.orders(orders)
+                except Exception as e:
+                    logger.error(f"❌ Routing {len(orders)} orders to their shards failed: {e}")
+
+        @event.listens_for(Session, "after_rollback")
+        def _after_rollback(session):
+            session.info.pop("shard_orders", None)
+
+class ShardWorker:
+    """Dispatch state of one shard: the drivers and waiting orders in its areas
+
+    Events may reach any worker; those for another shard's area are
+    handed off through the backend. A driver is owned by one shard at a
+    time (backend key driver:<id>): the shard that takes a driver over
+    tells the previous owner to drop it, so moving across an area border
+    costs two messages and every other fix stays local. Until the
+    previous owner answers with the driver's availability the newcomer
+    counts as busy. A GPS fix never makes a driver available; only an
+    "available" message (trip finished or cancelled) does. Matching uses
+    the same AssignmentEngine as assign_pending_orders, but only over the
+    shard's own drivers; areas are large so an order rarely has a closer
+    driver across the border. The database transition that records an
+    assignment stays the source of truth.
+    """
+
+    def __init__(self, shard_id: int, shard_map: ShardMap, backend: CoordinationBackend,
+                 max_pickup_km: float = 5.0, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG,
+                 engine: Optional[AssignmentEngine] = None):
+        self.shard_id = shard_id
+        self.shard_map = shard_map
+        self.backend = backend
+        self.engine = engine or AssignmentEngine(max_pickup_km=max_pickup_km)
+        self.max_pickup_km = self.engine.max_pickup_km
+        self.drivers = DriverSpatialIndex(cell_size_deg)
+        self.waiting: Deque[Tuple[str, float, float]] = deque()
+        self._offered: Dict[str, Tuple[float, float]] = {}
+        self._outbox: List[Tuple[int, dict]] = []
+
+        self.fixes = 0
+        self.orders = 0
+        self.assigned = 0
+        self.forwarded = 0
+        self.handoffs_in = 0
+        self.handoffs_out = 0
+
+    def driver_location(self, driver_id: str, lat: float, lng: float, is_available: Optional[bool] = None) -> None:
+        """A fix; is_available=None keeps what the shard knows (a driver never seen before is free)"""
+        shard = self.shard_map.shard_of(lat, lng)
+        if shard != self.shard_id:
+            # Left our areas (or never was ours): the owning shard takes it from here
+            current = self.drivers.get(driver_id)
+            if current is not None:
+                is_available = current[2]
+                self.drivers.remove(driver_id)
+                self.handoffs_out += 1
+            self._forward(shard, {"type": "driver", "id": driver_id, "lat": lat, "lng": lng,
+                                  "available": is_available})
+            return
+        self.fixes += 1
+        current = self.drivers.get(driver_id)
+        if current is not None:
+            if is_available is None:
+                is_available = current[2]
+        else:
+            previous = self.backend.exchange(f"driver:{driver_id}", str(self.shard_id))
+            if previous is not None and int(previous) != self.shard_id:
+                # The previous owner answers the release with the driver's availability
+                self._outbox.append((int(previous), {"type": "release", "id": driver_id, "to": self.shard_id}))
+                self.handoffs_in += 1
+                if is_available is None:
+                    is_available = False
+            elif is_available is None:
+                is_available = True
+        self.drivers.upsert(driver_id, lat, lng, is_available)
+
+    def release_driver(self, driver_id: str, new_owner: Optional[int] = None) -> None:
+        """Another shard took the driver over: drop it and tell the new owner whether it is free"""
+        current = self.drivers.get(driver_id)
+        self.drivers.remove(driver_id)
+        if current is not None and new_owner is not None:
+            self._outbox.append((new_owner, {"type": "available", "id": driver_id, "available": current[2]}))
+
+    def driver_available(self, driver_id: str, is_available: bool = True) -> None:
+        if driver_id in self.drivers:
+            self.drivers.set_available(driver_id, is_available)
+            return
+        owner = self.backend.get(f"driver:{driver_id}")
+        if owner is not None and int(owner) != self.shard_id:
+            self._forward(int(owner), {"type": "available", "id": driver_id, "available": is_available})
+
+    def submit_order(self, order_id: str, lat: float, lng: float) -> None:
+        shard = self.shard_map.shard_of(lat, lng)
+        if shard != self.shard_id:
+            self._forward(shard, {"type": "order", "id": order_id, "lat": lat, "lng": lng})
+            return
+        self.orders += 1
+        self.waiting.append((order_id, lat, lng))
+
+    def _forward(self, shard: int, message: dict) -> None:
+        self.forwarded += 1
+        self._outbox.append((shard, message))
+
+    def handle(self, message: dict) -> None:
+        kind = message["type"]
+        if kind == "driver":
+            self.driver_location(message["id"], message["lat"], message["lng"], message.get("available"))
+        elif kind == "order":
+            self.submit_order(message["id"], message["lat"], message["lng"])
+        elif kind == "release":
+            self.release_driver(message["id"], message.get("to"))
+        elif kind == "available":
+            self.driver_available(message["id"], message["available"])
+        else:
+            logger.warning(f"⚠️ Shard {self.shard_id}: unknown message type {kind!r}")
+
+    def poll(self, limit: int = 1000) -> int:
+        """Apply messages other shards and producers sent us; returns how many"""
+        messages = self.backend.receive(self.shard_id, limit)
+        for message in messages:
+            self.handle(message)
+        return len(messages)
+
+    def flush(self) -> int:
+        """Send queued handoffs in one round trip; kept for the next flush if that fails"""
+        outbox, self._outbox = self._outbox, []
+        if outbox:
+            try:
+                self.backend.send_many(outbox)
+            except Exception:
+                self._outbox = outbox + self._outbox
+                raise
+        return len(outbox)
+
+    def dispatch(self) -> List[Tuple[str, str, float]]:
+        """Match the waiting orders with the engine, oldest first: (order_id, driver_id, km)
+
+        The engine sees the available drivers among each order's nearest
+        candidates. Matched drivers become unavailable; orders without a
+        driver in reach keep waiting for the next round.
+        """
+        if not self.waiting:
+            return []
+        orders = list(self.waiting)
+        drivers = {}
+        for _, lat, lng in orders:
+            for driver_id, _ in self.drivers.nearest(lat, lng, self.engine.candidates, self.max_pickup_km):
+                if driver_id not in drivers:
+                    drivers[driver_id] = self.drivers.get(driver_id)
+        assignments = {a.order_id: a for a in self.engine.assign(
+            orders, [(driver_id, lat, lng) for driver_id, (lat, lng, _) in drivers.items()])}
+
+        matches, unmatched = [], deque()
+        for order_id, lat, lng in orders:
+            assignment = assignments.get(order_id)
+            if assignment is None:
+                unmatched.append((order_id, lat, lng))
+                continue
+            self.drivers.set_available(assignment.driver_id, False)
+            self._offered[order_id] = (lat, lng)
+            matches.append((order_id, assignment.driver_id, assignment.distance_km))
+        self.waiting = unmatched
+        self.assigned += len(matches)
+        return matches
+
+    def settle(self, matches: List[Tuple[str, str, float]], results: list) -> int:
+        """Apply the persisted outcome of dispatch(); returns how many assignments landed
+
+        A refused match frees its driver again, unless the driver was
+        refused for already having an active order: then the driver stays
+        busy and the order waits for another one.
+        """
+        landed = 0
+        for (order_id, driver_id, _), result in zip(matches, results):
+            point = self._offered.pop(order_id, None)
+            if result.applied:
+                landed += 1
+            elif result.reason == "driver_busy":
+                if point is not None:
+                    self.waiting.append((order_id, *point))
+            else:
+                self.drivers.set_available(driver_id, True)
+        return landed
+
+    def unmatch(self, matches: List[Tuple[str, str, float]]) -> None:
+        """Undo a dispatch() that was never persisted: its drivers are free, its orders wait again"""
+        orders = []
+        for order_id, driver_id, _ in matches:
+            point = self._offered.pop(order_id, None)
+            self.drivers.set_available(driver_id, True)
+            if point is not None:
+                orders.append((order_id, *point))
+        self.waiting.extendleft(reversed(orders))
+        self.assigned -= len(matches)
+
+    def stats(self) -> dict:
+        return {
+            "shard": self.shard_id,
+            "drivers": len(self.drivers),
+            "available": self.drivers.available_count,
+            "waiting": len(self.waiting),
+            "fixes": self.fixes,
+            "orders": self.orders,
+            "assigned": self.assigned,
+            "forwarded": self.forwarded,
+            "handoffs_in": self.handoffs_in,
+            "handoffs_out": self.handoffs_out,
+        }
+
+def _persist_assignments(matches: List[Tuple[str, str, float]]) -> list:
+    """Record matches as ASSIGNED; an order taken meanwhile frees its driver again"""
+    from order_lifecycle import assign_many, publish_transition
+    from taxi import SessionLocal
+
+    with SessionLocal() as db:
+        results = assign_many(db, [(order_id, driver_id) for order_id, driver_id, _ in matches])
+        db.commit()
+    for result in results:
+        if result.applied:
+            publish_transition(result)
+    return results
+
+def load_shard(worker: ShardWorker) -> Tuple[int, int]:
+    """Drivers and PENDING orders already in the database that fall in the worker's areas
+
+    Drivers with an ASSIGNED / ACCEPTED / STARTED order come in busy.
+    Returns (drivers, orders) loaded.
+    """
+    from sqlalchemy import and_, exists, select
+    from order_lifecycle import ACTIVE_STATUSES
+    from taxi import DriverPosition, Order, OrderStatus, SessionLocal
+
+    active = [OrderStatus[name] for name in ACTIVE_STATUSES]
+    busy = exists().where(and_(Order.driver_id == DriverPosition.driver_id, Order.status.in_(active)))
+    with SessionLocal() as db:
+        drivers = db.execute(select(DriverPosition.driver_id, DriverPosition.latitude, DriverPosition.longitude,
+                                    DriverPosition.is_available, busy.label("busy"))).all()
+        orders = db.execute(
+            select(Order.id, Order.pickup_lat, Order.pickup_lng)
+            .where(Order.status == OrderStatus.PENDING, Order.pickup_lat.isnot(None), Order.pickup_lng.isnot(None))
+            .order_by(Order.created_at, Order.id)
+        ).all()
+    shard_of, own = worker.shard_map.shard_of, worker.shard_id
+    loaded_drivers = loaded_orders = 0
+    for driver_id, lat, lng, is_available, on_trip in drivers:
+        if shard_of(lat, lng) == own:
+            worker.driver_location(driver_id, lat, lng, is_available is not False and not on_trip)
+            loaded_drivers += 1
+    for order_id, lat, lng in orders:
+        if shard_of(lat, lng) == own:
+            worker.submit_order(order_id, lat, lng)
+            loaded_orders += 1
+    return loaded_drivers, loaded_orders
+
+def run_worker(shard_id: int, shards: int, coordination_url: str, area_size_deg: float = DEFAULT_AREA_SIZE_DEG,
+               poll_interval: float = 0.05, lease_seconds: float = 15.0,
+               jobs: Optional[Dict[str, Tuple[float, Callable[[], object]]]] = None,
+               stop: Optional[threading.Event] = None, retry_interval: float = 1.0) -> None:
+    """Worker loop: apply mailbox events, dispatch, persist, run the batch jobs this worker leads
+
+    Starts from the drivers and waiting orders in the database (see
+    load_shard). jobs maps a name to (interval seconds, callable); each
+    runs on one worker at a time, whichever holds the job's leader lease.
+    A failing round (e.g. "database is locked") is logged and retried
+    after retry_interval; matches it could not persist are undone.
+    """
+    backend = backend_from_url(coordination_url)
+    worker = ShardWorker(shard_id, ShardMap(shards, area_size_deg), backend,
+                         engine=AssignmentEngine.from_config())
+    owner = f"shard-{shard_id}-{os.getpid()}"
+    elections = {name: LeaderElection(backend, name, owner, lease_seconds) for name in jobs or {}}
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                drivers, orders = load_shard(worker)
+                break
+            except Exception as e:
+                logger.error(f"❌ Shard {shard_id}: loading drivers and orders failed, retrying: {e}")
+                time.sleep(retry_interval)
+        else:
+            return
+        logger.info(f"🧩 Shard {shard_id}/{shards} started ({coordination_url}) with {drivers} drivers "
+                    f"and {orders} waiting orders")
+        while stop is None or not stop.is_set():
+            try:
+                received = worker.poll()
+                matches = worker.dispatch()
+                if matches:
+                    try:
+                        results = _persist_assignments(matches)
+                    except Exception:
+                        worker.unmatch(matches)
+                        raise
+                    worker.settle(matches, results)
+                worker.flush()
+            except Exception as e:
+                logger.error(f"❌ Shard {shard_id}: dispatch round failed: {e}")
+                received = 0
+                time.sleep(retry_interval)
+            for name, election in elections.items():
+                interval, job = jobs[name]
+                try:
+                    election.run_every(interval, job)
+                except Exception as e:
+                    logger.error(f"❌ Shard {shard_id}: job {name} failed: {e}")
+            if not received:
+                time.sleep(poll_interval)
+    finally:
+        for election in elections.values():
+            election.resign()
+        backend.close()
+
+def _rebuild_rollups() -> None:
+    from taxi import order_rollups
+    order_rollups.rebuild()
+
+def main(argv=None):
+    import multiprocessing
+    from taxi import Config
+
+    parser = argparse.ArgumentParser(description="Run sharded dispatch workers")
+    parser.add_argument("--workers", type=int, default=Config.SHARDS)
+    parser.add_argument("--coordination-url", default=Config.COORDINATION_URL)
+    parser.add_argument("--rollups-every", type=float, default=0.0,
+                        help="seconds between rollup rebuilds on the leader (0 = never)")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.coordination_url.startswith("memory:"):
+        parser.error("memory:// cannot be shared between worker processes; use sqlite:/// or redis://")
+
+    from taxi import prepare_database
+    prepare_database()
+    jobs = {"rollups": (args.rollups_every, _rebuild_rollups)} if args.rollups_every else None
+    ctx = multiprocessing.get_context("spawn")
+
+    def spawn(shard: int):
+        process = ctx.Process(target=run_worker, args=(shard, args.workers, args.coordination_url,
+                                                       Config.SHARD_AREA_DEG),
+                              kwargs={"lease_seconds": Config.LEADER_LEASE_SECONDS, "jobs": jobs}, daemon=True)
+        process.start()
+        return process
+
+    processes = [spawn(shard) for shard in range(args.workers)]
+    try:
+        # A worker that died anyway is replaced; it reloads its state from the database
+        while True:
+            time.sleep(1.0)
+            for shard, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error(f"❌ Shard {shard} worker exited with code {process.exitcode}, restarting")
+                    processes[shard] = spawn(shard)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# =====================================================
+# 📍 DRIVER SPATIAL INDEX
+# In-memory grid index for nearest-available-driver lookup
+# =====================================================
+
+import heapq
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from geo import DEFAULT_CELL_SIZE_DEG, KM_PER_DEG_LAT, Cell, cell_of, haversine_km, km_per_deg_lng
+
+class _DriverEntry:
+    __slots__ = ("lat", "lng", "is_available", "cell", "updated_at")
+
+    def __init__(self, lat: float, lng: float, is_available: bool, cell: Cell, updated_at: Optional[datetime]):
+        self.lat = lat
+        self.lng = lng
+        self.is_available = is_available
+        self.cell = cell
+        self.updated_at = updated_at
+
+class DriverSpatialIndex:
+    """Square-grid index over the newest position of every driver
+
+    Only available drivers are bucketed into grid cells, so k-nearest
+    queries never touch busy or offline drivers. Queries search rings of
+    cells outward from the query point and stop as soon as the k-th best
+    distance is closer than anything an unscanned ring could contain.
+    """
+
+    def __init__(self, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG):
+        self.cell_size = cell_size_deg
+        self._drivers: Dict[str, _DriverEntry] = {}
+        self._cells: Dict[Cell, Dict[str, Tuple[float, float]]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def __contains__(self, driver_id: str) -> bool:
+        return driver_id in self._drivers
+
+    @property
+    def available_count(self) -> int:
+        return sum(len(members) for members in self._cells.values())
+
+    # ---------- updates ----------
+
+    def upsert(self, driver_id: str, lat: float, lng: float, is_available: Optional[bool] = True,
+               updated_at: Optional[datetime] = None) -> bool:
+        """Insert or move a driver; stale fixes (older updated_at) are ignored
+
+        is_available=None keeps a known driver's availability (a new one is available).
+        """
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is not None:
+                if updated_at and entry.updated_at and updated_at < entry.updated_at:
+                    return False
+                self._unbucket(driver_id, entry)
+            if is_available is None:
+                is_available = entry.is_available if entry is not None else True
+            cell = cell_of(lat, lng, self.cell_size)
+            entry = _DriverEntry(lat, lng, bool(is_available), cell, updated_at)
+            self._drivers[driver_id] = entry
+            if entry.is_available:
+                self._cells.setdefault(cell, {})[driver_id] = (lat, lng)
+            return True
+
+    def set_available(self, driver_id: str, is_available: bool) -> None:
+        """Toggle availability without moving the driver"""
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is None or entry.is_available == bool(is_available):
+                return
+            self._unbucket(driver_id, entry)
+            entry.is_available = bool(is_available)
+            if entry.is_available:
+                self._cells.setdefault(entry.cell, {})[driver_id] = (entry.lat, entry.lng)
+
+    def remove(self, driver_id: str) -> None:
+        """Drop a driver from the index"""
+        with self._lock:
+            entry = self._drivers.pop(driver_id, None)
+            if entry is not None:
+                self._unbucket(driver_id, entry)
+
+    def get(self, driver_id: str) -> Optional[Tuple[float, float, bool]]:
+        """Current (lat, lng, is_available) of a driver"""
+        entry = self._drivers.get(driver_id)
+        return (entry.lat, entry.lng, entry.is_available) if entry else None
+
+    def _unbucket(self, driver_id: str, entry: _DriverEntry) -> None:
+        if not entry.is_available:
+            return
+        members = self._cells.get(entry.cell)
+        if members is not None:
+            members.pop(driver_id, None)
+            if not members:
+                del self._cells[entry.cell]
+
+    # ---------- queries ----------
+
+    def nearest(self, lat: float, lng: float, k: int = 1,
+                max_distance_km: Optional[float] = None) -> List[Tuple[str, float]]:
+        """k nearest available drivers as (driver_id, distance_km), closest first"""
+        if k <= 0:
+            return []
+        with self._lock:
+            if not self._cells:
+                return []
+            cy, cx = cell_of(lat, lng, self.cell_size)
+            lng_scale = km_per_deg_lng(lat) / KM_PER_DEG_LAT
+            best: List[Tuple[float, str]] = []  # max-heap on distance via negation
+            r = 0
+            while True:
+                if (2 * r + 1) ** 2 > len(self._cells):
+                    # Ring is larger than the occupied area: scan what is left directly
+                    for (y, x), members in self._cells.items():
+                        if max(abs(y - cy), abs(x - cx)) >= r:
+                            self._consider(best, k, lat, lng, lng_scale, members)
+                    break
+                for cell in _ring(cy, cx, r):
+                    members = self._cells.get(cell)
+                    if members:
+                        self._consider(best, k, lat, lng, lng_scale, members)
+                bound = self._unscanned_bound_km(lat, r)
+                if max_distance_km is not None and bound > max_distance_km:
+                    break
+                if len(best) == k and -best[0][0] * KM_PER_DEG_LAT <= bound:
+                    break
+                r += 1
+            ranked = [(driver_id, self._drivers[driver_id]) for _, driver_id in best]
+
+        # Candidates are ranked on a local flat projection; report true distances
+        result = sorted((haversine_km(lat, lng, entry.lat, entry.lng), driver_id) for driver_id, entry in ranked)
+        if max_distance_km is not None:
+            result = [item for item in result if item[0] <= max_distance_km]
+        return [(driver_id, dist) for dist, driver_id in result]
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[str, float]]:
+        """All available drivers inside a radius, closest first"""
+        return self.nearest(lat, lng, k=len(self._drivers) or 1, max_distance_km=radius_km)
+
+    @staticmethod
+    def _consider(best: List[Tuple[float, str]], k: int, lat: float, lng: float, lng_scale: float,
+                  members: Dict[str, Tuple[float, float]]) -> None:
+        # Equirectangular distance in degrees of latitude: exact enough at city scale, no trig
+        for driver_id, (dlat, dlng) in members.items():
+            dy = dlat - lat
+            dx = (dlng - lng) * lng_scale
+            dist = (dx * dx + dy * dy) ** 0.5
+            if len(best) < k:
+                heapq.heappush(best, (-dist, driver_id))
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, driver_id))
+
+    def _unscanned_bound_km(self, lat: float, r: int) -> float:
+        """Lower bound on the distance to any driver outside rings 0..r"""
+        span = r * self.cell_size
+        lat_km = span * KM_PER_DEG_LAT
+        lng_km = span * km_per_deg_lng(abs(lat) + (r + 1) * self.cell_size)
+        return 0.999 * min(lat_km, lng_km)
+
+    # ---------- database sync ----------
+
+    @classmethod
+    def from_locations(cls, locations: Iterable, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> "DriverSpatialIndex":
+        """Build an index from DriverPosition-like rows, keeping the newest fix per driver"""
+        index = cls(cell_size_deg)
+        for loc in locations:
+            index.upsert(loc.driver_id, loc.latitude, loc.longitude,
+                         loc.is_available if loc.is_available is not None else True, loc.updated_at)
+        return index
+
+    @classmethod
+    def load(cls, db, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> "DriverSpatialIndex":
+        """Build an index from driver_positions (one row per driver)"""
+        from taxi import DriverPosition
+        return cls.from_locations(db.query(DriverPosition).yield_per(1000), cell_size_deg)
+
+    def apply_fixes(self, fixes: Iterable) -> None:
+        """LocationIngestor listener: move every driver of a flushed batch"""
+        for fix in fixes:
+            self.upsert(fix.driver_id, fix.latitude, fix.longitude, fix.is_available, fix.recorded_at)
+
+def _ring(cy: int, cx: int, r: int):
+    """Cells at Chebyshev distance exactly r from (cy, cx)"""
+    if r == 0:
+        yield (cy, cx)
+        return
+    for x in range(cx - r, cx + r + 1):
+        yield (cy - r, x)
+        yield (cy + r, x)
+    for y in range(cy - r + 1, cy + r):
+        yield (y, cx - r)
+        yield (y, cx + r)
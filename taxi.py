@@ -1,28 +1,27 @@
 # =====================================================
 # 🚕 PROFESSIONAL TAXI MANAGEMENT SYSTEM
-# Telegram Bot + Database + Web Apps
+# Configuration and database; the ORM models live in models.py, the Telegram bot in bot.py
 # =====================================================
 
 import os
 import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Optional, List
-from uuid import uuid4
+from functools import wraps
+from typing import TYPE_CHECKING, Optional
 from enum import Enum
 
-# Database
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, ForeignKey, Enum as SQLEnum, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
-from sqlalchemy.pool import StaticPool
-
-# Telegram
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.constants import ParseMode
-
-# Other
+# Database - SQLAlchemy is imported with the models (models.py) and the
+# engines (init_engines), not by `import taxi`
 from dotenv import load_dotenv
+from metrics import MetricsRegistry, instrument_engine
+from user_cache import UserCache, UserSnapshot
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 # =====================================================
 # 📋 LOGGING & CONFIGURATION
@@ -49,12 +48,99 @@ class Config:
     DRIVER_APP_URL = f"{WEB_APP_URL}driver_pro.html"
     DISPATCHER_APP_URL = f"{WEB_APP_URL}admin_panel_driver_registration.html"
 
+    # Dispatching
+    AUTO_ASSIGN_RADIUS_KM = float(os.getenv('AUTO_ASSIGN_RADIUS_KM', '5'))
+    AVERAGE_SPEED_KMH = float(os.getenv('AVERAGE_SPEED_KMH', '25'))
+    ROAD_FACTOR = float(os.getenv('ROAD_FACTOR', '1.3'))
+
+    # Fare estimation (see pricing.py)
+    FARE_ROUNDING = float(os.getenv('FARE_ROUNDING', '100'))
+    SURGE_MAX = float(os.getenv('SURGE_MAX', '3.0'))
+    ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', '100000'))
+
+    # Driver GPS fixes (see location_ingest.py): coalesced per driver, written every flush
+    LOCATION_FLUSH_SECONDS = float(os.getenv('LOCATION_FLUSH_SECONDS', '1'))
+    LOCATION_MAX_PENDING = int(os.getenv('LOCATION_MAX_PENDING', '50000'))
+    LOCATION_KEEP_HISTORY = os.getenv('LOCATION_KEEP_HISTORY', 'true').lower() in ('1', 'true', 'yes')
+
+    # Demand/supply heatmap (see heatmap.py); windows are 1, 5 and 15 minutes
+    HEATMAP_SLOT_SECONDS = int(os.getenv('HEATMAP_SLOT_SECONDS', '10'))
+    HEATMAP_DRIVER_TTL = float(os.getenv('HEATMAP_DRIVER_TTL', '60'))
+    HEATMAP_PUBLISH_SECONDS = float(os.getenv('HEATMAP_PUBLISH_SECONDS', '10'))
+
+    # Database pool
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+    # Telegram user cache
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+
+    # Update delivery: "polling" or "webhook"
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '32'))
+    UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+
+    # Per-user update limits and Bot API flood control (see middleware.py)
+    USER_RATE_PER_SEC = float(os.getenv('USER_RATE_PER_SEC', '1'))
+    USER_RATE_BURST = float(os.getenv('USER_RATE_BURST', '5'))
+    CALLBACK_DEDUP_SECONDS = float(os.getenv('CALLBACK_DEDUP_SECONDS', '2'))
+    SEND_RATE_PER_SEC = float(os.getenv('SEND_RATE_PER_SEC', '30'))
+    SEND_CHAT_RATE_PER_SEC = float(os.getenv('SEND_CHAT_RATE_PER_SEC', '1'))
+    SEND_GROUP_RATE_PER_MIN = float(os.getenv('SEND_GROUP_RATE_PER_MIN', '20'))
+
+    # Real-time push to the web apps (Server-Sent Events); port 0 disables it
+    REALTIME_HOST = os.getenv('REALTIME_HOST', '0.0.0.0')
+    REALTIME_PORT = int(os.getenv('REALTIME_PORT', '0'))
+    REALTIME_BUFFER = int(os.getenv('REALTIME_BUFFER', '256'))
+    REALTIME_SLOW_CONSUMER = os.getenv('REALTIME_SLOW_CONSUMER', 'disconnect')
+
+    # Prometheus metrics at /metrics (see metrics.py); port 0 disables the endpoint
+    METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+    # Sampling profiler at /debug/profile on the metrics port; off unless enabled
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '5'))
+
+    # Sharded dispatch workers (see sharding.py); areas are hashed onto SHARDS workers
+    SHARDS = int(os.getenv('SHARDS', '1'))
+    SHARD_AREA_DEG = float(os.getenv('SHARD_AREA_DEG', '0.05'))
+    COORDINATION_URL = os.getenv('COORDINATION_URL', 'sqlite:///taxi_coordination.db')
+    LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', '15'))
+    # The bot sends new orders and driver fixes to those workers' mailboxes
+    SHARD_ROUTING = os.getenv('SHARD_ROUTING', 'false').lower() in ('1', 'true', 'yes')
+
+    # Columnar GPS history (see trajectory_store.py); one directory per time partition
+    TRAJECTORY_DIR = os.getenv('TRAJECTORY_DIR', 'trajectories')
+    TRAJECTORY_PARTITION_SECONDS = int(os.getenv('TRAJECTORY_PARTITION_SECONDS', '3600'))
+    TRAJECTORY_JOURNAL = os.getenv('TRAJECTORY_JOURNAL', 'true').lower() in ('1', 'true', 'yes')
+    TRAJECTORY_SEAL_SECONDS = float(os.getenv('TRAJECTORY_SEAL_SECONDS', '60'))
+
+    # Dispatcher call intake (see call_intake.py); classes jump the queue by their head start in seconds
+    CALL_BATCH_SIZE = int(os.getenv('CALL_BATCH_SIZE', '200'))
+    CALL_LINGER_MS = float(os.getenv('CALL_LINGER_MS', '50'))
+    CALL_MAX_PENDING = int(os.getenv('CALL_MAX_PENDING', '10000'))
+    CALL_DEDUP_SECONDS = float(os.getenv('CALL_DEDUP_SECONDS', '300'))
+    CALL_CLASS_HEAD_START = os.getenv('CALL_CLASS_HEAD_START', 'vip:120,corporate:60')
+    # A call whose write fails this many times is stored as "failed" instead of blocking the queue
+    CALL_MAX_ATTEMPTS = int(os.getenv('CALL_MAX_ATTEMPTS', '3'))
+    # Store every call as a "received" row when it is taken, so a restart can queue it again
+    CALL_RECORD_RECEIVED = os.getenv('CALL_RECORD_RECEIVED', 'true').lower() in ('1', 'true', 'yes')
+
 # =====================================================
 # 🗄️ DATABASE MODELS
+# The ORM tables are in models.py, loaded on first use (see __getattr__)
 # =====================================================
 
-Base = declarative_base()
-
 class UserRole(Enum):
     CUSTOMER = "customer"
     DRIVER = "driver"
@@ -69,388 +155,405 @@ class OrderStatus(Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
-    phone = Column(String, unique=True, nullable=False, index=True)
-    name = Column(String, nullable=False)
-    role = Column(SQLEnum(UserRole), nullable=False, default=UserRole.CUSTOMER)
-    telegram_id = Column(String, nullable=True, unique=True)
-    telegram_username = Column(String, nullable=True)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    # Relationships
-    orders_as_customer = relationship("Order", foreign_keys="Order.customer_id", back_populates="customer")
-    orders_as_driver = relationship("Order", foreign_keys="Order.driver_id", back_populates="driver")
-    dispatcher_calls = relationship("DispatcherCall", back_populates="dispatcher")
-    driver_locations = relationship("DriverLocation", back_populates="driver")
-
-class Order(Base):
-    __tablename__ = "orders"
-    
-    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
-    customer_id = Column(String, ForeignKey("users.id"), nullable=False)
-    driver_id = Column(String, ForeignKey("users.id"), nullable=True)
-    dispatcher_id = Column(String, ForeignKey("users.id"), nullable=True)
-    
-    pickup_location = Column(String, nullable=False)
-    destination_location = Column(String, nullable=False)
-    passengers_count = Column(Integer, default=1)
-    order_type = Column(String, default="standard")
-    
-    status = Column(SQLEnum(OrderStatus), default=OrderStatus.PENDING)
-    estimated_price = Column(Float, nullable=True)
-    final_price = Column(Float, nullable=True)
-    
-    customer_phone = Column(String, nullable=False)
-    customer_name = Column(String, nullable=True)
-    customer_comment = Column(String, nullable=True)
-    
-    pickup_lat = Column(Float, nullable=True)
-    pickup_lng = Column(Float, nullable=True)
-    destination_lat = Column(Float, nullable=True)
-    destination_lng = Column(Float, nullable=True)
-    
-    created_at = Column(DateTime, default=datetime.utcnow)
-    assigned_at = Column(DateTime, nullable=True)
-    started_at = Column(DateTime, nullable=True)
-    completed_at = Column(DateTime, nullable=True)
-    scheduled_time = Column(DateTime, nullable=True)
-    
-    # Relationships
-    customer = relationship("User", foreign_keys=[customer_id], back_populates="orders_as_customer")
-    driver = relationship("User", foreign_keys=[driver_id], back_populates="orders_as_driver")
+# Orders still in play - the dispatcher's open orders list
+ACTIVE_ORDER_STATUSES = (OrderStatus.PENDING, OrderStatus.ASSIGNED, OrderStatus.ACCEPTED, OrderStatus.STARTED)
 
-class DriverLocation(Base):
-    __tablename__ = "driver_locations"
-    
-    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
-    driver_id = Column(String, ForeignKey("users.id"), nullable=False)
-    latitude = Column(Float, nullable=False)
-    longitude = Column(Float, nullable=False)
-    is_available = Column(Boolean, default=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    driver = relationship("User", back_populates="driver_locations")
-
-class DispatcherCall(Base):
-    __tablename__ = "dispatcher_calls"
-    
-    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
-    dispatcher_id = Column(String, ForeignKey("users.id"), nullable=False)
-    order_id = Column(String, ForeignKey("orders.id"), nullable=True)
-    
-    customer_phone = Column(String, nullable=False)
-    customer_name = Column(String, nullable=True)
-    customer_location = Column(String, nullable=True)
-    passenger_count = Column(Integer, default=1)
-    call_notes = Column(String, nullable=True)
-    
-    call_status = Column(String, default="received")
-    received_at = Column(DateTime, default=datetime.utcnow)
-    completed_at = Column(DateTime, nullable=True)
-    
-    dispatcher = relationship("User", back_populates="dispatcher_calls")
+# `from taxi import Order` etc. imports models.py, and with it SQLAlchemy
+_MODEL_NAMES = ("Base", "User", "Order", "DriverLocation", "DriverPosition", "DriverLocationHistory",
+                "DispatcherCall", "OrderRollupHourly", "OrderRollupDaily", "DriverRollupDaily",
+                "ACTIVE_ORDER_FILTER", "order_rollups")
 
 # =====================================================
 # 🔌 DATABASE INITIALIZATION
 # =====================================================
 
-if 'sqlite' in Config.DATABASE_URL:
-    engine = create_engine(
-        Config.DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool
-    )
-else:
-    engine = create_engine(Config.DATABASE_URL)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+IS_SQLITE = Config.DATABASE_URL.startswith('sqlite')
+IS_SQLITE_MEMORY = IS_SQLITE and (':memory:' in Config.DATABASE_URL or Config.DATABASE_URL.rstrip('/') == 'sqlite:')
+
+def _async_database_url(url: str) -> str:
+    """Map DATABASE_URL onto its asyncio driver (aiosqlite / asyncpg)"""
+    if url.startswith('sqlite:'):
+        return 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+    for prefix in ('postgresql://', 'postgres://', 'postgresql+psycopg2://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    return url
+
+def _enable_sqlite_wal(sync_engine) -> None:
+    """WAL lets readers run alongside the single writer instead of locking the file"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+# Handler, session and query latencies, served at /metrics
+metrics = MetricsRegistry()
+session_latency = metrics.histogram("taxi_db_session_seconds", "Time a session helper kept its session",
+                                    ("helper",))
+write_lock_wait = metrics.histogram("taxi_db_write_lock_wait_seconds", "Wait for the SQLite writer connection")
+
+# Created by init_engines(); `from taxi import engine` etc. triggers it (see __getattr__)
+_ENGINE_NAMES = ("engine", "SessionLocal", "async_engine", "async_writer_engine",
+                 "AsyncSessionLocal", "AsyncWriteSessionLocal")
+_engines_ready = False
+_engines_lock = threading.Lock()
+_sqlite_write_lock = None
+
+def init_engines() -> None:
+    """Create the sync and async engines and their session factories (once)
+
+    Nothing connects yet. Importing taxi does not call this, so scripts
+    and workers that only need the models never load the asyncio
+    drivers; the bot's startup() and the first use of any engine do.
+    """
+    if _engines_ready:
+        return
+    with _engines_lock:
+        if not _engines_ready:
+            _create_engines()
 
-def get_db():
-    """Get database session"""
+def _create_engines() -> None:
+    global _engines_ready, _sqlite_write_lock, engine, SessionLocal
+    global async_engine, async_writer_engine, AsyncSessionLocal, AsyncWriteSessionLocal
+    import asyncio
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+    # Sync engine - startup, scripts and background threads
+    if IS_SQLITE_MEMORY:
+        engine = create_engine(
+            Config.DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+    elif IS_SQLITE:
+        engine = create_engine(Config.DATABASE_URL, connect_args={"check_same_thread": False})
+        _enable_sqlite_wal(engine)
+    else:
+        engine = create_engine(
+            Config.DATABASE_URL,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # Async engines - bot handlers. SQLite gets a reader pool plus one dedicated
+    # writer connection; Postgres reads and writes through one pool.
+    async_url = _async_database_url(Config.DATABASE_URL)
+    if IS_SQLITE_MEMORY:
+        async_engine = create_async_engine(async_url, poolclass=StaticPool)
+        async_writer_engine = async_engine
+    elif IS_SQLITE:
+        async_engine = create_async_engine(
+            async_url, poolclass=AsyncAdaptedQueuePool, pool_size=Config.DB_POOL_SIZE, max_overflow=0
+        )
+        async_writer_engine = create_async_engine(
+            async_url, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+        )
+        _enable_sqlite_wal(async_engine.sync_engine)
+        _enable_sqlite_wal(async_writer_engine.sync_engine)
+    else:
+        async_engine = create_async_engine(
+            async_url,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+        )
+        async_writer_engine = async_engine
+
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    AsyncWriteSessionLocal = async_sessionmaker(async_writer_engine, expire_on_commit=False, autoflush=False)
+
+    instrument_engine(metrics, engine, "sync")
+    instrument_engine(metrics, async_engine.sync_engine, "async")
+    if async_writer_engine is not async_engine:
+        instrument_engine(metrics, async_writer_engine.sync_engine, "async_writer")
+
+    # SQLite allows one writer at a time; queue writers here rather than on busy_timeout
+    _sqlite_write_lock = asyncio.Lock() if IS_SQLITE and not IS_SQLITE_MEMORY else None
+    _engines_ready = True
+
+def prepare_database() -> None:
+    """Startup phase: engines, missing tables, then missing columns and indexes of existing tables"""
+    from models import Base
+    init_engines()
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_indexes()
+
+def _add_missing_columns() -> None:
+    """ALTER TABLE ... ADD COLUMN for model columns an older database lacks
+
+    create_all() only creates whole tables. Columns that are nullable or
+    have a server default can be added in place; anything else is logged
+    and needs a manual migration.
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import CreateColumn
+    from models import Base
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f"⚠️ {table.name}.{column.name} is missing and cannot be added automatically")
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                logger.info(f"🔧 Added column {table.name}.{column.name}")
+
+def _add_missing_indexes() -> None:
+    """CREATE INDEX for model indexes an older database lacks
+
+    create_all() skips tables that already exist, so indexes added to a
+    model later (keyset pagination, partial active-order index) would
+    never reach a database created before them.
+    """
+    from sqlalchemy import inspect
+    from models import Base
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing:
+                continue
+            index.create(bind=engine, checkfirst=True)
+            logger.info(f"🔧 Created index {index.name} on {table.name}")
+
+def __getattr__(name: str):
+    if name in _ENGINE_NAMES:
+        init_engines()
+        return globals()[name]
+    if name in _MODEL_NAMES:
+        import models
+        for model_name in _MODEL_NAMES:
+            globals()[model_name] = getattr(models, model_name)
+        return globals()[name]
+    factory = _LAZY_SERVICES.get(name)
+    if factory is not None:
+        service = globals()[name] = factory()
+        return service
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Telegram user lookups - role changes made through the ORM invalidate entries (see models.py)
+user_cache = UserCache(max_size=Config.USER_CACHE_SIZE, ttl_seconds=Config.USER_CACHE_TTL)
+
+metrics.register_stats("taxi_user_cache", user_cache.stats)
+
+def _create_realtime_hub():
+    """Order status and driver position events pushed to the web apps"""
+    from models import Order
+    from realtime import PubSubHub
+    hub = PubSubHub(Config.REALTIME_BUFFER, Config.REALTIME_SLOW_CONSUMER)
+    hub.watch(Order)
+    metrics.register_stats("taxi_realtime", hub.stats)
+    return hub
+
+def _create_demand_heatmap():
+    """Where demand outpaces supply - feeds surge pricing and the admin dashboard"""
+    from models import Order
+    from heatmap import DemandHeatmap
+    heatmap = DemandHeatmap(slot_seconds=Config.HEATMAP_SLOT_SECONDS, driver_ttl=Config.HEATMAP_DRIVER_TTL)
+    init_engines()
     db = SessionLocal()
     try:
-        return db
+        heatmap.load(db)
     finally:
-        pass
-
-def get_user_by_telegram(telegram_id: str):
-    """Get user by Telegram ID"""
+        db.close()
+    heatmap.watch(Order)
+    metrics.register_stats("taxi_heatmap", heatmap.stats)
+    return heatmap
+
+def _create_driver_index():
+    """Nearest-available-driver lookups, loaded from driver_positions and kept current by the ingestor"""
+    from spatial_index import DriverSpatialIndex
+    init_engines()
     db = SessionLocal()
-    user = db.query(User).filter(User.telegram_id == str(telegram_id)).first()
-    db.close()
-    return user
-
-def create_or_update_user(telegram_id: str, telegram_username: str, role: UserRole = UserRole.CUSTOMER):
-    """Create or update user from Telegram"""
+    try:
+        index = DriverSpatialIndex.load(db)
+    finally:
+        db.close()
+    metrics.gauge("taxi_available_drivers", "Available drivers in the spatial index", lambda: index.available_count)
+    return index
+
+def _create_location_ingestor():
+    """Driver GPS fixes, coalesced and written in bulk; listeners are attached by the bot"""
+    from location_ingest import LocationIngestor
+    ingestor = LocationIngestor.from_config()
+    metrics.register_stats("taxi_location_ingest", ingestor.stats)
+    return ingestor
+
+def _create_trajectory_store():
+    """Every driver fix in columnar partitions; fed by the ingestor, sealed by the bot"""
+    from trajectory_store import TrajectoryStore
+    store = TrajectoryStore.from_config()
+    metrics.register_stats("taxi_trajectory", store.stats)
+    return store
+
+def _create_shard_router():
+    """Mailbox producer for the sharded dispatch workers; None unless SHARD_ROUTING is on"""
+    from models import Order
+    if not Config.SHARD_ROUTING:
+        return None
+    from sharding import ShardMap, ShardRouter, backend_from_url
+    router = ShardRouter(ShardMap.from_config(), backend_from_url(Config.COORDINATION_URL))
+    router.watch(Order)
+    metrics.register_stats("taxi_shard_router", router.stats)
+    return router
+
+def _create_call_intake():
+    """Dispatcher calls queued by priority and turned into orders in batches"""
+    from call_intake import CallIntake
+    intake = CallIntake.from_config(registry=metrics)
+    metrics.register_stats("taxi_call_intake", intake.stats)
+    return intake
+
+# Built on first access (`from taxi import realtime_hub`); numpy and asyncio
+# stay unloaded in processes that never touch them
+_LAZY_SERVICES = {
+    "realtime_hub": _create_realtime_hub,
+    "demand_heatmap": _create_demand_heatmap,
+    "location_ingestor": _create_location_ingestor,
+    "driver_index": _create_driver_index,
+    "trajectory_store": _create_trajectory_store,
+    "shard_router": _create_shard_router,
+    "call_intake": _create_call_intake,
+}
+
+# Session bound to the update currently being handled (see with_db_session)
+_update_session: ContextVar[Optional["AsyncSession"]] = ContextVar("update_session", default=None)
+
+@contextmanager
+def get_db():
+    """Get database session (closed on exit)"""
+    init_engines()
     db = SessionLocal()
-    user = db.query(User).filter(User.telegram_id == str(telegram_id)).first()
-    
-    if user:
-        user.telegram_username = telegram_username
-        user.updated_at = datetime.utcnow()
-    else:
-        user = User(
-            phone=f"tg_{telegram_id}",
-            name=telegram_username or f"User_{telegram_id}",
-            telegram_id=str(telegram_id),
-            telegram_username=telegram_username,
-            role=role,
-            is_active=True
-        )
-        db.add(user)
-    
-    db.commit()
-    db.close()
-    return user
+    try:
+        yield db
+    finally:
+        db.close()
 
-# =====================================================
-# 🤖 TELEGRAM BOT HANDLERS
-# =====================================================
+@asynccontextmanager
+async def db_session():
+    """Session of the current update, or a short-lived one outside handlers"""
+    session = _update_session.get()
+    if session is not None:
+        yield session
+        return
+    init_engines()
+    with session_latency.time("db_session"):
+        async with AsyncSessionLocal() as session:
+            yield session
+
+@asynccontextmanager
+async def db_write_session():
+    """Session for writes - on SQLite all writers share one serialized connection"""
+    init_engines()
+    if _sqlite_write_lock is None:
+        async with db_session() as session:
+            yield session
+        return
+    waited = time.perf_counter()
+    async with _sqlite_write_lock:
+        write_lock_wait.observe(time.perf_counter() - waited)
+        with session_latency.time("db_write_session"):
+            async with AsyncWriteSessionLocal() as session:
+                yield session
+
+def with_db_session(handler):
+    """Run a handler with one database session for the whole update"""
+    @wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        if _update_session.get() is not None:
+            return await handler(update, context, *args, **kwargs)
+        init_engines()
+        async with AsyncSessionLocal() as session:
+            token = _update_session.set(session)
+            try:
+                return await handler(update, context, *args, **kwargs)
+            finally:
+                _update_session.reset(token)
+    return wrapper
+
+async def dispose_engines(application=None) -> None:
+    """Close pooled async connections (Application post_shutdown hook)"""
+    if not _engines_ready:
+        return
+    await async_engine.dispose()
+    if async_writer_engine is not async_engine:
+        await async_writer_engine.dispose()
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle /start command - Show role selection"""
-    telegram_id = update.effective_user.id
-    telegram_username = update.effective_user.username or update.effective_user.first_name
-    
-    # Get or create user
-    user = get_user_by_telegram(telegram_id)
-    
-    if user:
-        await show_role_menu(update, context, user)
-    else:
-        # Show welcome message and role selection
-        keyboard = [
-            [
-                InlineKeyboardButton("👤 Mijoz", callback_data="role_customer"),
-                InlineKeyboardButton("🚗 Haydovchi", callback_data="role_driver"),
-            ],
-            [
-                InlineKeyboardButton("📞 Dispatcher", callback_data="role_dispatcher"),
-                InlineKeyboardButton("🔑 Admin", callback_data="role_admin"),
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        welcome_text = """
-🎉 *Xush Kelibsiz Taxi Sistemasiga!*
+async def get_user_by_telegram(telegram_id: str) -> Optional[UserSnapshot]:
+    """Get user by Telegram ID (served from user_cache when fresh)"""
+    from sqlalchemy import select
+    from models import User
 
-Iltimos, siz kim ekanligingizni tanlang:
+    found, snapshot = user_cache.lookup(telegram_id)
+    if found:
+        return snapshot
 
-👤 *Mijoz* - Taksi buyurtma qilish
-🚗 *Haydovchi* - Taksi bilan pulga raqib
-📞 *Dispatcher* - Taksi qo'ng'iroqlarni boshqarish
-🔑 *Admin* - Tizimni boshqarish
-        """
-        
-        await update.message.reply_text(
-            welcome_text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
-        )
+    async with db_session() as db:
+        result = await db.execute(select(User).where(User.telegram_id == str(telegram_id)))
+        user = result.scalars().first()
 
-async def show_role_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User) -> None:
-    """Show menu based on user role"""
-    keyboard = []
-    
-    if user.role == UserRole.ADMIN:
-        keyboard = [
-            [InlineKeyboardButton("📊 Admin Panel", url=Config.ADMIN_APP_URL)],
-            [InlineKeyboardButton("👥 Foydalanuvchilar", callback_data="admin_users")],
-            [InlineKeyboardButton("💰 Moliya", callback_data="admin_money")],
-            [InlineKeyboardButton("⚙️ Sozlamalar", callback_data="admin_settings")],
-        ]
-        title = "🔑 Admin Panel"
-        message = "Admin paneliga xush kelibsiz!"
-        
-    elif user.role == UserRole.DRIVER:
-        keyboard = [
-            [InlineKeyboardButton("🚗 Haydovchi Applikatsiyasi", url=Config.DRIVER_APP_URL)],
-            [InlineKeyboardButton("💰 Daromadim", callback_data="driver_earnings")],
-            [InlineKeyboardButton("⭐ Reyting", callback_data="driver_rating")],
-            [InlineKeyboardButton("🆘 Yordam", callback_data="driver_support")],
-        ]
-        title = "🚗 Haydovchi Applikatsiyasi"
-        message = "Haydovchi applikatsiyasiga xush kelibsiz!"
-        
-    elif user.role == UserRole.DISPATCHER:
-        keyboard = [
-            [InlineKeyboardButton("📞 Dispatcher Panel", url=Config.DISPATCHER_APP_URL)],
-            [InlineKeyboardButton("📋 Buyurtmalar", callback_data="dispatcher_orders")],
-            [InlineKeyboardButton("👥 Haydovchilar", callback_data="dispatcher_drivers")],
-            [InlineKeyboardButton("🆘 Yordam", callback_data="dispatcher_support")],
-        ]
-        title = "📞 Dispatcher Panel"
-        message = "Dispatcher paneliga xush kelibsiz!"
-        
-    else:  # CUSTOMER
-        keyboard = [
-            [InlineKeyboardButton("👤 Mijoz Applikatsiyasi", url=Config.CUSTOMER_APP_URL)],
-            [InlineKeyboardButton("🚕 Taksi Buyurtma Qilish", callback_data="customer_order")],
-            [InlineKeyboardButton("📋 Tarixim", callback_data="customer_history")],
-            [InlineKeyboardButton("🆘 Yordam", callback_data="customer_support")],
-        ]
-        title = "👤 Mijoz Applikatsiyasi"
-        message = "Mijoz applikatsiyasiga xush kelibsiz!"
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    menu_text = f"""
-{title}
+    snapshot = UserSnapshot.from_user(user) if user else None
+    user_cache.put(telegram_id, snapshot)
+    return snapshot
 
-{message}
+async def create_or_update_user(telegram_id: str, telegram_username: str, role: UserRole = UserRole.CUSTOMER) -> UserSnapshot:
+    """Create or update user from Telegram"""
+    from sqlalchemy import select
+    from models import User
 
-*Sizning roli:* {user.role.value.upper()}
-*Telefon:* {user.phone}
-*Yaratilgan:* {user.created_at.strftime('%Y-%m-%d %H:%M')}
-    """
-    
-    if update.callback_query:
-        await update.callback_query.edit_message_text(
-            menu_text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            menu_text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
-        )
+    async with db_write_session() as db:
+        result = await db.execute(select(User).where(User.telegram_id == str(telegram_id)))
+        user = result.scalars().first()
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle button clicks"""
-    query = update.callback_query
-    await query.answer()
-    
-    telegram_id = update.effective_user.id
-    telegram_username = update.effective_user.username or update.effective_user.first_name
-    
-    # Handle role selection
-    if query.data.startswith("role_"):
-        role_map = {
-            "role_customer": UserRole.CUSTOMER,
-            "role_driver": UserRole.DRIVER,
-            "role_dispatcher": UserRole.DISPATCHER,
-            "role_admin": UserRole.ADMIN,
-        }
-        
-        selected_role = role_map[query.data]
-        user = create_or_update_user(telegram_id, telegram_username, selected_role)
-        
-        await show_role_menu(update, context, user)
-    
-    # Handle other callbacks
-    elif query.data == "customer_order":
-        text = "🚕 *Taksi Buyurtma Qilish*\n\nTaksi buyurtmasini qilish uchun mijoz applikatsiyasini oching:"
-        keyboard = [[InlineKeyboardButton("👤 Mijoz Applikatsiyasi", url=Config.CUSTOMER_APP_URL)]]
-        
-    elif query.data == "driver_earnings":
-        text = "💰 *Mening Daromadim*\n\nSizning daromadingizni ko'rish uchun haydovchi applikatsiyasini oching:"
-        keyboard = [[InlineKeyboardButton("🚗 Haydovchi Applikatsiyasi", url=Config.DRIVER_APP_URL)]]
-        
-    elif query.data == "admin_users":
-        text = "👥 *Foydalanuvchilar*\n\nFoydalanuvchilarni boshqarish uchun admin panelini oching:"
-        keyboard = [[InlineKeyboardButton("🔑 Admin Panel", url=Config.ADMIN_APP_URL)]]
-        
-    elif query.data == "dispatcher_orders":
-        text = "📋 *Buyurtmalar*\n\nBuyurtmalarni boshqarish uchun dispatcher panelini oching:"
-        keyboard = [[InlineKeyboardButton("📞 Dispatcher Panel", url=Config.DISPATCHER_APP_URL)]]
-        
-    elif query.data in ["customer_history", "customer_support", "driver_rating", "driver_support", 
-                        "dispatcher_drivers", "dispatcher_support", "admin_money", "admin_settings"]:
-        text = "📱 *Applikatsiyani Oching*\n\nBu funksiyani ishlatish uchun applikatsiyani oching:"
-        keyboard = [[InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_menu")]]
-    
-    else:
-        text = "❌ Noma'lum buyruq"
-        keyboard = [[InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_menu")]]
-    
-    if query.data == "back_to_menu":
-        user = get_user_by_telegram(telegram_id)
         if user:
-            await show_role_menu(update, context, user)
-    else:
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
-        )
-
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle /help command"""
-    help_text = """
-🆘 *Yordam va Buyruqlar*
-
-*Asosiy Buyruqlar:*
-/start - Boshlanish
-/help - Yordam
-/profile - Mening Profilim
-/role - Roli o'zgartirish
-
-*Mijoz Buyruqlari:*
-/order - Taksi Buyurtma Qilish
-/history - Tarixim
-/support - Yordam So'rash
-
-*Haydovchi Buyruqlari:*
-/online - Online Bo'lish
-/offline - Offline Bo'lish
-/earnings - Daromadim
-/rating - Reyting
-
-*Admin Buyruqlari:*
-/dashboard - Dashboard
-/users - Foydalanuvchilar
-/settings - Sozlamalar
-
-*Dispatcher Buyruqlari:*
-/calls - Qo'ng'iroqlar
-/drivers - Haydovchilar
-/orders - Buyurtmalar
-    """
-    await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
-
-async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle /profile command"""
-    telegram_id = update.effective_user.id
-    user = get_user_by_telegram(telegram_id)
-    
-    if not user:
-        await update.message.reply_text("❌ Siz ro'yxatdan o'tmagansiz. /start buyrug'isini yuboring.")
-        return
-    
-    profile_text = f"""
-👤 *Mening Profilim*
+            user.telegram_username = telegram_username
+            user.updated_at = datetime.utcnow()
+        else:
+            user = User(
+                phone=f"tg_{telegram_id}",
+                name=telegram_username or f"User_{telegram_id}",
+                telegram_id=str(telegram_id),
+                telegram_username=telegram_username,
+                role=role,
+                is_active=True
+            )
+            db.add(user)
 
-*Ism:* {user.name}
-*Telefon:* {user.phone}
-*Roli:* {user.role.value.upper()}
-*Status:* {'✅ Faol' if user.is_active else '❌ Nofaol'}
-*Yaratilgan:* {user.created_at.strftime('%Y-%m-%d %H:%M')}
+        try:
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
 
-*Telegram:* @{user.telegram_username if user.telegram_username else 'Noma\'lum'}
-    """
-    
-    keyboard = [[InlineKeyboardButton("🔄 Roli O'zgartirish", callback_data="role_customer")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(profile_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle regular messages"""
-    message_text = update.message.text.lower()
-    
-    if message_text in ["salom", "hi", "hello", "assalom"]:
-        await start(update, context)
-    else:
-        await update.message.reply_text("🤔 Men bu buyruqni tushunmasdim. /help buyrug'isini yuboring.")
+    user_cache.invalidate(telegram_id)
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.put(telegram_id, snapshot)
+    return snapshot
 
 # =====================================================
 # 💾 DATABASE INITIALIZATION
@@ -458,9 +561,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 def init_system():
     """Initialize system with test data"""
+    from models import User
+    prepare_database()
     db = SessionLocal()
     
-    if db.query(User).count() > 0:
+    # EXISTS stops at the first row; COUNT(*) would scan a seeded users table
+    if db.query(db.query(User.id).exists()).scalar():
         db.close()
         return
     
@@ -529,40 +635,31 @@ def init_system():
         db.close()
 
 # =====================================================
-# 🚀 BOT STARTUP
+# 🚀 STARTUP
 # =====================================================
 
-async def main():
-    """Start the bot"""
-    # Initialize database
+def startup() -> None:
+    """Everything the bot process does before taking updates
+
+    Engines, schema and migrations, test data, and the services whose
+    ORM listeners must be in place before the first order is written.
+    """
+    started = time.perf_counter()
     init_system()
-    
-    # Create application
-    application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
-    
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("profile", profile_command))
-    application.add_handler(CommandHandler("role", start))  # Alias for /start
-    
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    application.add_handler(MessageHandler(filters.Regex(r"^(salom|hi|hello|assalom)$"), start))
-    
-    # Callback handler for buttons
-    application.add_handler(MessageHandler(filters.TEXT, handle_message))
-    from telegram.ext import CallbackQueryHandler
-    application.add_handler(CallbackQueryHandler(button_callback))
-    
-    logger.info("🤖 Telegram Bot started!")
-    logger.info(f"📱 Admin App: {Config.ADMIN_APP_URL}")
-    logger.info(f"👤 Customer App: {Config.CUSTOMER_APP_URL}")
-    logger.info(f"🚗 Driver App: {Config.DRIVER_APP_URL}")
-    logger.info(f"📞 Dispatcher App: {Config.DISPATCHER_APP_URL}")
-    
-    # Start bot
-    await application.run_polling()
+    for name, factory in _LAZY_SERVICES.items():
+        if name not in globals():
+            globals()[name] = factory()
+    logger.info(f"🚀 Startup finished in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+def main():
+    """Start the bot"""
+    startup()
+
+    # Telegram is only imported by the process that runs the bot
+    from bot import run
+    run()
 
 if __name__ == '__main__':
-    import asyncio
-    asyncio.run(main())
+    # bot.py imports `taxi`; run through that module so both share one set of engines and services
+    import taxi
+    taxi.main()
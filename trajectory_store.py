@@ -0,0 +1,490 @@
+# =====================================================
+# 🧭 DRIVER TRAJECTORY STORE
+# Time-partitioned, memory-mapped int32 columns of every GPS fix
+# =====================================================
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, TextIO, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are stored in microdegrees (~0.11 m of latitude)
+COORD_SCALE = 1_000_000
+# Timestamps are int32 milliseconds from the partition start, so partitions stay under ~24 days
+MAX_PARTITION_SECONDS = 2_000_000
+
+Timestamp = Union[float, datetime]
+
+class Trajectory(NamedTuple):
+    times: np.ndarray  # epoch seconds
+    lat: np.ndarray
+    lng: np.ndarray
+
+class PositionsAt(NamedTuple):
+    driver_ids: List[str]
+    lat: np.ndarray
+    lng: np.ndarray
+    times: np.ndarray  # epoch seconds of each driver's fix
+
+def _epoch(at: Timestamp) -> float:
+    """Naive datetimes are UTC, like every timestamp column in taxi.py"""
+    if isinstance(at, datetime):
+        return (at if at.tzinfo else at.replace(tzinfo=timezone.utc)).timestamp()
+    return float(at)
+
+def _delta_encode(values: np.ndarray, keyframe: int) -> Tuple[np.ndarray, np.ndarray]:
+    """int32 deltas of the whole column plus the absolute value every `keyframe` points"""
+    deltas = np.empty(values.size, dtype=np.int32)
+    if values.size:
+        deltas[0] = 0
+        np.subtract(values[1:], values[:-1], out=deltas[1:], casting="unsafe")
+    return deltas, np.ascontiguousarray(values[::keyframe], dtype=np.int32)
+
+def _decode_range(deltas: np.ndarray, keys: np.ndarray, keyframe: int, i: int, j: int) -> np.ndarray:
+    """Absolute values of points [i, j): start at the keyframe before i and sum deltas forward"""
+    if j <= i:
+        return np.empty(0, dtype=np.int64)
+    block = i // keyframe
+    run = np.cumsum(deltas[block * keyframe + 1:j], dtype=np.int64)
+    start = block * keyframe
+    values = np.empty(j - start, dtype=np.int64)
+    values[0] = keys[block]
+    values[1:] = keys[block] + run
+    return values[i - start:]
+
+def _decode_at(deltas: np.ndarray, keys: np.ndarray, keyframe: int, index: np.ndarray) -> np.ndarray:
+    """Absolute values at scattered points, at most keyframe - 1 deltas summed per point"""
+    if not index.size:
+        return np.empty(0, dtype=np.int64)
+    block = index // keyframe
+    steps = np.arange(1, keyframe)
+    positions = block[:, None] * keyframe + steps[None, :]
+    mask = positions <= index[:, None]
+    gathered = deltas[np.minimum(positions, index[:, None])].astype(np.int64)
+    return keys[block].astype(np.int64) + (gathered * mask).sum(axis=1)
+
+class _Partition:
+    """One sealed partition: points sorted by driver then time, memory-mapped read-only
+
+    Files: t/lat/lng/lat_keys/lng_keys .npy plus index.json (drivers with
+    the offset and length of their run of points).
+    """
+
+    COLUMNS = ("t", "lat", "lng", "lat_keys", "lng_keys")
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        self.start = index["start"]
+        self.keyframe = index["keyframe"]
+        self.drivers: List[str] = index["drivers"]
+        self.run_start = np.asarray(index["run_start"], dtype=np.int64)
+        self.run_count = np.asarray(index["run_count"], dtype=np.int64)
+        self._runs = {driver_id: i for i, driver_id in enumerate(self.drivers)}
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in self.COLUMNS}
+        self.t, self.lat, self.lng = columns["t"], columns["lat"], columns["lng"]
+        self.lat_keys, self.lng_keys = columns["lat_keys"], columns["lng_keys"]
+
+    @property
+    def points(self) -> int:
+        return int(self.t.size)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.path))
+
+    @staticmethod
+    def write(path: str, start: int, keyframe: int, drivers: Sequence[str], codes: np.ndarray,
+              t: np.ndarray, lat: np.ndarray, lng: np.ndarray) -> None:
+        """Sort by (driver, time), drop repeated fixes and write the columns; codes index into drivers"""
+        order = np.lexsort((lng, lat, t, codes))
+        codes, t, lat, lng = codes[order], t[order], lat[order], lng[order]
+        if t.size:
+            # The same fix twice, e.g. a journal replayed into a partition that was already sealed
+            keep = np.r_[True, (codes[1:] != codes[:-1]) | (t[1:] != t[:-1])
+                         | (lat[1:] != lat[:-1]) | (lng[1:] != lng[:-1])]
+            codes, t, lat, lng = codes[keep], t[keep], lat[keep], lng[keep]
+        present, run_start, run_count = np.unique(codes, return_index=True, return_counts=True)
+        lat_deltas, lat_keys = _delta_encode(lat, keyframe)
+        lng_deltas, lng_keys = _delta_encode(lng, keyframe)
+        os.makedirs(path)
+        for name, column in (("t", t.astype(np.int32)), ("lat", lat_deltas), ("lng", lng_deltas),
+                             ("lat_keys", lat_keys), ("lng_keys", lng_keys)):
+            np.save(os.path.join(path, f"{name}.npy"), column)
+        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"start": start, "keyframe": keyframe, "drivers": [drivers[c] for c in present.tolist()],
+                       "run_start": run_start.tolist(), "run_count": run_count.tolist()}, f)
+
+    def decoded(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Every point as (drivers, codes, t, lat, lng) - for merging late fixes"""
+        codes = np.repeat(np.arange(len(self.drivers)), self.run_count)
+        lat = _decode_range(self.lat, self.lat_keys, self.keyframe, 0, self.points)
+        lng = _decode_range(self.lng, self.lng_keys, self.keyframe, 0, self.points)
+        return self.drivers, codes, np.asarray(self.t, dtype=np.int64), lat, lng
+
+    def range(self, driver_id: str, t1: int, t2: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(t, lat, lng) of a driver's fixes with t1 <= t <= t2 (ms from partition start)"""
+        run = self._runs.get(driver_id)
+        if run is None:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        offset = int(self.run_start[run])
+        times = self.t[offset:offset + int(self.run_count[run])]
+        i = offset + int(np.searchsorted(times, t1, side="left"))
+        j = offset + int(np.searchsorted(times, t2, side="right"))
+        return (np.asarray(self.t[i:j], dtype=np.int64),
+                _decode_range(self.lat, self.lat_keys, self.keyframe, i, j),
+                _decode_range(self.lng, self.lng_keys, self.keyframe, i, j))
+
+    def latest(self, at: int, since: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(run, point index) of each driver's last fix with since <= t <= at
+
+        A binary search over every driver's run at once: log2(longest run)
+        vectorized steps instead of one search per driver.
+        """
+        lo = self.run_start.copy()
+        hi = self.run_start + self.run_count  # first point after `at` lies in [lo, hi]
+        while True:
+            open_ = lo < hi
+            if not open_.any():
+                break
+            mid = (lo + hi) // 2
+            after = np.zeros(lo.size, dtype=bool)
+            after[open_] = self.t[mid[open_]] > at
+            hi = np.where(open_ & after, mid, hi)
+            lo = np.where(open_ & ~after, mid + 1, lo)
+        index = lo - 1
+        found = index >= self.run_start
+        runs = np.flatnonzero(found)
+        index = index[found]
+        recent = self.t[index] >= since
+        return runs[recent], index[recent]
+
+class _OpenPartition:
+    """Fixes of a partition that is still being written, in growable int32 arrays"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.drivers: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.code = array("i")
+        self.t = array("i")
+        self.lat = array("i")
+        self.lng = array("i")
+
+    def append(self, driver_id: str, t_ms: int, lat: int, lng: int) -> None:
+        code = self.codes.get(driver_id)
+        if code is None:
+            code = self.codes[driver_id] = len(self.drivers)
+            self.drivers.append(driver_id)
+        self.code.append(code)
+        self.t.append(t_ms)
+        self.lat.append(lat)
+        self.lng.append(lng)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        return (np.frombuffer(self.code, dtype=np.int32), np.frombuffer(self.t, dtype=np.int32),
+                np.frombuffer(self.lat, dtype=np.int32), np.frombuffer(self.lng, dtype=np.int32))
+
+    @property
+    def points(self) -> int:
+        return len(self.t)
+
+class TrajectoryStore:
+    """Every driver fix in 12 bytes: int32 time, int32 delta lat, int32 delta lng
+
+    Time is cut into partitions of partition_seconds. The current ones
+    are kept in memory; seal() writes each finished partition (after
+    seal_delay, so late fixes still land in it) as columns sorted by
+    driver then time, and memory-maps it. Coordinates are delta-encoded
+    along the sorted column with an absolute keyframe every `keyframe`
+    points, so any point decodes from at most keyframe - 1 deltas. Fixes
+    arriving for an already sealed partition are merged in by rewriting it.
+
+    With journal on, every fix of an unsealed partition is also appended
+    to <root>/<start>.log and replayed on the next start, so a restart
+    loses nothing but fixes still in the OS write buffer. Without it a
+    crash loses everything not yet sealed: up to partition_seconds +
+    seal_delay (65 minutes by default).
+    """
+
+    def __init__(self, root: str, partition_seconds: int = 3600, seal_delay: float = 300.0,
+                 keyframe: int = 64, journal: bool = True, clock=time.time):
+        if not 0 < partition_seconds <= MAX_PARTITION_SECONDS:
+            raise ValueError(f"partition_seconds must be in 1..{MAX_PARTITION_SECONDS}")
+        self.root = root
+        self.partition_seconds = int(partition_seconds)
+        self.seal_delay = seal_delay
+        self.keyframe = keyframe
+        self.journal = journal
+        self._clock = clock
+        self._open: Dict[int, _OpenPartition] = {}
+        self._sealed: Dict[int, Optional[_Partition]] = {}
+        self._journals: Dict[int, TextIO] = {}
+        self._lock = threading.RLock()
+        self._seal_lock = threading.Lock()  # one seal at a time; appends only wait for _lock
+
+        self.appended = 0
+        self.sealed_points = 0
+        self.merges = 0
+        self.replayed = 0
+
+        os.makedirs(root, exist_ok=True)
+        for entry in os.scandir(root):
+            if entry.is_dir() and entry.name.isdigit():
+                self._sealed[int(entry.name)] = None  # opened on first query
+        for entry in os.scandir(root):
+            name, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext == ".log" and name.isdigit():
+                self._replay(int(name), entry.path)
+
+    @classmethod
+    def from_config(cls, **overrides) -> "TrajectoryStore":
+        from taxi import Config
+        settings = {"root": Config.TRAJECTORY_DIR, "partition_seconds": Config.TRAJECTORY_PARTITION_SECONDS,
+                    "journal": Config.TRAJECTORY_JOURNAL}
+        settings.update(overrides)
+        return cls(**settings)
+
+    # ---------- writes ----------
+
+    def _partition_start(self, at: float) -> int:
+        return int(at // self.partition_seconds) * self.partition_seconds
+
+    def append(self, driver_id: str, lat: float, lng: float, at: Timestamp) -> None:
+        with self._lock:
+            start = self._append(driver_id, lat, lng, at)
+            if start in self._journals:
+                self._journals[start].flush()
+
+    def record_fixes(self, fixes: Iterable) -> None:
+        """LocationIngestor listener: keep every flushed fix"""
+        with self._lock:
+            starts = {self._append(fix.driver_id, fix.latitude, fix.longitude, fix.recorded_at) for fix in fixes}
+            for start in starts & self._journals.keys():
+                self._journals[start].flush()
+
+    def _append(self, driver_id: str, lat: float, lng: float, at: Timestamp) -> int:
+        """Buffer (and journal) one fix; returns its partition start"""
+        at = _epoch(at)
+        start = self._partition_start(at)
+        partition = self._open.get(start)
+        if partition is None:
+            partition = self._open[start] = _OpenPartition(start)
+        t_ms, lat_micro, lng_micro = (int(round((at - start) * 1000)), int(round(lat * COORD_SCALE)),
+                                      int(round(lng * COORD_SCALE)))
+        partition.append(driver_id, t_ms, lat_micro, lng_micro)
+        if self.journal:
+            journal = self._journals.get(start)
+            if journal is None:
+                journal = self._journals[start] = open(self._journal_path(start), "a", encoding="utf-8")
+            journal.write(f"{driver_id}\t{t_ms}\t{lat_micro}\t{lng_micro}\n")
+        self.appended += 1
+        return start
+
+    def _journal_path(self, start: int) -> str:
+        return os.path.join(self.root, f"{start}.log")
+
+    def _replay(self, start: int, path: str) -> None:
+        """Refill an unsealed partition from its journal; a torn last line is cut off"""
+        partition = self._open[start] = _OpenPartition(start)
+        with open(path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                # Appends resume after the last whole line
+                f.truncate(end)
+        for line in data[:end].decode("utf-8").splitlines():
+            fields = line.split("\t")
+            if len(fields) == 4:
+                driver_id, t_ms, lat, lng = fields
+                partition.append(driver_id, int(t_ms), int(lat), int(lng))
+        self.replayed += partition.points
+        logger.info(f"🧭 Replayed {partition.points} trajectory fixes of partition {start}")
+
+    def seal(self, before: Optional[float] = None) -> int:
+        """Write partitions that ended before `before` (default: now - seal_delay); returns points written"""
+        cutoff = (self._clock() - self.seal_delay) if before is None else before
+        written = 0
+        with self._seal_lock:
+            with self._lock:
+                due = [start for start in sorted(self._open) if start + self.partition_seconds <= cutoff]
+            for start in due:
+                written += self._seal(start)
+        return written
+
+    def flush(self) -> int:
+        """Seal everything, including the current partition (shutdown)"""
+        return self.seal(before=float("inf"))
+
+    def _seal(self, start: int) -> int:
+        """Write one partition; the lock is only held to copy its fixes and to swap the result in"""
+        with self._lock:
+            partition = self._open[start]
+            count = partition.points
+            drivers = list(partition.drivers)
+            codes, t, lat, lng = (column.astype(np.int64) for column in partition.columns())
+            previous = self._partition(start) if start in self._sealed else None
+
+        path = os.path.join(self.root, str(start))
+        if previous is not None:
+            # Late fixes: merge with what is on disk and swap the directory
+            old_drivers, old_codes, old_t, old_lat, old_lng = previous.decoded()
+            merged = list(old_drivers)
+            position = {driver_id: i for i, driver_id in enumerate(merged)}
+            for driver_id in drivers:
+                if driver_id not in position:
+                    position[driver_id] = len(merged)
+                    merged.append(driver_id)
+            remap = np.asarray([position[driver_id] for driver_id in drivers], dtype=np.int64)
+            codes = np.concatenate([old_codes, remap[codes]])
+            t, lat, lng = (np.concatenate(pair) for pair in ((old_t, t), (old_lat, lat), (old_lng, lng)))
+            drivers = merged
+        staging = path + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        _Partition.write(staging, start, self.keyframe, drivers, codes, t, lat, lng)
+
+        retired = path + ".old"
+        shutil.rmtree(retired, ignore_errors=True)
+        with self._lock:
+            if os.path.exists(path):
+                os.rename(path, retired)
+            os.rename(staging, path)
+            # A crash before the journal is gone replays fixes the partition already has;
+            # _Partition.write drops those repeats on the next seal
+            self._retire_journal(start, partition, count)
+            self._sealed[start] = _Partition(path)
+            if previous is not None:
+                self.merges += 1
+            self.sealed_points += count
+        shutil.rmtree(retired, ignore_errors=True)  # open memory maps stay valid until released
+        return count
+
+    def _retire_journal(self, start: int, partition: _OpenPartition, count: int) -> None:
+        """Drop the first count fixes of a sealed partition; fixes that arrived meanwhile stay open"""
+        journal = self._journals.pop(start, None)
+        if journal is not None:
+            journal.close()
+        if partition.points == count:
+            del self._open[start]
+            if os.path.exists(self._journal_path(start)):
+                os.remove(self._journal_path(start))
+            return
+        rest = self._open[start] = _OpenPartition(start)
+        for i in range(count, partition.points):
+            rest.append(partition.drivers[partition.code[i]], partition.t[i], partition.lat[i], partition.lng[i])
+        if self.journal:
+            staging = self._journal_path(start) + ".tmp"
+            with open(staging, "w", encoding="utf-8") as f:
+                f.writelines(f"{driver_id}\t{t_ms}\t{lat}\t{lng}\n" for driver_id, t_ms, lat, lng in zip(
+                    (rest.drivers[c] for c in rest.code), rest.t, rest.lat, rest.lng))
+            os.replace(staging, self._journal_path(start))
+
+    # ---------- queries ----------
+
+    def _partition(self, start: int) -> _Partition:
+        partition = self._sealed.get(start)
+        if partition is None:
+            partition = self._sealed[start] = _Partition(os.path.join(self.root, str(start)))
+        return partition
+
+    def _starts(self, t1: float, t2: float) -> List[int]:
+        first, last = self._partition_start(t1), self._partition_start(t2)
+        return [start for start in sorted(set(self._sealed) | set(self._open)) if first <= start <= last]
+
+    def trajectory(self, driver_id: str, start: Timestamp, end: Timestamp) -> Trajectory:
+        """Fixes of one driver with start <= time <= end, oldest first"""
+        t1, t2 = _epoch(start), _epoch(end)
+        times, lats, lngs = [], [], []
+        with self._lock:
+            for part_start in self._starts(t1, t2):
+                lo, hi = int(np.floor((t1 - part_start) * 1000)), int(np.ceil((t2 - part_start) * 1000))
+                if part_start in self._sealed:
+                    t, lat, lng = self._partition(part_start).range(driver_id, lo, hi)
+                    times.append(t / 1000 + part_start)
+                    lats.append(lat)
+                    lngs.append(lng)
+                buffered = self._open.get(part_start)
+                code = buffered.codes.get(driver_id) if buffered is not None else None
+                if code is not None:
+                    codes, t, lat, lng = buffered.columns()
+                    mask = (codes == code) & (t >= lo) & (t <= hi)
+                    times.append(t[mask] / 1000 + part_start)
+                    lats.append(lat[mask])
+                    lngs.append(lng[mask])
+        if not times:
+            return Trajectory(np.empty(0), np.empty(0), np.empty(0))
+        times, lat, lng = np.concatenate(times), np.concatenate(lats), np.concatenate(lngs)
+        order = np.argsort(times, kind="stable")
+        return Trajectory(times[order], lat[order] / COORD_SCALE, lng[order] / COORD_SCALE)
+
+    def positions_at(self, at: Timestamp, bbox: Optional[Tuple[float, float, float, float]] = None,
+                     max_age: float = 60.0) -> PositionsAt:
+        """Where every driver was at `at`: their last fix in the max_age seconds before it
+
+        bbox is (min_lat, min_lng, max_lat, max_lng); drivers outside it are left out.
+        """
+        moment = _epoch(at)
+        latest: Dict[str, Tuple[float, int, int]] = {}
+        with self._lock:
+            for part_start in self._starts(moment - max_age, moment):
+                upper = int(np.floor((moment - part_start) * 1000))
+                lower = int(np.ceil((moment - max_age - part_start) * 1000))
+                found = []
+                if part_start in self._sealed:
+                    partition = self._partition(part_start)
+                    runs, index = partition.latest(upper, lower)
+                    found.append(([partition.drivers[r] for r in runs.tolist()], partition.t[index],
+                                  _decode_at(partition.lat, partition.lat_keys, partition.keyframe, index),
+                                  _decode_at(partition.lng, partition.lng_keys, partition.keyframe, index)))
+                buffered = self._open.get(part_start)
+                if buffered is not None and buffered.points:
+                    codes, t, lat, lng = buffered.columns()
+                    window = np.flatnonzero((t <= upper) & (t >= lower))
+                    # Last fix per driver: sort the window by (driver, time), keep each run's end
+                    window = window[np.lexsort((t[window], codes[window]))]
+                    last = window[np.r_[codes[window][1:] != codes[window][:-1], True]] if window.size else window
+                    found.append(([buffered.drivers[c] for c in codes[last].tolist()], t[last], lat[last], lng[last]))
+                for drivers, t, lat, lng in found:
+                    for driver_id, fix_t, fix_lat, fix_lng in zip(drivers, (t / 1000 + part_start).tolist(),
+                                                                   lat.tolist(), lng.tolist()):
+                        current = latest.get(driver_id)
+                        if current is None or fix_t >= current[0]:
+                            latest[driver_id] = (fix_t, fix_lat, fix_lng)
+        driver_ids = list(latest)
+        times = np.fromiter((latest[d][0] for d in driver_ids), dtype=np.float64, count=len(driver_ids))
+        lat = np.fromiter((latest[d][1] for d in driver_ids), dtype=np.float64, count=len(driver_ids)) / COORD_SCALE
+        lng = np.fromiter((latest[d][2] for d in driver_ids), dtype=np.float64, count=len(driver_ids)) / COORD_SCALE
+        if bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            inside = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+            driver_ids = [d for d, keep in zip(driver_ids, inside.tolist()) if keep]
+            lat, lng, times = lat[inside], lng[inside], times[inside]
+        return PositionsAt(driver_ids, lat, lng, times)
+
+    def stats(self) -> dict:
+        with self._lock:
+            open_points = sum(partition.points for partition in self._open.values())
+            sealed = [self._partition(start) for start in self._sealed]
+            disk = sum(partition.nbytes for partition in sealed)
+            points = sum(partition.points for partition in sealed)
+        return {
+            "partitions": len(sealed),
+            "open_partitions": len(self._open),
+            "open_points": open_points,
+            "sealed_points": points,
+            "disk_bytes": disk,
+            "bytes_per_point": round(disk / points, 2) if points else 0.0,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "merges": self.merges,
+        }
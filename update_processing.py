@@ -0,0 +1,136 @@
+# =====================================================
+# ⚙️ CONCURRENT UPDATE PROCESSING
+# Worker pool that keeps per-chat order and sheds overload
+# =====================================================
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+_UNBOUNDED = 2 ** 31 - 1
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs up to `workers` updates at once, one at a time per chat
+
+    Updates from the same chat are serialized in arrival order (asyncio
+    locks wake waiters FIFO), so a user's button taps never race each
+    other. Updates from different chats run concurrently. At most
+    `max_queue_size` admitted updates may wait for a worker; anything
+    beyond that is dropped and counted in `shed`.
+    """
+
+    def __init__(self, workers: int = 32, max_queue_size: int = 1000):
+        # The base class semaphore must never block, or overload would queue up
+        # in front of it instead of reaching the shedding check below
+        super().__init__(max_concurrent_updates=_UNBOUNDED)
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.latency_observer: Optional[Callable[[object, float], None]] = None
+        # Checked when an update arrives, before it queues for its chat (see middleware.UpdateGuard)
+        self.admission: Optional[Callable[[object], bool]] = None
+
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._chat_locks: Dict[int, List] = {}  # chat_id -> [lock, holders]
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.rejected = 0
+        self.high_water = 0
+
+    async def initialize(self) -> None:
+        self._worker_slots = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        if self.admission is not None and not self.admission(update):
+            self.rejected += 1
+            coroutine.close()
+            return
+        if self.waiting >= self.max_queue_size:
+            self.shed += 1
+            coroutine.close()
+            logger.debug(f"Update shed, {self.waiting} waiting")
+            return
+        if self._worker_slots is None:
+            await self.initialize()
+
+        self.waiting += 1
+        self.high_water = max(self.high_water, self.waiting)
+        is_waiting = True
+        chat_id = _chat_key(update)
+        lock = self._acquire_chat_lock(chat_id) if chat_id is not None else None
+        started = time.perf_counter()
+        try:
+            if lock is not None:
+                await lock.acquire()
+            try:
+                async with self._worker_slots:
+                    self.waiting -= 1
+                    is_waiting = False
+                    self.running += 1
+                    try:
+                        await coroutine
+                        self.processed += 1
+                    except Exception:
+                        self.failed += 1
+                        raise
+                    finally:
+                        self.running -= 1
+            finally:
+                if lock is not None:
+                    lock.release()
+        finally:
+            if is_waiting:
+                # Cancelled before a worker picked it up
+                self.waiting -= 1
+                coroutine.close()
+            if chat_id is not None:
+                self._release_chat_lock(chat_id)
+            if self.latency_observer is not None:
+                self.latency_observer(update, time.perf_counter() - started)
+
+    def _acquire_chat_lock(self, chat_id: int) -> asyncio.Lock:
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_chat_lock(self, chat_id: int) -> None:
+        entry = self._chat_locks.get(chat_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._chat_locks[chat_id]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue_size": self.max_queue_size,
+            "waiting": self.waiting,
+            "running": self.running,
+            "high_water": self.high_water,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "active_chats": len(self._chat_locks),
+        }
+
+def _chat_key(update: object) -> Optional[int]:
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return None
@@ -0,0 +1,128 @@
+# =====================================================
+# 🧠 TELEGRAM USER CACHE
+# Bounded LRU + TTL cache of immutable user snapshots
+# =====================================================
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+class UserSnapshot:
+    """Read-only copy of the User columns the bot needs
+
+    Safe to keep after the session that loaded it is closed - there is
+    nothing to lazy-load and nothing to expire.
+    """
+    __slots__ = ("id", "telegram_id", "telegram_username", "name", "phone",
+                 "role", "is_active", "created_at", "updated_at")
+
+    def __init__(self, id: str, telegram_id: Optional[str], telegram_username: Optional[str], name: str,
+                 phone: str, role, is_active: bool, created_at: Optional[datetime], updated_at: Optional[datetime]):
+        for field, value in zip(self.__slots__, (id, telegram_id, telegram_username, name, phone,
+                                                 role, is_active, created_at, updated_at)):
+            object.__setattr__(self, field, value)
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(user.id, user.telegram_id, user.telegram_username, user.name, user.phone,
+                   user.role, user.is_active, user.created_at, user.updated_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("UserSnapshot is immutable")
+
+    def __repr__(self) -> str:
+        return f"UserSnapshot(id={self.id!r}, telegram_id={self.telegram_id!r}, role={self.role!r})"
+
+class UserCache:
+    """LRU cache keyed by telegram_id with a per-entry TTL
+
+    Misses are cached too (value None), so repeated /start from an
+    unregistered user does not hit the database every time; registering
+    the user invalidates that entry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Optional[UserSnapshot]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, telegram_id) -> Tuple[bool, Optional[UserSnapshot]]:
+        """(found, snapshot) - found is False on a miss or an expired entry"""
+        key = str(telegram_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, snapshot = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, snapshot
+
+    def put(self, telegram_id, snapshot: Optional[UserSnapshot]) -> None:
+        """Store a snapshot (or a known miss) and evict the least recently used overflow"""
+        if self.max_size <= 0:
+            return
+        key = str(telegram_id)
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, telegram_id) -> None:
+        """Forget one user"""
+        with self._lock:
+            if self._entries.pop(str(telegram_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def invalidate_on_change(self, user_model) -> None:
+        """Drop cached entries whenever a User row is updated or deleted through the ORM"""
+        from sqlalchemy import event
+
+        def _invalidate(mapper, connection, target):
+            if target.telegram_id:
+                self.invalidate(target.telegram_id)
+
+        event.listen(user_model, "after_update", _invalidate)
+        event.listen(user_model, "after_delete", _invalidate)